@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class SeenitConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'seenit'
+
+    def ready(self):
+        # Connects the subscription signal receivers.
+        from . import subscriptions  # noqa: F401
+        from .vote_buffer import vote_buffer
+
+        if vote_buffer.enabled:
+            vote_buffer.flush_on_sigterm()
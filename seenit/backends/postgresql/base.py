@@ -0,0 +1,126 @@
+import os
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+# Open pools by (alias, database name, pool options), shared by every
+# thread.
+_pools = {}
+_pools_lock = threading.Lock()
+# Pools inherited by a forked process, kept so their connections, which
+# belong to the parent, are never closed from the child.
+_inherited = []
+
+
+def _forget_pools():
+    global _pools_lock
+    _inherited.extend(_pools.values())
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Pooled connections would keep the database from being dropped.
+        self.connection.close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Django's PostgreSQL backend, taking connections from a psycopg_pool
+    ConnectionPool when OPTIONS has a "pool" dict of ConnectionPool
+    arguments (min_size, max_size, timeout...).
+
+    A connection is taken from the pool when Django would open one and
+    given back when Django would close it, so CONN_MAX_AGE must be 0 and
+    connections are given back at the end of every request. With
+    CONN_HEALTH_CHECKS on, the pool checks connections before handing
+    them out. Without "pool" this is the stock backend.
+    """
+
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+
+    @property
+    def pool(self):
+        """The pool for this connection's database, opened on first use,
+        or None if the connection is not pooled.
+        """
+
+        options = self.settings_dict['OPTIONS'].get('pool')
+        if not options or self.alias == NO_DB_ALIAS:
+            return None
+        key = (self.alias, self.settings_dict['NAME'],
+               tuple(sorted(options.items())))
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = self._open_pool(options)
+            return _pools[key]
+
+    def _open_pool(self, options):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError as error:
+            raise ImproperlyConfigured(
+                "Database connection pooling requires psycopg_pool."
+            ) from error
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured(
+                "Pooled connections can't also be persistent: set "
+                "CONN_MAX_AGE to 0.")
+        check = (ConnectionPool.check_connection
+                 if self.settings_dict['CONN_HEALTH_CHECKS'] else None)
+        return ConnectionPool(kwargs=self.get_connection_params(),
+                              name=self.alias, check=check, open=True,
+                              **options)
+
+    def close_pools(self):
+        """Close every pool of this connection's alias."""
+
+        with _pools_lock:
+            keys = [key for key in _pools if key[0] == self.alias]
+            pools = [_pools.pop(key) for key in keys]
+        for pool in pools:
+            pool.close()
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        level = self.settings_dict['OPTIONS'].get('isolation_level')
+        try:
+            self.isolation_level = IsolationLevel(
+                IsolationLevel.READ_COMMITTED if level is None else level)
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {level} specified. Use "
+                f"one of the psycopg.IsolationLevel values.")
+        connection = pool.getconn()
+        # None leaves the server's default, as unpooled connections do.
+        connection.isolation_level = (None if level is None
+                                      else self.isolation_level)
+        self._pool = pool
+        return connection
+
+    def _close(self):
+        if self._pool is None:
+            return super()._close()
+        pool, self._pool = self._pool, None
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                pool.putconn(self.connection)
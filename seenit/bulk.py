@@ -0,0 +1,37 @@
+from django.db import connection
+
+
+def copy_rows(model, fields, rows, batch_size=1000):
+    """Insert rows, tuples of values for fields (attnames), into model's
+    table, bypassing save().
+
+    On Postgres with psycopg 3 the rows are streamed with COPY, several
+    times faster than bulk_create's INSERTs and without building model
+    instances; elsewhere they are bulk_created batch_size at a time.
+    rows mustn't be a lazy queryset: nothing else can run on the
+    connection during a COPY.
+    """
+
+    if not _can_copy():
+        model.objects.bulk_create(
+            [model(**dict(zip(fields, row))) for row in rows],
+            batch_size=batch_size)
+        return
+
+    columns = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(field).column)
+        for field in fields)
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        with cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def _can_copy():
+    if connection.vendor != 'postgresql':
+        return False
+    # Imported here: it needs a Postgres driver installed.
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    return is_psycopg3
@@ -0,0 +1,373 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import (CharField, Count, F, Max, Min, OuterRef, Q,
+                              Subquery, Value)
+from django.db.models.functions import Cast, Concat, LPad
+
+from .models import Comment
+
+# Width of one step of a materialized path: a zero padded comment id.
+PATH_STEP = 10
+# Deepest level a path fits in. The path backend rejects replies below it.
+MAX_LEVEL = Comment._meta.get_field('path').max_length // PATH_STEP - 1
+
+# First key of the advisory locks taken on mptt trees (see lock_tree).
+TREE_LOCK_NAMESPACE = 73631
+# Lock key standing for every tree, taken exclusively by whatever
+# renumbers trees (rebuilds). Real tree ids start at 1.
+ALL_TREES = 0
+# Lock key for handing out the next tree id to a new root.
+NEW_TREE = -1
+
+
+def lock_tree(tree_id=ALL_TREES, shared=False):
+    """Lock one mptt tree, or all of them, until the end of the current
+    transaction.
+
+    Writers to a single tree take a shared lock on ALL_TREES first, so the
+    tree's id can't change under them, then an exclusive lock on the tree.
+    New roots take NEW_TREE instead of a tree, so two can't get the same
+    id. Anything that renumbers trees takes ALL_TREES exclusively.
+    """
+
+    function = ('pg_advisory_xact_lock_shared' if shared
+                else 'pg_advisory_xact_lock')
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function}(%s, %s)',
+                       [TREE_LOCK_NAMESPACE, tree_id])
+
+
+def load_parent(comment):
+    """Fetch comment's parent and post together, and attach them.
+    Raise Comment.DoesNotExist if the parent isn't on comment's post.
+    """
+
+    parent = Comment.objects.select_related('post').get(
+        pk=comment.parent_id, post_id=comment.post_id)
+    comment.parent, comment.post = parent, parent.post
+    return parent
+
+
+class MPTTCommentTree:
+    """Store comment trees as nested sets with django-mptt (the default).
+
+    Reads are range scans on (tree_id, lft). Every insert or delete shifts
+    lft/rght of the comments after it in the same tree. Comments are
+    appended, to the last tree or the parent's last child: siblings are
+    sorted when a thread is read.
+    """
+
+    name = 'mptt'
+    order_by = ('tree_id', 'lft')
+
+    def insert(self, comment):
+        """Insert comment, holding the lock on its tree (see lock_tree).
+        A reply's parent is fetched again under the lock, so its bounds
+        are current.
+        """
+
+        with transaction.atomic():
+            lock_tree(shared=True)
+            if comment.parent_id is None:
+                lock_tree(NEW_TREE)
+            else:
+                lock_tree(load_parent(comment).tree_id)
+            comment.save()
+
+    def delete(self, comment):
+        with transaction.atomic():
+            lock_tree(shared=True)
+            lock_tree(Comment.objects.values_list('tree_id', flat=True).get(
+                pk=comment.pk))
+            comment.refresh_from_db(fields=['tree_id', 'lft', 'rght'])
+            comment.delete()
+
+    def roots(self, post):
+        return Comment.objects.filter(post=post, level=0).order_by(
+            *self.order_by)
+
+    def descendants(self, roots, max_level):
+        """Return the replies under roots down to max_level."""
+
+        return Comment.objects.filter(
+            tree_id__in=[root.tree_id for root in roots],
+            level__gt=0, level__lte=max_level)
+
+    def subtree(self, comment):
+        """Return the replies under comment."""
+
+        return Comment.objects.filter(tree_id=comment.tree_id,
+                                      lft__gt=comment.lft,
+                                      rght__lt=comment.rght)
+
+    def ancestors(self, comments):
+        """Return the comments and all their ancestors."""
+
+        return Comment.objects.filter(reduce(or_, (
+            Q(tree_id=comment.tree_id, lft__lte=comment.lft,
+              rght__gte=comment.rght)
+            for comment in comments)))
+
+    def has_replies(self, comments):
+        """Return the ids of the comments that have replies."""
+
+        return {comment.pk for comment in comments
+                if not comment.is_leaf_node()}
+
+    def position(self, comment):
+        """Return where comment is in depth-first order."""
+
+        return comment.lft
+
+    def parse_position(self, value):
+        return int(value)
+
+    def after(self, queryset, position):
+        """Filter queryset to comments after position in depth-first
+        order.
+        """
+
+        return queryset.filter(lft__gt=position)
+
+    def tree_key(self, comment):
+        """Return a value identifying comment's root; roots are in
+        depth-first order by it.
+        """
+
+        return comment.tree_id
+
+    def check(self, comments=None):
+        """Return the ids of the posts whose comment trees are broken:
+        bounds that don't nest inside the parent's, or trees whose bounds
+        aren't exactly 1 to twice their size.
+        """
+
+        if comments is None:
+            comments = Comment.objects.all()
+        misplaced = comments.filter(
+            Q(lft__gte=F('rght'))
+            | Q(parent=None) & ~Q(level=0, lft=1)
+            | Q(parent__isnull=False) & ~Q(
+                tree_id=F('parent__tree_id'), level=F('parent__level') + 1,
+                lft__gt=F('parent__lft'), rght__lt=F('parent__rght')))
+        trees = (comments.order_by().values('tree_id')
+                 .annotate(size=Count('pk'),
+                           lfts=Count('lft', distinct=True),
+                           rghts=Count('rght', distinct=True),
+                           roots=Count('pk', filter=Q(parent=None)),
+                           posts=Count('post', distinct=True),
+                           top=Max('rght'))
+                 .exclude(lfts=F('size'), rghts=F('size'), roots=1, posts=1,
+                          top=F('size') * 2)
+                 .values('tree_id'))
+        return set(comments.filter(Q(pk__in=misplaced.values('pk'))
+                                   | Q(tree_id__in=trees))
+                   .order_by().values_list('post_id', flat=True).distinct())
+
+    def repair(self, post_ids):
+        """Renumber the comment trees of post_ids from the parent links.
+        Roots keep their tree ids unless another root shares them.
+        """
+
+        with transaction.atomic():
+            lock_tree(shared=True)
+            lock_tree(NEW_TREE)
+            for tree_id in sorted(set(
+                    Comment.objects.filter(post_id__in=post_ids)
+                    .values_list('tree_id', flat=True))):
+                lock_tree(tree_id)
+            for post_id in post_ids:
+                self._rebuild_post(post_id)
+
+    def _rebuild_post(self, post_id):
+        # Siblings in insertion order, as TreeManager.rebuild does.
+        comments = list(Comment.objects.filter(post_id=post_id)
+                        .order_by('pk'))
+        replies = defaultdict(list)
+        for comment in comments:
+            replies[comment.parent_id].append(comment)
+        roots = replies[None]
+
+        shared = set(Comment.objects.filter(
+            parent=None, tree_id__in=[root.tree_id for root in roots])
+            .order_by().values('tree_id').annotate(count=Count('pk'))
+            .filter(count__gt=1).values_list('tree_id', flat=True))
+        next_tree_id = Comment.objects.aggregate(
+            high=Max('tree_id'))['high'] + 1
+        for root in roots:
+            tree_id = root.tree_id
+            if tree_id in shared:
+                tree_id, next_tree_id = next_tree_id, next_tree_id + 1
+            self._number_tree(root, replies, tree_id)
+        Comment.objects.bulk_update(comments,
+                                    ['tree_id', 'lft', 'rght', 'level'],
+                                    batch_size=1000)
+
+    def _number_tree(self, root, replies, tree_id):
+        """Set the nested set fields of root and the replies under it,
+        depth first without recursion.
+        """
+
+        counter = 1
+        stack = [(root, 0, False)]
+        while stack:
+            comment, level, done = stack.pop()
+            if done:
+                comment.rght = counter
+            else:
+                comment.tree_id, comment.level = tree_id, level
+                comment.lft = counter
+                stack.append((comment, level, True))
+                stack += [(reply, level + 1, False)
+                          for reply in reversed(replies[comment.pk])]
+            counter += 1
+
+
+class PathCommentTree:
+    """Store comment trees as materialized paths in Comment.path.
+
+    A comment's path is its parent's path followed by its own zero padded
+    id, so an insert writes only the new row, and a subtree is a prefix
+    scan on the path index. Comments are in depth-first order by path, with
+    siblings (and root comments) oldest first. The mptt fields are not
+    maintained: run "rebuild_comment_tree mptt" before switching back.
+    """
+
+    name = 'path'
+    order_by = ('path',)
+
+    def insert(self, comment):
+        """Insert comment. No other row changes, so no locks are needed.
+        Raise ValidationError if comment is a reply to a comment at
+        MAX_LEVEL, as its path wouldn't fit.
+        """
+
+        with transaction.atomic():
+            parent = load_parent(comment) if comment.parent_id else None
+            if parent and parent.level >= MAX_LEVEL:
+                raise ValidationError(
+                    "This thread is too deep to reply to.",
+                    code='too_deep')
+            comment.level = parent.level + 1 if parent else 0
+            comment.tree_id = 0
+            # mptt leaves the tree fields alone when lft and rght are already
+            # set, so the row is inserted without touching any other row.
+            comment.lft, comment.rght = 1, 2
+            comment.save()
+            comment.path = (parent.path if parent else '') + encode_step(
+                comment.pk)
+            Comment.objects.filter(pk=comment.pk).update(path=comment.path)
+
+    def delete(self, comment):
+        Comment.objects.filter(path__startswith=comment.path).delete()
+
+    def roots(self, post):
+        return Comment.objects.filter(post=post, level=0).order_by(
+            *self.order_by)
+
+    def descendants(self, roots, max_level):
+        if not roots:
+            return Comment.objects.none()
+        return Comment.objects.filter(
+            reduce(or_, (Q(path__startswith=root.path) for root in roots)),
+            level__gt=0, level__lte=max_level)
+
+    def subtree(self, comment):
+        return Comment.objects.filter(path__startswith=comment.path,
+                                      level__gt=comment.level)
+
+    def ancestors(self, comments):
+        return Comment.objects.filter(pk__in={
+            int(comment.path[start:start + PATH_STEP])
+            for comment in comments
+            for start in range(0, len(comment.path), PATH_STEP)
+        })
+
+    def check(self, comments=None):
+        """Return the ids of the posts with comments whose path doesn't
+        follow from their parent's.
+        """
+
+        if comments is None:
+            comments = Comment.objects.all()
+        step = LPad(Cast('pk', CharField()), PATH_STEP, Value('0'))
+        broken = comments.filter(
+            Q(parent=None) & ~Q(path=step)
+            | Q(parent__isnull=False) & ~Q(
+                path=Concat('parent__path', step, output_field=CharField())))
+        return set(broken.order_by().values_list('post_id', flat=True)
+                   .distinct())
+
+    def repair(self, post_ids):
+        with transaction.atomic():
+            rebuild_paths(Comment.objects.filter(post_id__in=post_ids))
+
+    def has_replies(self, comments):
+        if not comments:
+            return set()
+        return set(Comment.objects
+                   .filter(parent_id__in=[comment.pk for comment in comments])
+                   .order_by()
+                   .values_list('parent_id', flat=True)
+                   .distinct())
+
+    def position(self, comment):
+        return comment.path
+
+    def parse_position(self, value):
+        if not value.isdigit() or len(value) % PATH_STEP:
+            raise ValueError(f"Invalid comment path: {value!r}")
+        return value
+
+    def after(self, queryset, position):
+        return queryset.filter(path__gt=position)
+
+    def tree_key(self, comment):
+        return comment.path[:PATH_STEP]
+
+
+BACKENDS = {backend.name: backend
+            for backend in (MPTTCommentTree, PathCommentTree)}
+
+
+def get_comment_tree(name=None):
+    """Return the comment tree backend named name, or the one selected by
+    SEENIT_COMMENT_TREE.
+    """
+
+    if name is None:
+        name = getattr(settings, 'SEENIT_COMMENT_TREE', 'mptt')
+    return BACKENDS[name]()
+
+
+def encode_step(pk):
+    return str(pk).zfill(PATH_STEP)
+
+
+def rebuild_paths(comments=None, chunk_size=100000):
+    """Recompute the path of comments (every comment by default) from
+    their parents, one level at a time in chunks of chunk_size ids.
+    Parents must already have their paths.
+    """
+
+    if comments is None:
+        comments = Comment.objects.all()
+    bounds = comments.aggregate(low=Min('pk'), high=Max('pk'),
+                                depth=Max('level'))
+    if bounds['low'] is None:
+        return
+
+    step = LPad(Cast('pk', CharField()), PATH_STEP, Value('0'))
+    parent_path = Subquery(
+        Comment.objects.filter(pk=OuterRef('parent_id')).values('path')[:1])
+    for level in range(bounds['depth'] + 1):
+        path = step if level == 0 else Concat(parent_path, step,
+                                              output_field=CharField())
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            comments.filter(level=level, pk__gte=start,
+                            pk__lt=start + chunk_size).update(path=path)
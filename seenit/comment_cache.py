@@ -0,0 +1,146 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+# Stands in for the CSRF token in cached fragments, which every viewer
+# shares; replaced with the viewer's token after the cache lookup. Safe, so
+# it is rendered as is, which escaped user content can never be.
+CSRF_PLACEHOLDER = mark_safe('<!--csrf-->')
+
+
+def get_cache():
+    """Return the cache used for comment fragments (SEENIT_COMMENT_CACHE)."""
+
+    return caches[getattr(settings, 'SEENIT_COMMENT_CACHE', 'default')]
+
+
+def get_version_cache():
+    """Return the cache holding the versions fragments are keyed on
+    (SEENIT_COMMENT_VERSION_CACHE), kept apart so evicting fragments never
+    evicts a version.
+    """
+
+    return caches[getattr(settings, 'SEENIT_COMMENT_VERSION_CACHE',
+                          'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'SEENIT_COMMENT_CACHE_TIMEOUT', 600)
+
+
+def get_version_timeout():
+    """Versions outlive any fragment cached under them, and then expire: a
+    missing version only costs a render.
+    """
+
+    return get_timeout() * 2
+
+
+def _version_key(kind, pk):
+    return f'seenit:{kind}:{pk}:version'
+
+
+def _new_version():
+    # Versions are random rather than counters, so a version evicted from
+    # the cache can't come back with a value old fragments were cached at.
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(post_id, comment_ids):
+    """Return (post version, {comment id: version}), creating any versions
+    missing from the cache.
+    """
+
+    cache = get_version_cache()
+    post_key = _version_key('post', post_id)
+    keys = {pk: _version_key('comment', pk) for pk in comment_ids}
+
+    versions = cache.get_many([post_key, *keys.values()])
+    missing = {key: _new_version() for key in [post_key, *keys.values()]
+               if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=get_version_timeout())
+        versions.update(missing)
+    return (versions[post_key],
+            {pk: versions[key] for pk, key in keys.items()})
+
+
+def thread_shape(comments):
+    """Return a token for which comments a rendered thread holds and where
+    it was cut off, which follow from the page, the depth and the reply
+    limit.
+    """
+
+    shape = ','.join(
+        f'{comment.pk}:{int(getattr(comment, "continue_thread", False))}:'
+        f'{getattr(comment, "more_after", None)}' for comment in comments)
+    return hashlib.md5(shape.encode(), usedforsecurity=False).hexdigest()
+
+
+def thread_key(post_id, version, sort, shape):
+    return f'seenit:thread:{post_id}:{version}:{sort}:{shape}'
+
+
+def comment_key(comment_id, version, sort, max_level):
+    """Key of a comment's rendered subtree, cut off below max_level."""
+
+    return f'seenit:comment:{comment_id}:{version}:{sort}:{max_level}'
+
+
+def _bump_on_commit(keys):
+    """Give keys new versions once the current transaction commits.
+    Bumping earlier would let a request that still sees the old data cache
+    it under the new version.
+    """
+
+    def bump():
+        get_version_cache().set_many(dict.fromkeys(keys, _new_version()),
+                                     timeout=get_version_timeout())
+
+    transaction.on_commit(bump)
+
+
+def invalidate_thread(post_id):
+    """Invalidate the rendered thread of post_id, but none of its comment
+    fragments. Used when a root comment is added.
+    """
+
+    _bump_on_commit([_version_key('post', post_id)])
+
+
+def invalidate_comment(comment):
+    """Invalidate the fragments of comment, its ancestors and its thread.
+    Fragments of every other comment in the thread stay valid.
+    """
+
+    # Imported here: seenit.comment_backends imports the models, which
+    # import this module.
+    from .comment_backends import get_comment_tree
+
+    ancestors = get_comment_tree().ancestors([comment]).values_list(
+        'pk', flat=True)
+    _bump_on_commit([_version_key('post', comment.post_id),
+                     *(_version_key('comment', pk) for pk in ancestors)])
+
+
+def invalidate_comments(model, ids):
+    """Invalidate the fragments of the comments in ids, their ancestors
+    and their threads, with two queries.
+    """
+
+    from .comment_backends import get_comment_tree
+
+    comments = list(model._default_manager.filter(pk__in=ids).only(
+        'tree_id', 'lft', 'rght', 'path'))
+    if not comments:
+        return
+    rows = get_comment_tree().ancestors(comments).values_list('pk', 'post_id')
+    keys = set()
+    for pk, post_id in rows:
+        keys.add(_version_key('comment', pk))
+        keys.add(_version_key('post', post_id))
+    _bump_on_commit(keys)
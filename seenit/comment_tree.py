@@ -0,0 +1,185 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.paginator import Paginator
+
+from mptt.utils import get_cached_trees
+
+from .comment_backends import get_comment_tree
+from .models import Comment
+from .votes import annotate_controversy
+
+# Sibling orders for comment threads, picked when the thread is read.
+SORTS = {
+    'top': ('-rating', '-pub_date', '-pk'),
+    'new': ('-pub_date', '-pk'),
+    'controversial': ('-controversy', '-pub_date', '-pk'),
+}
+DEFAULT_SORT = 'top'
+
+
+def get_sort(value):
+    """Return value if it names a sort in SORTS, else DEFAULT_SORT."""
+
+    return value if value in SORTS else DEFAULT_SORT
+
+
+def load_comment_tree(post, sort=None):
+    """Fetch every comment on post, with its author, in one query.
+
+    Parents and children are linked in memory, so walking the tree or
+    rendering it with recursetree runs no further queries.
+    Return the comments in depth-first order, with siblings in the order
+    given by sort (see SORTS) or else as stored.
+    """
+
+    tree = get_comment_tree()
+    comments = list(annotate_sort(Comment.objects.filter(post=post), sort)
+                    .select_related('user').order_by(*tree.order_by))
+    for comment in comments:
+        comment.post = post
+    return _sort_siblings(get_cached_trees(comments), sort)
+
+
+def load_comment_page(post, page_number=None, sort=None):
+    """Fetch one page of root comments on post and the replies under them.
+
+    Root comments are paged SEENIT_ROOT_COMMENTS_PER_PAGE at a time and
+    replies are cut off below SEENIT_COMMENT_DEPTH levels and after
+    SEENIT_COMMENT_REPLY_LIMIT replies, so the cost of a page does not grow
+    with the size of the thread (see _link_comments). Root comments are
+    paged, and siblings ordered, by sort (see SORTS) or else as stored.
+    Return (page, comments), with comments in depth-first order.
+    """
+
+    per_page = getattr(settings, 'SEENIT_ROOT_COMMENTS_PER_PAGE', 20)
+    depth = getattr(settings, 'SEENIT_COMMENT_DEPTH', 6)
+    tree = get_comment_tree()
+
+    roots = annotate_sort(tree.roots(post), sort).select_related('user')
+    if sort:
+        roots = roots.order_by(*SORTS[sort])
+    page = Paginator(roots, per_page).get_page(page_number)
+    roots = list(page.object_list)
+
+    replies = annotate_sort(tree.descendants(roots, depth - 1), sort)
+    return page, _link_comments(tree, post, roots,
+                                replies.select_related('user'), depth - 1,
+                                sort)
+
+
+def load_comment_subtree(post, comment, after=None, sort=None):
+    """Fetch comment and the replies under it.
+
+    Replies are cut off SEENIT_COMMENT_DEPTH levels below comment and after
+    SEENIT_COMMENT_REPLY_LIMIT replies. If after is given, only replies
+    after that position (see CommentTree.position) are fetched, along with
+    the replies on the path from comment down to the first of them, which
+    get replies_skipped = True.
+    comment must carry the annotations sort orders by (see annotate_sort).
+    Return the comments in depth-first order, with siblings in the order
+    given by sort (see SORTS) or else as stored.
+    """
+
+    depth = getattr(settings, 'SEENIT_COMMENT_DEPTH', 6)
+    max_level = comment.level + depth - 1
+    tree = get_comment_tree()
+
+    replies = (annotate_sort(tree.subtree(comment), sort)
+               .filter(level__lte=max_level)
+               .select_related('user'))
+
+    nodes = [comment]
+    if after is not None and after > tree.position(comment):
+        replies = tree.after(replies, after)
+        first = replies.order_by(*tree.order_by).first()
+        if first is not None:
+            nodes += (annotate_sort(tree.ancestors([first]), sort)
+                      .filter(level__gt=comment.level, level__lt=first.level)
+                      .select_related('user'))
+        for node in nodes:
+            node.replies_skipped = True
+    return _link_comments(tree, post, nodes, replies, max_level, sort)
+
+
+def annotate_sort(comments, sort):
+    """Add the annotations sort orders by to a queryset of comments."""
+
+    if sort == 'controversial':
+        return annotate_controversy(comments)
+    return comments
+
+
+def _link_comments(tree, post, nodes, replies, max_level, sort=None):
+    """Load up to SEENIT_COMMENT_REPLY_LIMIT replies and link them with
+    nodes into trees in memory.
+
+    Comments at max_level that have replies get continue_thread = True.
+    If the limit cut the replies short, the comments left with unloaded
+    replies get more_after set to the position to continue from; more_after
+    is None everywhere else.
+    The limit is applied in stored order, before siblings are sorted, so
+    more_after stays a single position to continue from; with a sort, a
+    reply left for "load more" can outrank the ones shown.
+    Return the comments in depth-first order, siblings sorted by sort.
+    """
+
+    limit = getattr(settings, 'SEENIT_COMMENT_REPLY_LIMIT', 500)
+
+    replies = list(replies.order_by(*tree.order_by)[:limit + 1])
+    truncated = len(replies) > limit
+    del replies[limit:]
+
+    comments = sorted([*nodes, *replies], key=lambda comment: tuple(
+        getattr(comment, field) for field in tree.order_by))
+    with_replies = tree.has_replies(
+        [comment for comment in comments if comment.level == max_level])
+    for comment in comments:
+        comment.post = post
+        comment.continue_thread = comment.pk in with_replies
+        comment.more_after = None
+    top = get_cached_trees(comments)
+
+    if truncated:
+        last = replies[-1]
+        # Replies are loaded in depth-first order, so the comments with
+        # replies left to load are the ancestors of the last loaded reply,
+        # and the trees after it.
+        by_pk = {comment.pk: comment for comment in comments}
+        comment = last
+        while comment is not None:
+            comment.more_after = tree.position(last)
+            comment = by_pk.get(comment.parent_id)
+        later = [comment for comment in nodes
+                 if tree.tree_key(comment) > tree.tree_key(last)]
+        with_replies = tree.has_replies(later)
+        for comment in later:
+            if comment.pk in with_replies:
+                comment.more_after = tree.position(comment)
+    return _sort_siblings(top, sort)
+
+
+def _sort_siblings(top, sort):
+    """Order the siblings of the linked trees under top by sort, in
+    memory, so the order follows the current ratings without rewriting
+    the stored tree.
+    Return the comments in depth-first order.
+    """
+
+    def ordered(comments):
+        comments = list(comments)
+        # Stable sorts, last key first, so each key can have its own
+        # direction.
+        for field in reversed(SORTS[sort] if sort else ()):
+            comments.sort(key=attrgetter(field.lstrip('-')),
+                          reverse=field.startswith('-'))
+        return comments
+
+    comments = []
+    stack = ordered(top)[::-1]
+    while stack:
+        comment = stack.pop()
+        comments.append(comment)
+        stack += ordered(comment.get_children())[::-1]
+    get_cached_trees(comments)
+    return comments
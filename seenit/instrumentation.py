@@ -0,0 +1,201 @@
+import functools
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+# The RequestStats of the request being handled, if it is instrumented.
+_current = ContextVar('seenit_request_stats', default=None)
+
+# Templates given their own Server-Timing entries, slowest first.
+HEADER_TEMPLATES = 10
+
+
+class RequestStats:
+    """The queries run and the time, in seconds, spent on one request.
+
+    Template time excludes queries run while rendering (lazy querysets),
+    which count as db time, so db, template and view time add up to the
+    total.
+
+    If breakdown is true, templates maps each template name to its render
+    count and cumulative render time, includes and templates rendered by
+    filters (like crispy) counted on their own as well as in the template
+    that rendered them.
+    """
+
+    def __init__(self, breakdown=False):
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.templates = {} if breakdown else None
+        self._db_in_templates = 0.0
+        self._rendering = False
+
+    def execute(self, execute, sql, params, many, context):
+        """Time one query; an execute_wrapper."""
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db += elapsed
+            if self._rendering:
+                self._db_in_templates += elapsed
+
+    def render(self, render, template, context):
+        """Time template rendering, counting only the outermost render of
+        nested ones (includes, templates rendered by filters) in the
+        template time.
+        """
+
+        if self._rendering and self.templates is None:
+            return render(template, context)
+        outermost = not self._rendering
+        self._rendering = True
+        start = time.perf_counter()
+        try:
+            return render(template, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            if outermost:
+                self.template += elapsed
+                self._rendering = False
+            if self.templates is not None:
+                calls, total = self.templates.get(template.name, (0, 0.0))
+                self.templates[template.name] = (calls + 1, total + elapsed)
+
+    def template_timings(self):
+        """Return [(template name, renders, milliseconds)], slowest
+        first.
+        """
+
+        return sorted(((name, calls, total * 1000) for name, (calls, total)
+                       in (self.templates or {}).items()),
+                      key=lambda timing: timing[2], reverse=True)
+
+    def timings(self, total):
+        """Return {name: milliseconds} for db, template and view time, and
+        the total, given the total in seconds.
+        """
+
+        template = self.template - self._db_in_templates
+        return {'db': self.db * 1000, 'template': template * 1000,
+                'view': (total - self.db - template) * 1000,
+                'total': total * 1000}
+
+
+def _install():
+    """Wrap Template.render to time the templates of instrumented
+    requests.
+    """
+
+    render = Template.render
+    if getattr(render, 'instrumented', False):
+        return
+
+    @functools.wraps(render)
+    def timed_render(template, context):
+        stats = _current.get()
+        if stats is None:
+            return render(template, context)
+        return stats.render(render, template, context)
+
+    timed_render.instrumented = True
+    Template.render = timed_render
+
+
+def over_budget(stats, total):
+    """Return the budgets, of SEENIT_QUERY_BUDGET queries and
+    SEENIT_LATENCY_BUDGET_MS milliseconds, that a request passed (0 means
+    no budget).
+    """
+
+    passed = []
+    query_budget = getattr(settings, 'SEENIT_QUERY_BUDGET', 0)
+    if query_budget and stats.queries > query_budget:
+        passed.append('queries')
+    latency_budget = getattr(settings, 'SEENIT_LATENCY_BUDGET_MS', 0)
+    if latency_budget and total * 1000 > latency_budget:
+        passed.append('latency')
+    return passed
+
+
+class RequestTimingMiddleware:
+    """Record the queries, db time, template time and view time of each
+    request. They are sent in a Server-Timing header and logged to
+    seenit.instrumentation, as a warning for requests over budget.
+
+    With SEENIT_TEMPLATE_BREAKDOWN on, the render count and time of each
+    template are logged too, and the slowest HEADER_TEMPLATES templates
+    get their own Server-Timing entries (tpl1, tpl2...).
+
+    Only loaded when SEENIT_INSTRUMENTATION is on, so it costs nothing
+    otherwise.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SEENIT_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        _install()
+        self.get_response = get_response
+        self.breakdown = getattr(settings, 'SEENIT_TEMPLATE_BREAKDOWN', False)
+
+    def __call__(self, request):
+        stats = RequestStats(self.breakdown)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(stats.execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        timings = stats.timings(total)
+        templates = stats.template_timings()
+        header = ', '.join(
+            [f'{name};dur={duration:.1f}' + (
+                f';desc="{stats.queries} queries"' if name == 'db' else '')
+             for name, duration in timings.items()]
+            + [f'tpl{position};dur={duration:.1f};desc="{name} x{calls}"'
+               for position, (name, calls, duration)
+               in enumerate(templates[:HEADER_TEMPLATES], 1)])
+        if response.has_header('Server-Timing'):
+            header = f"{response['Server-Timing']}, {header}"
+        response['Server-Timing'] = header
+
+        passed = over_budget(stats, total)
+        route = (request.resolver_match.view_name if request.resolver_match
+                 else None)
+        record = {'route': route, 'method': request.method,
+                  'path': request.path, 'status': response.status_code,
+                  'queries': stats.queries, 'over_budget': passed,
+                  **{f'{name}_ms': round(duration, 1)
+                     for name, duration in timings.items()}}
+        if stats.templates is not None:
+            record['templates'] = {
+                name: {'renders': calls, 'ms': round(duration, 1)}
+                for name, calls, duration in templates}
+        logger.log(
+            logging.WARNING if passed else logging.INFO,
+            ' '.join(f'{key}={value}' for key, value in record.items()
+                     if key not in ('over_budget', 'templates'))
+            + (f" over_budget={','.join(passed)}" if passed else ''),
+            extra={'timing': record})
+        for name, calls, duration in templates:
+            logger.debug('template=%s renders=%d ms=%.1f', name, calls,
+                         duration, extra={'timing': record})
+        return response
@@ -0,0 +1,107 @@
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import engines
+from django.template.loader import get_template
+from django.test import RequestFactory, override_settings
+
+from seenit import seeding
+from seenit.comment_tree import load_comment_tree
+from seenit.forms import CommentForm
+from seenit.models import Post
+from seenit.votes import annotate_vote_states
+
+# Fragments are not cached, so every sample renders every comment.
+UNCACHED = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+CURRENT = 'comment_template.html'
+# comment_template.html as it was before the reply form was rendered once
+# per thread. Benchmark templates sit outside the template dirs, so no view
+# can load them.
+PER_NODE_FORM = (Path(__file__).resolve().parents[2] / 'benchmarks'
+                 / 'templates' / 'comment_template.html')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Times rendering a whole comment thread with '
+            'comment_template.html, without the fragment cache, and with '
+            '--compare the old template with a reply form in every comment. '
+            'All changes are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=5000,
+                            help='Comments in the thread')
+        parser.add_argument('--samples', type=int, default=5,
+                            help='Times the thread is rendered')
+        parser.add_argument('--thread_shape', choices=list(seeding.SHAPES),
+                            default='random',
+                            help='How replies are spread over the thread')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--compare', action='store_true',
+                            help='Also time the old template that rendered '
+                            'a reply form in every comment (slow, and large '
+                            'threads can run out of memory)')
+
+    def handle(self, *args, **options):
+        templates = {'current': get_template(CURRENT)}
+        if options['compare']:
+            templates['per node form'] = engines['django'].from_string(
+                PER_NODE_FORM.read_text())
+        results = {}
+        try:
+            with transaction.atomic():
+                seeding.seed(users=10, channels=1, posts=1,
+                             comments=options['comments'],
+                             seed=options['seed'],
+                             shape=options['thread_shape'])
+                post = Post.objects.latest('pk')
+                for name, template in templates.items():
+                    results[name] = self.measure(post, template,
+                                                 options['samples'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        current = statistics.median(results['current'][0])
+        for name, (timings, size) in results.items():
+            median = statistics.median(timings)
+            self.stdout.write(
+                f"{name}: {options['comments']} comments: "
+                f"{median:.1f} ms median, "
+                f"{median * 1000 / options['comments']:.1f} us per comment, "
+                f"{size / 1024:.0f} kB of HTML"
+                + (f", {median / current:.1f}x current"
+                   if name != 'current' else ''))
+
+    def measure(self, post, template, samples):
+        """Return ([milliseconds per render of template], length of the
+        HTML).
+        """
+
+        request = RequestFactory().get('/')
+        request.user = post.user
+        comments = annotate_vote_states(load_comment_tree(post), post.user)
+        caches = {**settings.CACHES, 'benchmark': UNCACHED}
+        timings = []
+        with override_settings(CACHES=caches,
+                               SEENIT_COMMENT_CACHE='benchmark'):
+            for _ in range(samples):
+                # New forms each sample, as each request has: crispy adds
+                # to a form's widget classes every time it renders it.
+                context = {
+                    'post': post, 'sort': 'top', 'comments': comments,
+                    'reply_form': CommentForm(auto_id=False),
+                    'form': CommentForm(),
+                }
+                start = time.perf_counter()
+                html = template.render(context, request)
+                timings.append((time.perf_counter() - start) * 1000)
+        return timings, len(html)
@@ -0,0 +1,142 @@
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from seenit.comment_backends import BACKENDS, get_comment_tree, rebuild_paths
+from seenit.models import Channel, Comment, Post, User
+from seenit.seeding import nested_sets
+
+OPERATIONS = ('insert_root', 'insert_reply', 'subtree', 'delete')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Times inserts, subtree reads and deletes for each comment tree '
+            'backend on synthetic threads. All changes are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10000, 100000, 1000000],
+                            help='Total comments to benchmark against')
+        parser.add_argument('--thread_size', type=int, default=1000,
+                            help='Comments per thread')
+        parser.add_argument('--samples', type=int, default=20,
+                            help='Times each operation is run')
+        parser.add_argument('--backend', choices=list(BACKENDS),
+                            help='Only benchmark one backend')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = [options['backend']] if options['backend'] else BACKENDS
+        self.stdout.write(f"{'comments':>9} {'backend':<8}" + ''.join(
+            f'{operation:>14}' for operation in OPERATIONS) + '  (median ms)')
+
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    data = self.populate(size, options['thread_size'],
+                                         random.Random(options['seed']))
+                    for name in names:
+                        # Every backend starts from the same data.
+                        with transaction.atomic():
+                            timings = self.measure(
+                                get_comment_tree(name), *data,
+                                options['samples'],
+                                random.Random(options['seed']))
+                            transaction.set_rollback(True)
+                        self.stdout.write(f'{size:>9} {name:<8}' + ''.join(
+                            f'{statistics.median(timings[operation]):>14.2f}'
+                            for operation in OPERATIONS))
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def populate(self, size, thread_size, rng):
+        """Create size comments on one post, in threads of thread_size
+        comments where each reply goes under a random earlier comment.
+        Both backends' fields are filled in, without going through either.
+        Return (post, user, comment ids, root ids).
+        """
+
+        user = User.objects.create(username=f'benchmark-{size}',
+                                   email='benchmark@test.com')
+        channel = Channel.objects.create(name=f'benchmark-{size}')
+        post = Post.objects.create(title='benchmark', text='benchmark',
+                                   user=user, channel=channel)
+        tree_id = Comment.objects.aggregate(high=Max('tree_id'))['high'] or 0
+
+        batch = []
+        for start in range(0, size, thread_size):
+            count = min(thread_size, size - start)
+            parents = [None] + [rng.randrange(index)
+                                for index in range(1, count)]
+            _, lft, rght, level = nested_sets(parents)
+            tree_id += 1
+            thread = [Comment(text='benchmark', post=post, user=user,
+                              tree_id=tree_id, lft=lft[index],
+                              rght=rght[index], level=level[index])
+                      for index in range(count)]
+            batch += [(comment, thread[parent] if parent is not None
+                       else None)
+                      for comment, parent in zip(thread, parents)]
+            if len(batch) >= 100000:
+                self.create(batch)
+                batch = []
+        self.create(batch)
+
+        rebuild_paths(Comment.objects.filter(post=post))
+        comments = Comment.objects.filter(post=post)
+        return (post, user, list(comments.values_list('pk', flat=True)),
+                list(comments.filter(level=0).values_list('pk', flat=True)))
+
+    def create(self, batch):
+        """bulk_create (comment, parent) pairs a level at a time, so every
+        parent has its id before its replies are inserted.
+        """
+
+        levels = defaultdict(list)
+        for comment, parent in batch:
+            levels[comment.level].append((comment, parent))
+        for level in sorted(levels):
+            for comment, parent in levels[level]:
+                comment.parent_id = parent.pk if parent else None
+            Comment.objects.bulk_create(
+                [comment for comment, _ in levels[level]], batch_size=5000)
+
+    def measure(self, tree, post, user, comment_ids, root_ids, samples, rng):
+        """Return {operation: [milliseconds per sample]} for tree."""
+
+        timings = defaultdict(list)
+        replies = []
+        for _ in range(samples):
+            root = Comment(text='benchmark', post=post, user=user)
+            timings['insert_root'].append(self.timed(tree.insert, root))
+
+            reply = Comment(text='benchmark', post=post, user=user,
+                            parent=Comment.objects.get(
+                                pk=rng.choice(comment_ids)))
+            timings['insert_reply'].append(self.timed(tree.insert, reply))
+            replies.append(reply.pk)
+
+            root = Comment.objects.get(pk=rng.choice(root_ids))
+            timings['subtree'].append(
+                self.timed(lambda: list(tree.subtree(root))))
+
+        for pk in replies:
+            # Reload: inserts since have moved mptt's lft/rght.
+            comment = Comment.objects.get(pk=pk)
+            timings['delete'].append(self.timed(tree.delete, comment))
+        return timings
+
+    def timed(self, function, *args):
+        start = time.perf_counter()
+        function(*args)
+        return (time.perf_counter() - start) * 1000
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from seenit import view_benchmarks
+from seenit.view_benchmarks import SIZES
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Seeds fixed datasets and times every route on them, failing '
+            'if query counts, wall time or peak memory regressed past the '
+            'stored baselines. All changes are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(SIZES),
+                            default=['small'],
+                            help='Datasets to benchmark on')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Timed requests per route')
+        parser.add_argument('--threshold', type=float,
+                            default=view_benchmarks.THRESHOLD,
+                            help='Share time and memory may grow by')
+        parser.add_argument('--update_baselines', action='store_true',
+                            help='Store the results as the new baselines')
+
+    def handle(self, *args, **options):
+        baselines = view_benchmarks.load_baselines()
+        failures = []
+        stale = []
+        self.stdout.write(f"{'dataset':<8} {'route':<24} {'queries':>8} "
+                          f"{'ms':>9} {'peak kB':>9}")
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    dataset = view_benchmarks.seed(size)
+                    results = view_benchmarks.measure(dataset,
+                                                      repeat=options['repeat'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+            for label, result in results.items():
+                self.stdout.write(
+                    f"{size:<8} {label:<24} {result['queries']:>8} "
+                    f"{result['ms']:>9.2f} {result['peak_kb']:>9.1f}")
+            if options['update_baselines']:
+                baselines[size] = results
+            else:
+                failures += [f'{size} {line}' for line in
+                             view_benchmarks.regressions(
+                                 results, baselines.get(size, {}),
+                                 options['threshold'])]
+                stale += [f'{size} {line}' for line in
+                          view_benchmarks.stale_baselines(
+                              results, baselines.get(size, {}))]
+
+        if options['update_baselines']:
+            view_benchmarks.save_baselines(baselines)
+            self.stdout.write('Baselines updated')
+            return
+        if stale:
+            self.stdout.write('Fewer queries than the baselines, update '
+                              'them with --update_baselines:\n'
+                              + '\n'.join(stale))
+        if failures:
+            raise CommandError('Regressions:\n' + '\n'.join(failures))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from seenit.comment_backends import BACKENDS, get_comment_tree
+
+
+class Command(BaseCommand):
+    help = ('Finds posts whose comment trees are broken, and optionally '
+            'rebuilds them from the parent links')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=list(BACKENDS),
+                            help='Backend to check (default: '
+                                 'SEENIT_COMMENT_TREE)')
+        parser.add_argument('--repair', action='store_true',
+                            help='Rebuild the broken trees')
+
+    def handle(self, *args, **options):
+        tree = get_comment_tree(options['backend'])
+        post_ids = sorted(tree.check())
+        for post_id in post_ids:
+            self.stdout.write(f'post {post_id}: broken comment tree')
+
+        if options['repair'] and post_ids:
+            tree.repair(post_ids)
+            self.stdout.write(f'{tree.name}: {len(post_ids)} repaired, '
+                              f'{len(tree.check())} still broken')
+        else:
+            self.stdout.write(f'{tree.name}: {len(post_ids)} broken')
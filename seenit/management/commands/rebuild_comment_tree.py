@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from seenit.comment_backends import (BACKENDS, MAX_LEVEL, lock_tree,
+                                     rebuild_paths)
+from seenit.models import Comment
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the fields a comment tree backend reads from the '
+            'parent links; run it before switching SEENIT_COMMENT_TREE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('backend', choices=list(BACKENDS))
+        parser.add_argument('--chunk_size', type=int, default=100000,
+                            help='Number of ids handled per query '
+                                 '(path only)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['backend'] == 'mptt':
+                # Renumbers every tree.
+                lock_tree()
+                Comment.objects.rebuild()
+            else:
+                self.check_depth()
+                rebuild_paths(chunk_size=options['chunk_size'])
+        self.stdout.write(f"{options['backend']}: "
+                          f"{Comment.objects.count()} comments rebuilt")
+
+    def check_depth(self):
+        """Paths hold MAX_LEVEL + 1 steps; threads deeper than that (left
+        by the mptt backend, which has no limit) can't switch to them.
+        """
+
+        posts = sorted(set(Comment.objects.filter(level__gt=MAX_LEVEL)
+                           .values_list('post_id', flat=True)))
+        if posts:
+            raise CommandError(
+                f"Posts {', '.join(map(str, posts))} have comments deeper "
+                f"than {MAX_LEVEL} levels, which paths can't store")
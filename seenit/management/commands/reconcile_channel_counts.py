@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Min, Q
+
+from seenit.models import Channel
+from seenit.models import Comment
+from seenit.models import Post
+from seenit.votes import row_count
+
+
+def actual_counts():
+    """Return {counter field: expression counting its rows}."""
+
+    return {
+        'post_count': row_count(Post.objects, 'channel'),
+        'subscriber_count': row_count(
+            Channel.subscribed_users.through.objects, 'channel'),
+        'comment_count': row_count(Comment.objects, 'post__channel'),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Recomputes channel post, subscriber and comment counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk_size', type=int, default=10000,
+                            help='Number of ids handled per query')
+        parser.add_argument('--dry_run', action='store_true',
+                            help='Report drifted rows without fixing them')
+
+    def handle(self, *args, **options):
+        bounds = Channel.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        drifted = 0
+        if bounds['low'] is not None:
+            chunk_size = options['chunk_size']
+            for start in range(bounds['low'], bounds['high'] + 1,
+                               chunk_size):
+                drifted += self.reconcile(start, start + chunk_size,
+                                          options['dry_run'])
+        verb = 'drifted' if options['dry_run'] else 'fixed'
+        self.stdout.write(f'channel: {drifted} {verb}')
+
+    def reconcile(self, start, end, dry_run):
+        """Reconcile the channels with ids in [start, end) with one query.
+        Return the number of drifted channels.
+        """
+
+        counts = actual_counts()
+        chunk = (Channel.objects
+                 .filter(pk__gte=start, pk__lt=end)
+                 .alias(**{f'actual_{field}': count
+                           for field, count in counts.items()})
+                 .filter(Q(*[~Q(**{field: F(f'actual_{field}')})
+                             for field in counts], _connector=Q.OR)))
+        if not dry_run:
+            with transaction.atomic():
+                return chunk.update(**counts)
+
+        rows = (chunk.annotate(**{f'counted_{field}': F(f'actual_{field}')
+                                  for field in counts})
+                .order_by('pk')
+                .values('pk', *counts, *(f'counted_{field}'
+                                         for field in counts)))
+        for row in rows:
+            changes = ', '.join(
+                f'{field} {row[field]}, actual {row[f"counted_{field}"]}'
+                for field in counts
+                if row[field] != row[f'counted_{field}'])
+            self.stdout.write(f'channel {row["pk"]}: {changes}')
+        return len(rows)
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Min
+
+from seenit import comment_cache
+from seenit.models import Comment
+from seenit.models import Post
+from seenit.votes import rating_updates, vote_count
+
+
+def actual_rating(model):
+    """Return an expression for the rating of a post or comment computed
+    from its vote rows.
+    """
+
+    return vote_count(model.up_votes) - vote_count(model.down_votes)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes post and comment ratings from their vote rows'
+
+    models = {'post': Post, 'comment': Comment}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=list(self.models),
+                            help='Only reconcile posts or comments')
+        parser.add_argument('--chunk_size', type=int, default=10000,
+                            help='Number of ids handled per query')
+        parser.add_argument('--dry_run', action='store_true',
+                            help='Report drifted rows without fixing them')
+
+    def handle(self, *args, **options):
+        names = [options['model']] if options['model'] else self.models
+        for name in names:
+            drifted = self.reconcile(self.models[name],
+                                     options['chunk_size'],
+                                     options['dry_run'])
+            verb = 'drifted' if options['dry_run'] else 'fixed'
+            self.stdout.write(f'{name}: {drifted} {verb}')
+
+    def reconcile(self, model, chunk_size, dry_run):
+        """Reconcile model in chunks of chunk_size ids.
+        Each chunk selects its drifted rows and fixes them with a single
+        UPDATE (a dry run only selects them) so memory use does not grow
+        with the table. Fixed comments are invalidated in the comment
+        fragment cache.
+        Return the number of drifted rows.
+        """
+
+        bounds = model._default_manager.aggregate(low=Min('pk'),
+                                                  high=Max('pk'))
+        if bounds['low'] is None:
+            return 0
+
+        drifted = 0
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            chunk = (model._default_manager
+                     .filter(pk__gte=start, pk__lt=start + chunk_size)
+                     .alias(actual=actual_rating(model))
+                     .exclude(rating=F('actual')))
+            if dry_run:
+                rows = (chunk.annotate(actual_rating=F('actual'))
+                        .order_by('pk')
+                        .values_list('pk', 'rating', 'actual_rating'))
+                for pk, rating, actual in rows:
+                    self.stdout.write(
+                        f'{model._meta.model_name} {pk}: '
+                        f'rating {rating}, votes {actual}')
+                    drifted += 1
+            else:
+                with transaction.atomic():
+                    fixed = list(chunk.select_for_update()
+                                 .values_list('pk', flat=True))
+                    drifted += model._default_manager.filter(
+                        pk__in=fixed).update(
+                        **rating_updates(model, actual_rating(model)))
+                    # Cached threads show comment ratings.
+                    if model is Comment and fixed:
+                        comment_cache.invalidate_comments(model, fixed)
+        return drifted
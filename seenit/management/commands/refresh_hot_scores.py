@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.db.models.functions import Abs
+from django.utils import timezone
+
+from seenit.models import Post
+from seenit.ranking import hot_expression
+
+
+class Command(BaseCommand):
+    help = ('Recomputes post hot scores from their ratings and publication '
+            'dates')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Only refresh posts published in the last '
+                                 'DAYS days')
+        parser.add_argument('--chunk_size', type=int, default=10000,
+                            help='Number of ids handled per query')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        if options['days'] is not None:
+            posts = posts.filter(pub_date__gte=timezone.now()
+                                 - timedelta(days=options['days']))
+
+        bounds = posts.aggregate(low=Min('pk'), high=Max('pk'))
+        refreshed = 0
+        if bounds['low'] is not None:
+            chunk_size = options['chunk_size']
+            for start in range(bounds['low'], bounds['high'] + 1,
+                               chunk_size):
+                # Each chunk is one UPDATE of the rows whose score is
+                # stale, so rows already current are not rewritten. Scores
+                # computed in Python may differ from SQL in the last bits.
+                with transaction.atomic():
+                    refreshed += (
+                        posts.filter(pk__gte=start, pk__lt=start + chunk_size)
+                        .alias(drift=Abs(F('hot_score') - hot_expression()))
+                        .filter(drift__gt=1e-9)
+                        .update(hot_score=hot_expression()))
+        self.stdout.write(f'post: {refreshed} hot scores refreshed')
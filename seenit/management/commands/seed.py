@@ -1,24 +1,74 @@
 from random import choice, randint
 from string import ascii_letters as letters
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from seenit import seeding, timelines
+from seenit.comment_backends import get_comment_tree
 from seenit.models import Comment
 from seenit.models import Post
 from seenit.models import User
 from seenit.models import Channel
 
+# Options only the bulk seed reads.
+BULK_OPTIONS = ('users', 'channels', 'posts', 'comments', 'seed', 'workers',
+                'batch_size', 'zipf', 'votes', 'thread_shape')
+
 
 class Command(BaseCommand):
-    help = 'Generates tests data'
+    help = 'Generates test data'
 
     def add_arguments(self, parser):
         parser.add_argument('--thread_count', type=int, default=10)
         parser.add_argument('--root_comments', type=int, default=10)
+        parser.add_argument('--bulk', action='store_true',
+                            help='Bulk create a large dataset: see the '
+                            'options below')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--channels', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=1000000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='The same seed creates the same data')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes creating comments')
+        parser.add_argument('--batch_size', type=int, default=5000,
+                            help='Rows per INSERT')
+        parser.add_argument('--zipf', type=float, default=0.0,
+                            help='Zipf exponent for channel popularity, '
+                            'user activity and comments per post; 0 is '
+                            'uniform, around 1 is typical of real traffic')
+        parser.add_argument('--votes', type=float, default=0.0,
+                            help='Mean vote rows per post and comment, '
+                            'with ratings to match; 0 for random ratings '
+                            'and no votes')
+        parser.add_argument('--thread_shape', choices=list(seeding.SHAPES),
+                            default='random')
+        self.bulk_defaults = {name: parser.get_default(name)
+                              for name in BULK_OPTIONS}
 
     def handle(self, *args, **options):
+        if options['bulk']:
+            self.check_bulk_counts(options)
+            counts = seeding.seed(
+                options['users'], options['channels'], options['posts'],
+                options['comments'], seed=options['seed'],
+                workers=options['workers'], batch_size=options['batch_size'],
+                zipf=options['zipf'], votes=options['votes'],
+                shape=options['thread_shape'], log=self.stdout.write)
+            self.stdout.write(', '.join(f'{count} {name}'
+                                        for name, count in counts.items()))
+            return
+
+        given = [name for name, default in self.bulk_defaults.items()
+                 if options[name] != default]
+        if given:
+            raise CommandError(', '.join(f'--{name}' for name in given)
+                               + ' only apply with --bulk')
+
         self.thread_count = options['thread_count']
         self.root_comments = options['root_comments']
+        self.comment_tree = get_comment_tree()
         self.random_usernames = [self.get_random_username()
                                  for _ in range(100)]
         self.channels = [self.get_or_create_channel() for _ in range(50)]
@@ -37,6 +87,7 @@ class Command(BaseCommand):
                         channel=channel
                         )
             post.save()
+            timelines.fan_out(post)
 
             for _ in range(self.root_comments):
                 print("Adding thread comments...")
@@ -45,12 +96,23 @@ class Command(BaseCommand):
                 raw_text = self.get_random_sentence(max_words=100)
                 new_comment = Comment(user=comment_author, text=raw_text,
                                       rating=randint(-1000, 1000), post=post)
-                new_comment.save()
+                self.comment_tree.insert(new_comment)
                 another_child = choice([True, False])
                 while another_child:
                     self.add_replies(new_comment)
                     another_child = choice([True, False])
 
+    def check_bulk_counts(self, options):
+        """Refuse posts or comments with nothing to attach them to."""
+
+        needs = {'posts': ['channels', 'users'],
+                 'comments': ['posts', 'users']}
+        for name, parents in needs.items():
+            for parent in parents:
+                if options[name] > 0 and options[parent] <= 0:
+                    raise CommandError(
+                        f'--{name} {options[name]} needs --{parent} above 0')
+
     def get_or_create_channel(self):
         channel_id = randint(1, 100)
         try:
@@ -103,6 +165,6 @@ class Command(BaseCommand):
         new_comment = Comment(user=comment_author, text=raw_text,
                               parent=root_comment, post=root_comment.post,
                               rating=randint(-1000, 1000))
-        new_comment.save()
+        self.comment_tree.insert(new_comment)
         if choice([True, False]):
             self.add_replies(new_comment, depth + 1)
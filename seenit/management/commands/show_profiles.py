@@ -0,0 +1,50 @@
+import pstats
+from io import StringIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from seenit.profiling import captured_profiles, profile_dir
+
+SORTS = ('cumulative', 'tottime', 'calls')
+
+
+class Command(BaseCommand):
+    help = ('Lists the request profiles in SEENIT_PROFILE_DIR, newest first, '
+            'or summarizes one')
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile', nargs='?',
+                            help='File name of a profile to summarize')
+        parser.add_argument('--route',
+                            help='Only list profiles of this route')
+        parser.add_argument('--sort', choices=SORTS, default='cumulative',
+                            help='Order of the functions in a summary')
+        parser.add_argument('--limit', type=int, default=25,
+                            help='Functions shown in a summary')
+
+    def handle(self, *args, **options):
+        if options['profile']:
+            self.summarize(profile_dir() / options['profile'],
+                           options['sort'], options['limit'])
+            return
+
+        profiles = [profile for profile in captured_profiles()
+                    if options['route'] in (None, profile[1])]
+        if not profiles:
+            self.stdout.write(f'No profiles in {profile_dir()}')
+            return
+        self.stdout.write(f"{'captured (UTC)':<20} {'route':<24} "
+                          f"{'calls':>9} {'seconds':>9}  file")
+        for path, route, when in profiles:
+            stats = pstats.Stats(str(path))
+            self.stdout.write(
+                f"{when:%Y-%m-%d %H:%M:%S} {route:<24} "
+                f"{stats.total_calls:>9} {stats.total_tt:>9.3f}  {path.name}")
+
+    def summarize(self, path, sort, limit):
+        if not path.is_file():
+            raise CommandError(f'No profile {path}')
+        out = StringIO()
+        stats = pstats.Stats(str(path), stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        self.stdout.write(out.getvalue())
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:53
+
+from django.db import migrations, models
+from django.db.models import CharField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat, LPad
+
+
+# Deepest level a path of max_length 1000 holds, in steps of 10.
+MAX_LEVEL = 99
+
+
+def fill_paths(apps, schema_editor):
+    """Give existing comments their materialized path, one level at a
+    time (see seenit.comment_backends.rebuild_paths).
+
+    Posts with comments deeper than MAX_LEVEL can't be stored as paths:
+    their comments are left without one, and named, so the mptt backend
+    keeps serving them and the rest of the migration runs.
+    """
+
+    Comment = apps.get_model('seenit', 'Comment')
+    too_deep = sorted(set(Comment.objects.filter(level__gt=MAX_LEVEL)
+                          .values_list('post_id', flat=True)))
+    if too_deep:
+        print(f"\n  Posts {', '.join(map(str, too_deep))} have comments "
+              f"deeper than {MAX_LEVEL} levels and get no paths: they can "
+              f"only be served by the mptt comment tree backend.")
+    comments = Comment.objects.exclude(post_id__in=too_deep)
+    depth = comments.aggregate(depth=Max('level'))['depth']
+    if depth is None:
+        return
+
+    step = LPad(Cast('pk', CharField()), 10, Value('0'))
+    parent_path = Subquery(
+        Comment.objects.filter(pk=OuterRef('parent_id')).values('path')[:1])
+    for level in range(depth + 1):
+        path = step if level == 0 else Concat(parent_path, step,
+                                              output_field=CharField())
+        comments.filter(level=level).update(path=path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seenit', '0002_comment_tree_lft_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, db_collation='C', default='', editable=False, max_length=1000),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='seenit_comment_path_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
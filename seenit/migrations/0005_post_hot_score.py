@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:07
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Abs, Cast, Extract, Greatest, Log, Sign
+
+
+def fill_hot_scores(apps, schema_editor):
+    """Score existing posts (see seenit.ranking.hot_expression)."""
+
+    Post = apps.get_model('seenit', 'Post')
+    epoch = datetime(2023, 1, 1, tzinfo=timezone.utc).timestamp()
+    rating = F('rating')
+    order = Log(10, Greatest(Abs(rating), 1))
+    age = Extract('pub_date', 'epoch') - epoch
+    Post.objects.update(
+        hot_score=Cast(Sign(rating) * order + age / 45000, FloatField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seenit', '0004_post_channel_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_hot_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['channel', 'hot_score', 'id'], name='seenit_post_channel_hot_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counts(apps, schema_editor):
+    """Count existing posts, subscribers and comments per channel."""
+
+    Channel = apps.get_model('seenit', 'Channel')
+    Post = apps.get_model('seenit', 'Post')
+    Comment = apps.get_model('seenit', 'Comment')
+
+    def row_count(manager, field):
+        return Coalesce(Subquery(
+            manager.filter(**{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(count=Count('*')).values('count')), 0)
+
+    Channel.objects.update(
+        post_count=row_count(Post.objects, 'channel'),
+        subscriber_count=row_count(
+            Channel.subscribed_users.through.objects, 'channel'),
+        comment_count=row_count(Comment.objects, 'post__channel'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seenit', '0005_post_hot_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='post_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='subscriber_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
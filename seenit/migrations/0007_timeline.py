@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """Build the timeline of every user with subscriptions."""
+
+    User = apps.get_model('seenit', 'User')
+    Post = apps.get_model('seenit', 'Post')
+    TimelineEntry = apps.get_model('seenit', 'TimelineEntry')
+    length = getattr(settings, 'SEENIT_TIMELINE_LENGTH', 500)
+    limit = getattr(settings, 'SEENIT_TIMELINE_FANOUT_LIMIT', 10000)
+
+    for user_id in (User.objects.filter(subscribed_channels__isnull=False)
+                    .distinct().values_list('pk', flat=True).iterator()):
+        posts = (Post.objects
+                 .filter(channel__subscribed_users=user_id,
+                         channel__subscriber_count__lte=limit)
+                 .order_by('-pub_date', '-id').values_list('pk', 'pub_date'))
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+             for pk, pub_date in posts[:length]])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seenit', '0006_channel_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='seenit.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-pub_date', '-post'], name='seenit_timeline_user_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='seenit_timeline_user_post_unique'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
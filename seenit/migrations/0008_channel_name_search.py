@@ -0,0 +1,43 @@
+from django.db import DatabaseError, migrations, transaction
+
+
+def create_search_indexes(apps, schema_editor):
+    """Index channel names for case-insensitive search on Postgres: a
+    pattern index for prefixes, and a trigram index for substrings where
+    pg_trgm can be installed. Elsewhere searches scan the channels.
+    """
+
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX seenit_channel_name_prefix_idx '
+        'ON seenit_channel (UPPER(name) text_pattern_ops)')
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        # Not available, or not ours to install.
+        return
+    schema_editor.execute(
+        'CREATE INDEX seenit_channel_name_trgm_idx '
+        'ON seenit_channel USING gin (UPPER(name) gin_trgm_ops)')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS seenit_channel_name_trgm_idx')
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS seenit_channel_name_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seenit', '0007_timeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
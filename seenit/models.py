@@ -1,8 +1,18 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 
+from mptt.managers import TreeManager
 from mptt.models import MPTTModel, TreeForeignKey
+from mptt.querysets import TreeQuerySet
+
+from . import comment_cache, ranking, votes
 
 
 class User(AbstractUser):
@@ -24,7 +34,7 @@ class User(AbstractUser):
     def get_top_posts(self):
         """Get the top 5 posts for a user"""
 
-        return self.posts.all()[:5]
+        return self.posts.select_related('user', 'channel')[:5]
 
 
 class Channel(models.Model):
@@ -33,18 +43,46 @@ class Channel(models.Model):
     name = models.CharField(max_length=50, unique=True)
     subscribed_users = models.ManyToManyField(
         User, related_name="subscribed_channels", blank=True)
+    # Counters kept in step with the rows they count, in the same
+    # transaction: by Post.save and Comment.save, by the post_delete
+    # receivers below, however posts and comments are deleted, and by
+    # seenit.subscriptions, which also recounts subscriptions changed
+    # through subscribed_users. reconcile_channel_counts repairs any drift.
+    post_count = models.IntegerField(default=0, editable=False)
+    subscriber_count = models.IntegerField(default=0, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
 
     def determine_if_user_subscribed(self, user):
-        if user in self.subscribed_users.filter(id=user.id):
-            return True
-        return False
+        """Answered from user's cached subscription set (see
+        seenit.subscriptions.subscribed_channel_ids).
+        """
+
+        # Imported here: seenit.subscriptions imports the models.
+        from .subscriptions import is_subscribed
+
+        return is_subscribed(user, self)
+
+
+class PostQuerySet(models.QuerySet):
+    def delete(self):
+        with counted_deletes():
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
 
 class Post(models.Model):
     """Model for a post."""
 
     class Meta:
-        ordering = ['-rating', '-pub_date']
+        # id makes the order total, so feeds can be keyset paginated
+        # (see seenit.pagination); the index serves a channel's feed.
+        ordering = ['-rating', '-pub_date', '-id']
+        indexes = [models.Index(fields=['channel', 'rating', 'pub_date', 'id'],
+                                name='seenit_post_channel_feed_idx'),
+                   models.Index(fields=['channel', 'hot_score', 'id'],
+                                name='seenit_post_channel_hot_idx')]
 
     title = models.CharField(max_length=255)
     text = models.TextField()
@@ -58,6 +96,22 @@ class Post(models.Model):
         Channel, related_name="posts", on_delete=models.CASCADE)
     user = models.ForeignKey(
         User, related_name="posts", on_delete=models.CASCADE)
+    # See seenit.ranking.hot_score. Kept current by every rating update.
+    hot_score = models.FloatField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        self.hot_score = ranking.hot_score(self.rating, self.pub_date)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            count({'pk': self.channel_id}, post_count=1)
+
+    def delete(self, *args, **kwargs):
+        with counted_deletes():
+            return super().delete(*args, **kwargs)
 
     def upvote(self, user):
         """Handle upvote.
@@ -65,13 +119,7 @@ class Post(models.Model):
         Otherwise, add user to up_votes.
         """
 
-        self.rating += 1
-        self.save()
-
-        if self.down_votes.filter(id=user.id).exists():
-            self.down_votes.remove(user)
-        else:
-            self.up_votes.add(user)
+        return votes.upvote(self, user)
 
     def downvote(self, user):
         """Handle downvote.
@@ -79,13 +127,33 @@ class Post(models.Model):
         Otherwise, add user to down_votes.
         """
 
-        self.rating -= 1
-        self.save()
+        return votes.downvote(self, user)
+
+
+class TimelineEntry(models.Model):
+    """A post in a user's home timeline (see seenit.timelines)."""
 
-        if self.up_votes.filter(id=user.id).exists():
-            self.up_votes.remove(user)
-        else:
-            self.down_votes.add(user)
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'post'], name='seenit_timeline_user_post_unique')]
+        indexes = [models.Index(fields=['user', '-pub_date', '-post'],
+                                name='seenit_timeline_user_idx')]
+
+    user = models.ForeignKey(
+        User, related_name="timeline", on_delete=models.CASCADE)
+    post = models.ForeignKey(
+        Post, related_name="+", on_delete=models.CASCADE)
+    # Copied from the post, so a timeline is read from the index alone.
+    pub_date = models.DateTimeField()
+
+
+class CommentQuerySet(TreeQuerySet):
+    def delete(self):
+        with counted_deletes():
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
 
 class Comment(MPTTModel):
@@ -104,9 +172,32 @@ class Comment(MPTTModel):
         Post, related_name="comments", on_delete=models.CASCADE)
     user = models.ForeignKey(
         User, related_name="comments", on_delete=models.CASCADE)
+    # Materialized path, used by the "path" comment tree backend
+    # (see seenit.comment_backends). The C collation keeps it in byte order
+    # so prefix searches can use a plain index.
+    path = models.CharField(max_length=1000, blank=True, default='',
+                            editable=False, db_collation='C')
 
-    class MPTTMeta:
-        order_insertion_by = ['-rating', '-pub_date']
+    objects = TreeManager.from_queryset(CommentQuerySet)()
+
+    class Meta:
+        # tree_id and lft are added by MPTTModel, so the index needs an
+        # explicit name: it can't be generated before the fields exist.
+        indexes = [models.Index(fields=['tree_id', 'lft'],
+                                name='seenit_comment_tree_lft_idx'),
+                   models.Index(fields=['path'],
+                                name='seenit_comment_path_idx')]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            count({'posts': self.post_id}, comment_count=1)
+
+    def delete(self, *args, **kwargs):
+        with counted_deletes():
+            return super().delete(*args, **kwargs)
 
     def upvote(self, user):
         """Handle upvote.
@@ -114,13 +205,10 @@ class Comment(MPTTModel):
         Otherwise, add user to up_votes.
         """
 
-        self.rating += 1
-        self.save()
-
-        if self.down_votes.filter(id=user.id).exists():
-            self.down_votes.remove(user)
-        else:
-            self.up_votes.add(user)
+        delta = votes.upvote(self, user)
+        if delta:
+            comment_cache.invalidate_comment(self)
+        return delta
 
     def downvote(self, user):
         """Handle downvote.
@@ -128,10 +216,92 @@ class Comment(MPTTModel):
         Otherwise, add user to down_votes.
         """
 
-        self.rating -= 1
-        self.save()
+        delta = votes.downvote(self, user)
+        if delta:
+            comment_cache.invalidate_comment(self)
+        return delta
+
+
+def count(channels, **deltas):
+    """Add deltas to the counters of the channels matching the filter
+    channels, with one UPDATE.
+    """
+
+    deltas = {field: models.F(field) + delta
+              for field, delta in deltas.items() if delta}
+    if deltas:
+        Channel.objects.filter(**channels).update(**deltas)
+
+
+class _Uncounts:
+    """The posts and comments deleted so far in a counted_deletes block."""
+
+    def __init__(self):
+        self.posts = Counter()
+        self.comments = Counter()
+        self.channel_ids = {}
+
+    def apply(self):
+        """Take the deletes off their channels' counters, with one UPDATE
+        per channel.
+        """
+
+        missing = self.comments.keys() - self.channel_ids.keys()
+        if missing:
+            self.channel_ids.update(Post.objects.filter(pk__in=missing)
+                                    .values_list('pk', 'channel_id'))
+        deltas = defaultdict(Counter)
+        for channel_id, deleted in self.posts.items():
+            deltas[channel_id]['post_count'] -= deleted
+        for post_id, deleted in self.comments.items():
+            if post_id in self.channel_ids:
+                deltas[self.channel_ids[post_id]]['comment_count'] -= deleted
+        # In id order, so concurrent deletes lock channels in one order.
+        for channel_id in sorted(deltas):
+            count({'pk': channel_id}, **deltas[channel_id])
+
+
+# The _Uncounts of the counted_deletes block being run, if any.
+_uncounts = ContextVar('seenit_uncounts', default=None)
+
+
+@contextmanager
+def counted_deletes():
+    """Count the posts and comments deleted in the block together, once it
+    ends, in one transaction with the deletes.
+    Post and comment deletes, of instances or querysets, run in one.
+    Others (cascades from deleting a user, say) uncount each row as it
+    goes.
+    """
+
+    if _uncounts.get() is not None:
+        yield
+        return
+    uncounts = _Uncounts()
+    token = _uncounts.set(uncounts)
+    try:
+        with transaction.atomic():
+            yield
+            uncounts.apply()
+    finally:
+        _uncounts.reset(token)
+
+
+@receiver(post_delete, sender=Post)
+def _uncount_post(sender, instance, **kwargs):
+    uncounts = _uncounts.get()
+    if uncounts is None:
+        count({'pk': instance.channel_id}, post_count=-1)
+    else:
+        uncounts.posts[instance.channel_id] += 1
+        uncounts.channel_ids[instance.pk] = instance.channel_id
+
 
-        if self.up_votes.filter(id=user.id).exists():
-            self.up_votes.remove(user)
-        else:
-            self.down_votes.add(user)
+@receiver(post_delete, sender=Comment)
+def _uncount_comment(sender, instance, **kwargs):
+    uncounts = _uncounts.get()
+    if uncounts is None:
+        # Comments are deleted before their post, so it is still there.
+        count({'posts': instance.post_id}, comment_count=-1)
+    else:
+        uncounts.comments[instance.post_id] += 1
@@ -0,0 +1,89 @@
+import base64
+import json
+
+from django.db.models import F, Field, Func, Value
+
+
+class KeysetPage:
+    """One page of a keyset paginated queryset.
+    next_cursor is None on the last page.
+    """
+
+    def __init__(self, object_list, cursor, next_cursor):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.cursor is not None
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(model, fields, cursor):
+    """Return the values of fields encoded in cursor.
+    Raise ValueError if cursor is not a cursor for fields.
+    """
+
+    try:
+        values = json.loads(
+            base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as error:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from error
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    try:
+        return [model._meta.get_field(field).to_python(value)
+                for field, value in zip(fields, values)]
+    except Exception as error:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from error
+
+
+def keyset_page(queryset, ordering, cursor=None, per_page=25):
+    """Return the page of queryset, in ordering, that follows cursor (the
+    first page if cursor is None or invalid).
+
+    Instead of an OFFSET the page starts with a row comparison on the
+    ordering fields, (a, b, c) < (x, y, z), which an index on those fields
+    answers directly, so every page costs the same as the first. The
+    ordering must end in a unique field and all run in one direction.
+    """
+
+    fields = [field.lstrip('-') for field in ordering]
+    descending = {field.startswith('-') for field in ordering}
+    if len(descending) != 1:
+        raise ValueError("Keyset ordering must run in one direction")
+
+    queryset = queryset.order_by(*ordering)
+    if cursor is not None:
+        try:
+            values = decode_cursor(queryset.model, fields, cursor)
+        except ValueError:
+            cursor = None
+        else:
+            lookup = 'keyset__lt' if descending.pop() else 'keyset__gt'
+            queryset = queryset.alias(
+                keyset=Func(*map(F, fields), function='ROW',
+                            output_field=Field()),
+            ).filter(**{lookup: Func(*map(Value, values), function='ROW')})
+
+    object_list = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(object_list) > per_page:
+        del object_list[per_page:]
+        last = object_list[-1]
+        next_cursor = encode_cursor([getattr(last, field)
+                                     for field in fields])
+    return KeysetPage(object_list, cursor, next_cursor)
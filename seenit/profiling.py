@@ -0,0 +1,85 @@
+import cProfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+# Staff send this header, or this query parameter, to profile a request.
+PROFILE_HEADER = 'X-Seenit-Profile'
+PROFILE_PARAM = 'profile'
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S%f'
+
+
+def profile_dir():
+    return Path(getattr(settings, 'SEENIT_PROFILE_DIR', 'profiles'))
+
+
+def profile_path(route, when):
+    """Return the path a profile of route taken at when is written to:
+    <SEENIT_PROFILE_DIR>/<route>-<UTC timestamp>.prof.
+    """
+
+    name = route.replace(':', '.')
+    stamp = when.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+    return profile_dir() / f'{name}-{stamp}.prof'
+
+
+def captured_profiles():
+    """Return (path, route, datetime) for each profile in
+    SEENIT_PROFILE_DIR, newest first.
+    """
+
+    profiles = []
+    for path in profile_dir().glob('*.prof'):
+        name, _, stamp = path.stem.rpartition('-')
+        try:
+            when = datetime.strptime(stamp, TIMESTAMP_FORMAT).replace(
+                tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        profiles.append((path, name.replace('.', ':'), when))
+    return sorted(profiles, key=lambda profile: profile[2], reverse=True)
+
+
+def wants_profile(request):
+    """True if request asks to be profiled and is from a staff user."""
+
+    asked = (request.headers.get(PROFILE_HEADER)
+             or PROFILE_PARAM in request.GET)
+    return bool(asked) and request.user.is_staff
+
+
+class ProfilerMiddleware:
+    """Run requests from staff users that send the X-Seenit-Profile
+    header, or a "profile" query parameter, under cProfile, and write the
+    profile to SEENIT_PROFILE_DIR (see captured_profiles and the
+    show_profiles command). The response names the file in the same
+    header.
+
+    Only loaded when SEENIT_PROFILER is on, and must come after
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SEENIT_PROFILER', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+
+        try:
+            route = resolve(request.path_info).view_name
+        except Resolver404:
+            route = 'unresolved'
+        path = profile_path(route, datetime.now(timezone.utc))
+
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+        response[PROFILE_HEADER] = path.name
+        return response
@@ -0,0 +1,72 @@
+import math
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import attrgetter
+
+from django.db.models import F, FloatField, Window
+from django.db.models.functions import (Abs, Cast, Extract, Greatest, Log,
+                                        RowNumber, Sign)
+
+# Seconds of age worth a tenfold rating in the hot score: a post has to
+# gain ten times the votes to keep up with one posted 12.5 hours later.
+HOT_DECAY = 45000
+# Ages are counted from here to keep the time term small.
+HOT_EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+# Post orderings for feeds, by sort name. Each ends in a unique field, so
+# feeds can be keyset paginated (see seenit.pagination).
+FEED_SORTS = {
+    'top': ['-rating', '-pub_date', '-id'],
+    'hot': ['-hot_score', '-id'],
+}
+DEFAULT_FEED_SORT = 'top'
+
+
+def get_feed_sort(value):
+    """Return value if it names a sort in FEED_SORTS, else
+    DEFAULT_FEED_SORT.
+    """
+
+    return value if value in FEED_SORTS else DEFAULT_FEED_SORT
+
+
+def hot_score(rating, pub_date):
+    """Return the hot score of a post: the order of magnitude of its
+    rating, signed, plus its publication time in units of HOT_DECAY.
+
+    Newer posts start higher, so older ones sink without their scores
+    changing as they age; a score only changes with the rating.
+    """
+
+    order = math.log10(max(abs(rating), 1))
+    sign = (rating > 0) - (rating < 0)
+    return sign * order + (pub_date - HOT_EPOCH).total_seconds() / HOT_DECAY
+
+
+def hot_expression(rating=F('rating'), pub_date=F('pub_date')):
+    """Return hot_score as an SQL expression of rating and pub_date."""
+
+    order = Log(10, Greatest(Abs(rating), 1))
+    age = Extract(pub_date, 'epoch') - HOT_EPOCH.timestamp()
+    return Cast(Sign(rating) * order + age / HOT_DECAY, FloatField())
+
+
+def top_per_channel(posts, ordering, limit):
+    """Return the first limit posts of each channel in posts, in ordering,
+    as a list of lists in channel id order.
+
+    Posts are numbered within their channel by a window function and
+    filtered on that number, so this is one query however many channels
+    there are.
+    """
+
+    order_by = [F(field[1:]).desc() if field.startswith('-')
+                else F(field).asc() for field in ordering]
+    posts = (posts
+             .annotate(channel_rank=Window(RowNumber(),
+                                           partition_by=F('channel'),
+                                           order_by=order_by))
+             .filter(channel_rank__lte=limit)
+             .order_by('channel', 'channel_rank'))
+    return [list(group)
+            for _, group in groupby(posts, key=attrgetter('channel_id'))]
@@ -0,0 +1,377 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import accumulate
+from multiprocessing import get_context
+from string import ascii_letters as letters
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import ranking, timelines
+from .bulk import copy_rows
+from .comment_backends import MAX_LEVEL, encode_step
+from .models import Channel, Comment, Post, User
+
+PASSWORD = 'greatpassword123'
+# Posts are spread over this many days before the seed starts.
+POST_DAYS = 30
+# Users whose timelines are rebuilt at a time.
+TIMELINE_CHUNK = 200
+# Thread shapes: how likely a comment is to start a new tree, and how
+# replies pick their parent (see thread_parents).
+SHAPES = {
+    'random': 0.1,
+    'deep': 0.01,
+    'wide': 0.001,
+}
+
+
+def nested_sets(parents):
+    """Return (root, lft, rght, level) lists for a forest of comments given
+    the parent index of each (None for roots). Parents must come before
+    their replies.
+    """
+
+    children = [[] for _ in parents]
+    roots = []
+    for index, parent in enumerate(parents):
+        if parent is None:
+            roots.append(index)
+        else:
+            children[parent].append(index)
+
+    root, lft, rght, level = ([0] * len(parents) for _ in range(4))
+    for top in roots:
+        counter = 1
+        stack = [(top, False)]
+        while stack:
+            index, done = stack.pop()
+            if done:
+                rght[index] = counter
+            else:
+                root[index] = top
+                lft[index] = counter
+                stack.append((index, True))
+                for child in reversed(children[index]):
+                    level[child] = level[index] + 1
+                    stack.append((child, False))
+            counter += 1
+    return root, lft, rght, level
+
+
+def thread_parents(rng, count, shape='random'):
+    """Return the parent index of each of count comments on a post.
+
+    A comment starts a new tree with the shape's odds in SHAPES. Otherwise
+    it replies to a random earlier comment ("random"), mostly to the one
+    before it, making long chains ("deep"), or mostly to the latest root,
+    making huge sibling lists ("wide"). No reply goes below MAX_LEVEL.
+    """
+
+    parents, levels = [], []
+    root = None
+    for index in range(count):
+        if index == 0 or rng.random() < SHAPES[shape]:
+            parent = root = None
+        elif shape == 'deep' and rng.random() < 0.97:
+            parent = index - 1
+        elif shape == 'wide' and rng.random() < 0.9:
+            parent = root
+        else:
+            parent = rng.randrange(index)
+        while parent is not None and levels[parent] >= MAX_LEVEL:
+            parent = parents[parent]
+        parents.append(parent)
+        levels.append(0 if parent is None else levels[parent] + 1)
+        if parent is None:
+            root = index
+    return parents
+
+
+def zipf_weights(count, exponent):
+    """Return cumulative weights for count items where the item at rank r
+    (from 1) is picked in proportion to 1 / r ** exponent: uniform at 0,
+    more and more skewed to the first items above it.
+    """
+
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+def weighted_sample(rng, population, cum_weights, count):
+    """Return up to count distinct items of population, picked by
+    cum_weights.
+    """
+
+    count = min(count, len(population))
+    picked = {}
+    # Popular items come up again and again: give up eventually.
+    for _ in range(count * 10):
+        if len(picked) == count:
+            break
+        item = rng.choices(population, cum_weights=cum_weights)[0]
+        picked[item] = None
+    return list(picked)
+
+
+def spread(total, cum_weights):
+    """Split total into counts in proportion to cum_weights."""
+
+    if not cum_weights:
+        if total:
+            raise ValueError(f'Nothing to spread {total} items over')
+        return []
+    weight = cum_weights[-1]
+    counts = []
+    previous = 0
+    for cumulative in cum_weights:
+        counts.append(int(total * (cumulative - previous) / weight))
+        previous = cumulative
+    for index in range(total - sum(counts)):
+        counts[index] += 1
+    return counts
+
+
+def cast_votes(rng, user_ids, cum_weights, mean):
+    """Return (up voters, down voters) for an item with mean votes on
+    average, drawn from user_ids by activity. Each item gets its own share
+    of up votes, so some are loved, some hated and some controversial.
+    """
+
+    voters = weighted_sample(rng, user_ids, cum_weights,
+                             round(rng.expovariate(1 / mean)))
+    share = rng.random()
+    ups, downs = [], []
+    for voter in voters:
+        (ups if rng.random() < share else downs).append(voter)
+    return ups, downs
+
+
+def sentences(rng, count, max_words=50):
+    return [' '.join(''.join(rng.choice(letters)
+                             for _ in range(rng.randint(3, 15)))
+                     for _ in range(rng.randint(3, max_words)))
+            for _ in range(count)]
+
+
+def seed(users, channels, posts, comments, seed=0, workers=1,
+         batch_size=5000, zipf=0.0, votes=0.0, shape='random', log=None):
+    """Bulk create users, channels, subscriptions, posts and comments.
+
+    With zipf above 0, channel popularity (subscribers and posts), user
+    activity (posting, commenting and voting) and comments per post follow
+    Zipf distributions with that exponent. With votes above 0, posts and
+    comments get that many vote rows on average and their ratings are the
+    totals; otherwise ratings are random and there are no votes. shape is
+    a thread shape in SHAPES.
+
+    The same seed creates the same data, with dates relative to the time
+    it is run, whatever the number of workers. Comment ids are reserved up
+    front, so their nested sets and paths are built in memory and each
+    post's comments can be written by any worker process; nothing else
+    should write comments while this runs.
+    Everything save() would keep in step is filled in directly: hot
+    scores, channel counters and subscribers' timelines.
+    """
+
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    password = make_password(PASSWORD)
+    first = (User.objects.aggregate(high=Max('pk'))['high'] or 0) + 1
+    user_ids = [user.pk for user in User.objects.bulk_create(
+        [User(username=f'user{first + index}', password=password,
+              email=f'user{first + index}@test.com')
+         for index in range(users)], batch_size=batch_size)]
+    # The first users are the most active, the first channels the most
+    # popular.
+    activity = zipf_weights(len(user_ids), zipf)
+    log(f'users: {len(user_ids)} created')
+
+    first = (Channel.objects.aggregate(high=Max('pk'))['high'] or 0) + 1
+    channel_list = Channel.objects.bulk_create(
+        [Channel(name=f'channel {first + index}')
+         for index in range(channels)], batch_size=batch_size)
+    popularity = zipf_weights(len(channel_list), zipf)
+
+    subscriptions = []
+    for user_id in user_ids:
+        for channel in weighted_sample(rng, channel_list, popularity,
+                                       rng.randint(1, 10)):
+            subscriptions.append((channel.pk, user_id))
+            channel.subscriber_count += 1
+    copy_rows(Channel.subscribed_users.through, ('channel_id', 'user_id'),
+              subscriptions, batch_size)
+    log(f'channels: {len(channel_list)} created, '
+        f'{len(subscriptions)} subscriptions')
+
+    titles = sentences(rng, 1000, max_words=20)
+    post_list = []
+    post_votes = []
+    for index in range(posts):
+        pub_date = now - timedelta(seconds=rng.uniform(0, POST_DAYS * 86400))
+        if votes:
+            ups, downs = cast_votes(rng, user_ids, activity, votes)
+            rating = len(ups) - len(downs)
+            post_votes.append((ups, downs))
+        else:
+            rating = rng.randint(-1000, 1000)
+        post_list.append(Post(
+            title=rng.choice(titles)[:255], text=rng.choice(titles),
+            rating=rating, pub_date=pub_date,
+            hot_score=ranking.hot_score(rating, pub_date),
+            channel=rng.choices(channel_list, cum_weights=popularity)[0],
+            user_id=rng.choices(user_ids, cum_weights=activity)[0]))
+    Post.objects.bulk_create(post_list, batch_size=batch_size)
+    with transaction.atomic():
+        _copy_votes(Post, 'post_id', [
+            (post.pk, ups, downs)
+            for post, (ups, downs) in zip(post_list, post_votes)],
+            batch_size)
+    log(f'posts: {len(post_list)} created')
+
+    # Viral posts are spread over channels and time: ranks are shuffled.
+    ranks = list(range(posts))
+    rng.shuffle(ranks)
+    by_rank = spread(comments, zipf_weights(posts, zipf))
+    counts = [by_rank[rank] for rank in ranks]
+
+    # Comment ids are handed out in post order from first_comment, so the
+    # tasks can build their trees without asking the database for ids.
+    first_comment = (Comment.objects.aggregate(high=Max('pk'))['high']
+                     or 0) + 1
+    tree_offset = max(0, (Comment.objects.aggregate(high=Max('tree_id'))
+                          ['high'] or 0) + 1 - first_comment)
+    tasks = []
+    task = []
+    task_size = 0
+    next_id = first_comment
+    for index, (post, count) in enumerate(zip(post_list, counts)):
+        post.channel.post_count += 1
+        post.channel.comment_count += count
+        task.append((index, post.pk, post.pub_date, next_id, count))
+        next_id += count
+        task_size += count
+        if task_size >= batch_size:
+            tasks.append(task)
+            task, task_size = [], 0
+    if task:
+        tasks.append(task)
+
+    Channel.objects.bulk_update(
+        channel_list, ['post_count', 'subscriber_count', 'comment_count'],
+        batch_size=batch_size)
+
+    config = (seed, user_ids, activity, tree_offset, batch_size, votes,
+              shape, now)
+    created = 0
+    for count in _map(_create_comments, tasks, workers, config):
+        created += count
+        log(f'comments: {created} of {comments}')
+
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Comment]):
+            cursor.execute(sql)
+
+    # Up to SEENIT_TIMELINE_LENGTH entries a user: keep chunks small.
+    chunks = [user_ids[start:start + TIMELINE_CHUNK]
+              for start in range(0, len(user_ids), TIMELINE_CHUNK)]
+    for _ in _map(timelines.rebuild_many, chunks, workers, config):
+        pass
+    log('timelines: rebuilt')
+    return {'users': len(user_ids), 'channels': len(channel_list),
+            'posts': len(post_list), 'comments': created}
+
+
+def _map(function, tasks, workers, config):
+    """Yield function(task) for each task, running them in workers
+    processes set up with config.
+    """
+
+    if workers <= 1:
+        _init_worker(*config)
+        yield from map(function, tasks)
+        return
+
+    # Forked workers open their own connections.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context(
+            'fork'), initializer=_init_worker, initargs=config) as pool:
+        yield from pool.map(function, tasks)
+
+
+_worker = {}
+
+
+def _init_worker(seed, user_ids, activity, tree_offset, batch_size, votes,
+                 shape, now):
+    _worker.update(seed=seed, user_ids=user_ids, activity=activity,
+                   tree_offset=tree_offset, batch_size=batch_size,
+                   votes=votes, shape=shape, now=now,
+                   texts=sentences(random.Random(seed), 1000, max_words=100))
+
+
+# Comment columns written by the seed, in row order.
+COMMENT_FIELDS = ('id', 'text', 'post_id', 'user_id', 'rating', 'pub_date',
+                  'parent_id', 'tree_id', 'lft', 'rght', 'level', 'path')
+
+
+def _create_comments(task):
+    """Create the comments, and their votes, of each (post index, post id,
+    post date, first comment id, count) in task, in one transaction.
+    Return the number of comments created.
+    """
+
+    user_ids = _worker['user_ids']
+    activity = _worker['activity']
+    texts = _worker['texts']
+    tree_offset = _worker['tree_offset']
+    mean_votes = _worker['votes']
+    rows = []
+    comment_votes = []
+    for index, post_id, pub_date, first_id, count in task:
+        # Seeded by post, so it doesn't matter which worker gets the post.
+        rng = random.Random(f"{_worker['seed']}:{index}")
+        parents = thread_parents(rng, count, _worker['shape'])
+        root, lft, rght, level = nested_sets(parents)
+        # Between the post and now, in order, so replies follow parents.
+        span = (_worker['now'] - pub_date).total_seconds()
+        offsets = sorted(rng.uniform(0, span) for _ in parents)
+        paths = []
+        for position, parent in enumerate(parents):
+            pk = first_id + position
+            step = encode_step(pk)
+            paths.append(step if parent is None else paths[parent] + step)
+            if mean_votes:
+                ups, downs = cast_votes(rng, user_ids, activity, mean_votes)
+                rating = len(ups) - len(downs)
+                comment_votes.append((pk, ups, downs))
+            else:
+                rating = rng.randint(-1000, 1000)
+            rows.append((
+                pk, rng.choice(texts), post_id,
+                rng.choices(user_ids, cum_weights=activity)[0], rating,
+                pub_date + timedelta(seconds=offsets[position]),
+                None if parent is None else first_id + parent,
+                tree_offset + first_id + root[position],
+                lft[position], rght[position], level[position], paths[-1]))
+
+    with transaction.atomic():
+        copy_rows(Comment, COMMENT_FIELDS, rows, _worker['batch_size'])
+        _copy_votes(Comment, 'comment_id', comment_votes,
+                    _worker['batch_size'])
+    return len(rows)
+
+
+def _copy_votes(model, column, votes, batch_size):
+    """Insert the vote rows of (pk, up voters, down voters) in votes."""
+
+    for field, position in (('up_votes', 1), ('down_votes', 2)):
+        copy_rows(getattr(model, field).through, (column, 'user_id'),
+                  [(vote[0], user_id) for vote in votes
+                   for user_id in vote[position]], batch_size)
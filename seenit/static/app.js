@@ -3,7 +3,7 @@
 const POST_CONTAINERS = document.getElementsByClassName("post-container");
 const UP_VOTE = document.getElementsByClassName("upvote");
 const DOWN_VOTE = document.getElementsByClassName("downvote");
-const REPLY_BTN = document.getElementsByClassName("reply-btn");
+const REPLY_FORM_TEMPLATE = document.getElementById("reply-form-template");
 const SUBSCRIBE_BTNS = document.getElementById("subscribe-btns");
 const SUBSCRIBE_BTN = document.getElementById("subscribe-btn");
 const UNSUBSCRIBE_BTN = document.getElementById("unsubscribe-btn");
@@ -56,14 +56,31 @@ const BASE_URL = "http://localhost:8000";
 //   }
 // }
 
+// The reply form is rendered once per page, in REPLY_FORM_TEMPLATE, and
+// copied under a comment's reply button the first time it is clicked.
+function toggleReplyForm(replyBtn) {
+  let replyForm = replyBtn.nextElementSibling;
+  if (!replyForm || !replyForm.classList.contains("reply-form")) {
+    replyForm = REPLY_FORM_TEMPLATE.content.firstElementChild.cloneNode(true);
+    replyForm.action = REPLY_FORM_TEMPLATE.dataset.action.replace(
+      /\/0\/$/,
+      `/${replyBtn.dataset.commentId}/`
+    );
+    replyBtn.after(replyForm);
+  } else if (replyForm.style.display === "none") {
+    replyForm.style.display = "block";
+  } else {
+    replyForm.style.display = "none";
+  }
+}
+
 function addReplyClickHandler() {
-  for (let elem of REPLY_BTN) {
+  if (!REPLY_FORM_TEMPLATE) return;
+  for (let elem of POST_CONTAINERS) {
     elem.addEventListener("click", function (evt) {
-      const replyForm = evt.target.nextElementSibling;
-      if (replyForm.style.display === "none") {
-        replyForm.style.display = "block";
-      } else {
-        replyForm.style.display = "none";
+      const replyBtn = evt.target.closest(".reply-btn");
+      if (replyBtn) {
+        toggleReplyForm(replyBtn);
       }
     });
   }
@@ -0,0 +1,160 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from . import timelines
+from .models import Channel, User, count
+from .votes import row_count
+
+
+def subscribed_channel_ids(user):
+    """Return the ids of the channels user subscribes to, as a frozenset.
+
+    The set is cached under a version that every subscription change
+    replaces, and kept on user for the rest of the request, so checking
+    any number of channels costs at most one query. Both expire after
+    SEENIT_SUBSCRIPTION_CACHE_TIMEOUT seconds, which bounds how stale a
+    per-process cache can get.
+    """
+
+    if not user.is_authenticated:
+        return frozenset()
+    version_key = _version_key(user.pk)
+    timeout = getattr(settings, 'SEENIT_SUBSCRIPTION_CACHE_TIMEOUT', 60)
+    version = cache.get(version_key)
+    if version is None:
+        version = _new_version()
+        cache.set(version_key, version, timeout=timeout)
+    loaded = getattr(user, '_subscribed_channel_ids', None)
+    if loaded is not None and loaded[0] == version:
+        return loaded[1]
+
+    key = f'seenit:subscriptions:{user.pk}:{version}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(_subscriptions(user).values_list('channel_id',
+                                                         flat=True))
+        cache.set(key, ids, timeout=timeout)
+    user._subscribed_channel_ids = (version, ids)
+    return ids
+
+
+def is_subscribed(user, channel):
+    return channel.pk in subscribed_channel_ids(user)
+
+
+def subscribe(user, channel):
+    """Subscribe user to channel, count the new subscriber and rebuild
+    their timeline. Return True if user was not already subscribed.
+    """
+
+    with transaction.atomic():
+        _lock_user(user)
+        if _subscription(user, channel).exists():
+            return False
+        Channel.subscribed_users.through.objects.create(
+            channel_id=channel.pk, user_id=user.pk)
+        _count(channel, 1)
+        timelines.rebuild(user)
+        _invalidate([user.pk])
+    return True
+
+
+def unsubscribe(user, channel):
+    """Unsubscribe user from channel, uncount them and rebuild their
+    timeline. Return True if user was subscribed.
+    """
+
+    with transaction.atomic():
+        _lock_user(user)
+        if not _subscription(user, channel).delete()[0]:
+            return False
+        _count(channel, -1)
+        timelines.rebuild(user)
+        _invalidate([user.pk])
+    return True
+
+
+def _lock_user(user):
+    # Serializes a user's subscription changes, so the existence check and
+    # the insert or delete after it can't interleave with another request.
+    list(User.objects.select_for_update().filter(pk=user.pk)
+         .values_list('pk', flat=True))
+
+
+def _subscriptions(user):
+    return Channel.subscribed_users.through.objects.filter(user_id=user.pk)
+
+
+def _subscription(user, channel):
+    return _subscriptions(user).filter(channel_id=channel.pk)
+
+
+def _version_key(user_id):
+    return f'seenit:subscriptions:{user_id}:version'
+
+
+def _new_version():
+    # Random, like the comment cache's versions (see seenit.comment_cache),
+    # so an evicted version can't come back.
+    return uuid.uuid4().hex[:12]
+
+
+def _invalidate(user_ids):
+    """Give the subscription sets of user_ids new versions, now so the
+    current transaction sees its changes, and again once it commits so
+    nothing read before the commit stays cached.
+    """
+
+    def bump():
+        cache.set_many(
+            {_version_key(user_id): _new_version() for user_id in user_ids},
+            timeout=getattr(settings, 'SEENIT_SUBSCRIPTION_CACHE_TIMEOUT',
+                            60))
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _count(channel, step):
+    count({'pk': channel.pk}, subscriber_count=step)
+    channel.subscriber_count += step
+
+
+@receiver(m2m_changed, sender=Channel.subscribed_users.through)
+def _subscriptions_changed(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Recount, rebuild the timelines of and invalidate the users of
+    subscriptions changed through the many-to-many managers (the admin,
+    channel.subscribed_users.add...), which subscribe and unsubscribe
+    don't use.
+    """
+
+    if action == 'pre_clear':
+        # post_clear doesn't say what was cleared.
+        related = (instance.subscribed_users if not reverse
+                   else instance.subscribed_channels)
+        instance._cleared_subscriptions = set(
+            related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_subscriptions', None)
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+
+    if reverse:
+        user_ids, channel_ids = [instance.pk], list(pk_set)
+    else:
+        user_ids, channel_ids = list(pk_set), [instance.pk]
+    # Recounted rather than stepped: remove is given ids that may not
+    # have been subscribed.
+    Channel.objects.filter(pk__in=channel_ids).update(
+        subscriber_count=row_count(sender.objects, 'channel_id'))
+    timelines.rebuild_many(user_ids)
+    _invalidate(user_ids)
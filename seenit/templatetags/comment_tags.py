@@ -0,0 +1,144 @@
+import re
+
+from django import template
+from django.conf import settings
+from django.template.defaulttags import CsrfTokenNode
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from mptt.templatetags.mptt_tags import RecurseTreeNode, cache_tree_children
+
+from seenit import comment_cache
+
+register = template.Library()
+
+
+# Around each comment's vote arrows in comment_template.html.
+VOTES_START = re.compile(r'<!--votes:(\d+)-->')
+VOTES_END = '<!--/votes-->'
+
+
+class CachedRecurseTreeNode(RecurseTreeNode):
+    """recursetree that caches the rendered thread and every comment
+    subtree (see seenit.comment_cache for how the keys are versioned).
+    A cached subtree is reused without rendering any of its comments.
+
+    Fragments are shared by every viewer: they are rendered with unvoted
+    arrows and a placeholder CSRF token, and the viewer's votes and token
+    are filled in after the cache lookup.
+    """
+
+    def render(self, context):
+        comments = list(self.queryset_var.resolve(context))
+        post = context.get('post')
+        csrf_token = context.get('csrf_token')
+        csrf_input = CsrfTokenNode().render(context)
+        with context.push(csrf_token=comment_cache.CSRF_PLACEHOLDER):
+            placeholder_input = CsrfTokenNode().render(context)
+            if not comments or post is None:
+                html = super().render(context)
+            else:
+                html = self._render_cached(context, comments, post)
+        html = html.replace(placeholder_input, csrf_input)
+        return mark_safe(self._personalize(html, comments, csrf_token))
+
+    def _render_cached(self, context, comments, post):
+        cache = comment_cache.get_cache()
+        sort = context.get('sort') or ''
+        post_version, versions = comment_cache.get_versions(
+            post.pk, [comment.pk for comment in comments])
+
+        thread_key = comment_cache.thread_key(
+            post.pk, post_version, sort, comment_cache.thread_shape(comments))
+        # Threads are cut off SEENIT_COMMENT_DEPTH levels below their top
+        # comment (see seenit.comment_tree). Comments with replies left to
+        # load, or skipped, change whenever the cut off point moves, so
+        # only complete subtrees are cached.
+        max_level = (comments[0].level
+                     + getattr(settings, 'SEENIT_COMMENT_DEPTH', 6) - 1)
+        keys = {comment.pk: comment_cache.comment_key(
+                    comment.pk, versions[comment.pk], sort, max_level)
+                for comment in comments
+                if getattr(comment, 'more_after', None) is None
+                and not getattr(comment, 'replies_skipped', False)}
+
+        cached = cache.get_many([thread_key, *keys.values()])
+        if thread_key in cached:
+            return cached[thread_key]
+
+        rendered = {}
+        bits = [self._render_cached_node(context, node, keys, cached,
+                                         rendered)
+                for node in cache_tree_children(comments)]
+        rendered[thread_key] = ''.join(bits)
+        cache.set_many(rendered, comment_cache.get_timeout())
+        return rendered[thread_key]
+
+    def _render_cached_node(self, context, node, keys, cached, rendered):
+        key = keys.get(node.pk)
+        if key in cached:
+            return cached[key]
+
+        bits = [self._render_cached_node(context, child, keys, cached,
+                                         rendered)
+                for child in node.get_children()]
+        context.push()
+        context['node'] = node
+        context['children'] = mark_safe(''.join(bits))
+        html = self.template_nodes.render(context)
+        context.pop()
+
+        if key is not None:
+            rendered[key] = html
+        return html
+
+    def _personalize(self, html, comments, csrf_token):
+        """Put the arrows of the comments the viewer voted on (see
+        seenit.votes.annotate_vote_states) into html, with csrf_token in
+        their forms.
+        """
+
+        voted = {comment.pk: comment for comment in comments
+                 if getattr(comment, 'user_vote', 0)}
+        if not voted:
+            return html
+        votes = get_template('comment_rating_base.html')
+        # One pass over html, whatever the number of votes.
+        bits = []
+        position = 0
+        for match in VOTES_START.finditer(html):
+            comment = voted.get(int(match.group(1)))
+            if comment is None:
+                continue
+            bits += [html[position:match.end()], votes.render({
+                'rating': comment.rating, 'comment': comment,
+                'post_type': 'comment', 'user_vote': comment.user_vote,
+                'csrf_token': csrf_token})]
+            position = html.find(VOTES_END, match.end())
+        bits.append(html[position:])
+        return ''.join(bits)
+
+
+@register.tag
+def cachedrecursetree(parser, token):
+    """Like mptt's recursetree, but caches each rendered comment subtree.
+
+    Usage:
+            {% cachedrecursetree comments %}
+                ...
+            {% endcachedrecursetree %}
+
+    Needs post in the context; without it nothing is cached.
+    """
+
+    bits = token.contents.split()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            "%s tag requires a queryset" % bits[0])
+
+    queryset_var = template.Variable(bits[1])
+
+    template_nodes = parser.parse(("endcachedrecursetree",))
+    parser.delete_first_token()
+
+    return CachedRecurseTreeNode(template_nodes, queryset_var)
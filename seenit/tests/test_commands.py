@@ -0,0 +1,230 @@
+import random
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from seenit import comment_cache, seeding
+from seenit.comment_backends import get_comment_tree
+from seenit.models import User, Post, Channel, Comment, TimelineEntry
+from seenit.ranking import hot_score
+
+
+class CommandsTestCase(TestCase):
+    def setUp(self):
+        self.u1 = User.objects.create(username="test", email="test@test.com",
+                                      password="secret")
+        self.u2 = User.objects.create(username="test2",
+                                      email="test2@test.com",
+                                      password="secret")
+        self.channel = Channel.objects.create(name="channel1")
+        self.p1 = Post.objects.create(title="post1", text="abcabc",
+                                      user=self.u1, channel=self.channel)
+        self.p2 = Post.objects.create(title="post2", text="abcabc",
+                                      user=self.u1, channel=self.channel)
+        self.cm1 = Comment.objects.create(text="comment1", post=self.p1,
+                                          user=self.u1)
+
+    def call(self, name, *args, **kwargs):
+        out = StringIO()
+        call_command(name, *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+
+class ReconcileRatingsTests(CommandsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.p1.up_votes.add(self.u1, self.u2)
+        self.p2.down_votes.add(self.u1)
+        self.cm1.down_votes.add(self.u2)
+        Post.objects.filter(pk=self.p1.pk).update(rating=500)
+        Comment.objects.filter(pk=self.cm1.pk).update(rating=-1)
+
+    def test_dry_run_reports_drift(self):
+        out = self.call("reconcile_ratings", dry_run=True)
+
+        self.assertIn(f"post {self.p1.pk}: rating 500, votes 2", out)
+        self.assertIn(f"post {self.p2.pk}: rating 0, votes -1", out)
+        self.assertIn("post: 2 drifted", out)
+        self.assertIn("comment: 0 drifted", out)
+
+        self.p1.refresh_from_db()
+        self.assertEqual(self.p1.rating, 500)
+
+    def test_fixes_drift_in_chunks(self):
+        out = self.call("reconcile_ratings", chunk_size=1)
+
+        self.assertIn("post: 2 fixed", out)
+        self.assertIn("comment: 0 fixed", out)
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list('rating', flat=True)),
+            [2, -1])
+
+        out = self.call("reconcile_ratings", model="post")
+        self.assertIn("post: 0 fixed", out)
+        self.assertNotIn("comment", out)
+
+    def test_fixed_comments_invalidated(self):
+        Comment.objects.filter(pk=self.cm1.pk).update(rating=5)
+        before = comment_cache.get_versions(self.p1.pk, [self.cm1.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            out = self.call("reconcile_ratings", model="comment")
+
+        self.assertIn("comment: 1 fixed", out)
+        self.assertEqual(Comment.objects.get(pk=self.cm1.pk).rating, -1)
+        after = comment_cache.get_versions(self.p1.pk, [self.cm1.pk])
+        self.assertNotEqual(before[0], after[0])
+        self.assertNotEqual(before[1], after[1])
+
+
+class RefreshHotScoresTests(CommandsTestCase):
+    def test_refreshes_stale_scores(self):
+        Post.objects.filter(pk=self.p1.pk).update(rating=100, hot_score=0)
+        old = Post.objects.create(title="old", text="abcabc", user=self.u1,
+                                  channel=self.channel,
+                                  pub_date=timezone.now() - timedelta(days=9))
+        Post.objects.filter(pk=old.pk).update(hot_score=0)
+
+        out = self.call("refresh_hot_scores", days=7, chunk_size=1)
+
+        self.assertIn("post: 1 hot scores refreshed", out)
+        self.p1.refresh_from_db()
+        self.assertAlmostEqual(self.p1.hot_score,
+                               hot_score(100, self.p1.pub_date), places=6)
+        self.assertEqual(Post.objects.get(pk=old.pk).hot_score, 0)
+
+        out = self.call("refresh_hot_scores")
+        self.assertIn("post: 1 hot scores refreshed", out)
+
+
+class ReconcileChannelCountsTests(CommandsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.channel.subscribed_users.add(self.u1, self.u2)
+        Channel.objects.filter(pk=self.channel.pk).update(
+            post_count=7, subscriber_count=0)
+        self.empty = Channel.objects.create(name="empty")
+
+    def test_dry_run_reports_drift(self):
+        out = self.call("reconcile_channel_counts", dry_run=True)
+
+        self.assertIn(f"channel {self.channel.pk}: post_count 7, actual 2, "
+                      f"subscriber_count 0, actual 2", out)
+        self.assertIn("channel: 1 drifted", out)
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.post_count, 7)
+
+    def test_fixes_drift_in_chunks(self):
+        out = self.call("reconcile_channel_counts", chunk_size=1)
+
+        self.assertIn("channel: 1 fixed", out)
+        self.channel.refresh_from_db()
+        self.assertEqual((self.channel.post_count,
+                          self.channel.subscriber_count,
+                          self.channel.comment_count), (2, 2, 1))
+        self.assertIn("channel: 0 fixed",
+                      self.call("reconcile_channel_counts"))
+
+
+class SeedTests(CommandsTestCase):
+    def test_fans_out_posts(self):
+        random.seed(0)
+        with redirect_stdout(StringIO()):
+            self.call("seed", thread_count=10, root_comments=1)
+
+        entries = TimelineEntry.objects.exclude(post__in=[self.p1, self.p2])
+        self.assertTrue(entries.exists())
+        for entry in entries.select_related('post'):
+            self.assertTrue(entry.user.subscribed_channels.filter(
+                pk=entry.post.channel_id).exists())
+
+    def test_bulk_options_need_bulk(self):
+        with self.assertRaisesMessage(CommandError,
+                                      "--zipf, --thread_shape only apply "
+                                      "with --bulk"):
+            self.call("seed", zipf=1.2, thread_shape='deep')
+        self.assertFalse(Post.objects.exclude(
+            pk__in=[self.p1.pk, self.p2.pk]).exists())
+
+
+class BulkSeedTests(CommandsTestCase):
+    def seed(self, **options):
+        first = Comment.objects.order_by('-pk').first().pk
+        out = self.call("seed", bulk=True, users=5, channels=3, posts=4,
+                        comments=50, batch_size=20, **options)
+        comments = Comment.objects.filter(pk__gt=first).order_by('pk')
+        return out, [(comment.text, comment.rating, comment.level,
+                      comment.lft, comment.rght,
+                      comment.parent_id and comment.parent_id - first)
+                     for comment in comments]
+
+    def test_creates_consistent_data(self):
+        out, comments = self.seed()
+
+        self.assertIn("5 users, 3 channels, 4 posts, 50 comments", out)
+        self.assertEqual(len(comments), 50)
+        seeded = Comment.objects.exclude(pk=self.cm1.pk)
+        self.assertEqual(get_comment_tree('mptt').check(seeded), set())
+        self.assertEqual(get_comment_tree('path').check(seeded), set())
+        self.assertIn("channel: 0 drifted",
+                      self.call("reconcile_channel_counts", dry_run=True))
+        post = Post.objects.order_by('-pk').first()
+        self.assertEqual(post.hot_score,
+                         hot_score(post.rating, post.pub_date))
+        self.assertTrue(TimelineEntry.objects.exists())
+
+        # Ids are handed out past the seeded comments.
+        reply = Comment(text="reply", post=post, user=self.u1,
+                        parent=Comment.objects.filter(post=post).first())
+        get_comment_tree().insert(reply)
+        self.assertEqual(get_comment_tree('mptt').check(), set())
+
+    def test_same_seed_same_data(self):
+        self.assertEqual(self.seed(seed=3)[1], self.seed(seed=3)[1])
+        self.assertNotEqual(self.seed(seed=3)[1], self.seed(seed=4)[1])
+
+    def test_comments_are_dated_between_post_and_now(self):
+        self.seed()
+
+        for comment in Comment.objects.exclude(pk=self.cm1.pk).select_related(
+                'post', 'parent'):
+            self.assertGreaterEqual(comment.pub_date, comment.post.pub_date)
+            self.assertLessEqual(comment.pub_date, timezone.now())
+            if comment.parent:
+                self.assertGreaterEqual(comment.pub_date,
+                                        comment.parent.pub_date)
+
+    def test_votes_match_ratings(self):
+        self.seed(votes=3, zipf=1.2)
+
+        self.assertTrue(Comment.up_votes.through.objects.exists())
+        self.assertTrue(Post.down_votes.through.objects.exists())
+        out = self.call("reconcile_ratings")
+        self.assertIn("post: 0 fixed", out)
+        self.assertIn("comment: 0 fixed", out)
+
+    def test_nothing_to_spread_over(self):
+        with self.assertRaisesMessage(CommandError,
+                                      "--comments 5 needs --posts above 0"):
+            self.call("seed", bulk=True, posts=0, comments=5)
+        with self.assertRaisesMessage(CommandError,
+                                      "--posts 5 needs --channels above 0"):
+            self.call("seed", bulk=True, channels=0, posts=5)
+        self.assertEqual(seeding.spread(0, []), [])
+        with self.assertRaises(ValueError):
+            seeding.spread(5, [])
+
+    def test_thread_shapes(self):
+        rng = random.Random(0)
+
+        deep = seeding.thread_parents(rng, 3000, 'deep')
+        self.assertEqual(max(seeding.nested_sets(deep)[3]),
+                         seeding.MAX_LEVEL)
+
+        wide = seeding.thread_parents(rng, 500, 'wide')
+        self.assertGreater(Counter(wide).most_common(1)[0][1], 300)
@@ -0,0 +1,272 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from seenit.comment_backends import (MAX_LEVEL, get_comment_tree,
+                                     rebuild_paths)
+from seenit.comment_tree import (load_comment_tree, load_comment_page,
+                                 load_comment_subtree)
+from seenit.models import User, Post, Channel, Comment
+
+
+class CommentBackendTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test", email="test@test.com",
+                                        password="secret")
+        channel = Channel.objects.create(name="channel1")
+        self.post = Post.objects.create(title="post1", text="abcabc",
+                                        user=self.user, channel=channel)
+
+    def comment(self, text, parent=None):
+        comment = Comment(text=text, post=self.post, parent=parent,
+                          user=self.user)
+        get_comment_tree().insert(comment)
+        return comment
+
+
+@override_settings(SEENIT_COMMENT_TREE='path',
+                   SEENIT_ROOT_COMMENTS_PER_PAGE=2, SEENIT_COMMENT_DEPTH=3,
+                   SEENIT_COMMENT_REPLY_LIMIT=4)
+class PathCommentTreeTests(CommentBackendTestCase):
+    def test_insert_sets_path(self):
+        root = self.comment("root")
+        reply = self.comment("reply", root)
+
+        reply.refresh_from_db()
+        self.assertEqual(reply.path, f"{root.pk:010}{reply.pk:010}")
+        self.assertEqual(reply.level, 1)
+
+    def test_replies_below_max_level_rejected(self):
+        chain = [self.comment("root")]
+        for i in range(MAX_LEVEL):
+            chain.append(self.comment(f"reply {i}", chain[-1]))
+
+        with self.assertRaisesMessage(ValidationError, "too deep"):
+            self.comment("too deep", chain[-1])
+
+        self.assertFalse(Comment.objects.filter(text="too deep").exists())
+        self.assertEqual(get_comment_tree().check(), set())
+
+    @override_settings(SEENIT_COMMENT_TREE='mptt')
+    def test_mptt_replies_not_capped(self):
+        chain = [self.comment("root")]
+        for i in range(MAX_LEVEL):
+            chain.append(self.comment(f"reply {i}", chain[-1]))
+
+        reply = self.comment("deep", chain[-1])
+
+        reply.refresh_from_db()
+        self.assertEqual(reply.level, MAX_LEVEL + 1)
+        self.assertEqual(reply.parent_id, chain[-1].pk)
+
+    def test_tree_in_depth_first_order(self):
+        first = self.comment("first")
+        second = self.comment("second")
+        reply = self.comment("reply", first)
+
+        comments = load_comment_tree(self.post)
+
+        self.assertEqual(comments, [first, reply, second])
+        self.assertEqual(list(comments[0].get_children()), [reply])
+
+    def test_depth_cutoff(self):
+        chain = [self.comment("root")]
+        for i in range(4):
+            chain.append(self.comment(f"reply {i}", chain[-1]))
+
+        with self.assertNumQueries(4):
+            page, comments = load_comment_page(self.post)
+
+        self.assertEqual(comments, chain[:3])
+        self.assertTrue(comments[2].continue_thread)
+        self.assertFalse(comments[1].continue_thread)
+
+    def test_reply_limit_and_load_more(self):
+        busy = self.comment("busy root")
+        replies = [self.comment(f"reply {i}", busy) for i in range(6)]
+        quiet = self.comment("quiet root")
+        self.comment("reply", quiet)
+
+        page, comments = load_comment_page(self.post)
+
+        self.assertEqual(comments, [busy, *replies[:4], quiet])
+        self.assertEqual(comments[0].more_after, replies[3].path)
+        self.assertEqual(comments[-1].more_after, quiet.path)
+
+        tree = get_comment_tree()
+        after = tree.parse_position(comments[0].more_after)
+        comments = load_comment_subtree(self.post, busy, after)
+        self.assertEqual(comments, [busy, *replies[4:]])
+
+    def test_delete_removes_subtree(self):
+        root = self.comment("root")
+        reply = self.comment("reply", root)
+        self.comment("nested", reply)
+        other = self.comment("other", root)
+
+        get_comment_tree().delete(reply)
+
+        self.assertEqual(load_comment_tree(self.post), [root, other])
+
+    def test_parse_position(self):
+        tree = get_comment_tree()
+        with self.assertRaises(ValueError):
+            tree.parse_position("12")
+        with self.assertRaises(ValueError):
+            tree.parse_position("abcdefghij")
+
+
+class RebuildCommentTreeTests(CommentBackendTestCase):
+    def test_rebuild_paths_matches_mptt(self):
+        root = self.comment("root")
+        reply = self.comment("reply", root)
+        nested = self.comment("nested", reply)
+        Comment.objects.update(path='')
+
+        rebuild_paths(chunk_size=1)
+
+        nested.refresh_from_db()
+        self.assertEqual(nested.path,
+                         f"{root.pk:010}{reply.pk:010}{nested.pk:010}")
+
+    def test_switch_backends(self):
+        with override_settings(SEENIT_COMMENT_TREE='path'):
+            root = self.comment("root")
+            reply = self.comment("reply", root)
+            other = self.comment("other")
+
+        out = StringIO()
+        call_command("rebuild_comment_tree", "mptt", stdout=out)
+
+        self.assertIn("mptt: 3 comments rebuilt", out.getvalue())
+        root = Comment.objects.get(pk=root.pk)
+        self.assertEqual(list(root.get_children()), [reply])
+        self.assertEqual(
+            set(load_comment_tree(self.post)), {root, reply, other})
+
+    def test_threads_too_deep_for_paths_named(self):
+        root = self.comment("root")
+        deep = self.comment("deep", root)
+        Comment.objects.filter(pk=deep.pk).update(level=MAX_LEVEL + 1)
+
+        with self.assertRaisesMessage(CommandError,
+                                      f"Posts {self.post.pk} have"):
+            call_command("rebuild_comment_tree", "path", stdout=StringIO())
+
+
+class CheckCommentTreeTests(CommentBackendTestCase):
+    def test_detects_and_repairs_broken_mptt_tree(self):
+        root = self.comment("root")
+        reply = self.comment("reply", root)
+        self.comment("nested", reply)
+        other = self.comment("other root")
+        Comment.objects.filter(pk=reply.pk).update(lft=10, tree_id=99)
+        Comment.objects.filter(pk=other.pk).update(tree_id=root.tree_id)
+
+        out = StringIO()
+        call_command("check_comment_tree", stdout=out)
+        self.assertIn(f"post {self.post.pk}: broken comment tree",
+                      out.getvalue())
+        self.assertIn("mptt: 1 broken", out.getvalue())
+
+        out = StringIO()
+        call_command("check_comment_tree", repair=True, stdout=out)
+        self.assertIn("mptt: 1 repaired, 0 still broken", out.getvalue())
+        root = Comment.objects.get(pk=root.pk)
+        self.assertEqual([comment.text for comment in
+                          root.get_descendants(include_self=True)],
+                         ["root", "reply", "nested"])
+
+    @override_settings(SEENIT_COMMENT_TREE='path')
+    def test_detects_and_repairs_broken_paths(self):
+        root = self.comment("root")
+        reply = self.comment("reply", root)
+        Comment.objects.filter(pk=reply.pk).update(path="0000000001")
+        tree = get_comment_tree()
+
+        self.assertEqual(tree.check(), {self.post.pk})
+        tree.repair([self.post.pk])
+        self.assertEqual(tree.check(), set())
+
+
+class ConcurrentReplyTests(TransactionTestCase):
+    THREADS = 8
+    REPLIES = 15
+
+    def setUp(self):
+        self.user = User.objects.create(username="test",
+                                        email="test@test.com",
+                                        password="secret")
+        channel = Channel.objects.create(name="channel1")
+        self.posts = [Post.objects.create(title=f"post{i}", text="abcabc",
+                                          user=self.user, channel=channel)
+                      for i in range(2)]
+        self.roots = [Comment.objects.create(text="root", post=post,
+                                             user=self.user)
+                      for post in self.posts]
+
+    def reply(self, seed):
+        rng = random.Random(seed)
+        tree = get_comment_tree()
+        try:
+            for i in range(self.REPLIES):
+                post = rng.choice(self.posts)
+                parent_ids = list(Comment.objects.filter(post=post)
+                                  .values_list('pk', flat=True))
+                # A few new roots, which take the next tree id.
+                parent_id = rng.choice(parent_ids) if i % 5 else None
+                tree.insert(Comment(text=f"reply {seed} {i}", post=post,
+                                    parent_id=parent_id, user=self.user))
+        finally:
+            connection.close()
+
+    def test_trees_intact_after_concurrent_replies(self):
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            list(pool.map(self.reply, range(self.THREADS)))
+
+        self.assertEqual(Comment.objects.count(),
+                         len(self.roots) + self.THREADS * self.REPLIES)
+        self.assertEqual(get_comment_tree().check(), set())
+
+    def test_new_root_does_not_block_replies(self):
+        inserted, done = threading.Event(), threading.Event()
+        # In its own channel, so the two inserts share no counter row.
+        post = Post.objects.create(
+            title="post", text="abcabc", user=self.user,
+            channel=Channel.objects.create(name="channel2"))
+
+        def insert_root():
+            try:
+                with transaction.atomic():
+                    get_comment_tree().insert(Comment(
+                        text="new root", post=post, user=self.user))
+                    inserted.set()
+                    done.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=insert_root)
+        thread.start()
+        try:
+            self.assertTrue(inserted.wait(10))
+            with connection.cursor() as cursor:
+                cursor.execute("SET lock_timeout = '2s'")
+            get_comment_tree().insert(Comment(
+                text="reply", post=self.posts[0], parent=self.roots[0],
+                user=self.user))
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(
+            [root.tree_id for root in Comment.objects.filter(
+                parent=None).order_by('pk')],
+            [*(root.tree_id for root in self.roots),
+             self.roots[-1].tree_id + 1])
+        self.assertEqual(get_comment_tree().check(), set())
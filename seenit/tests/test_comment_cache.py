@@ -0,0 +1,224 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from seenit import comment_cache
+from seenit.comment_backends import get_comment_tree
+from seenit.models import User, Post, Channel, Comment
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+          'LOCATION': 'seenit-comment-cache-tests'}
+VERSIONS = {**LOCMEM, 'LOCATION': 'seenit-comment-version-tests'}
+
+
+@override_settings(CACHES={'default': LOCMEM, 'comments': LOCMEM,
+                           'comment_versions': VERSIONS})
+class CommentCacheTestCase(TestCase):
+    def setUp(self):
+        comment_cache.get_cache().clear()
+        comment_cache.get_version_cache().clear()
+        self.user = User.objects.create_user("test", "test@test.com",
+                                             "secret")
+        channel = Channel.objects.create(name="channel1")
+        self.post = Post.objects.create(title="post1", text="abcabc",
+                                        user=self.user, channel=channel)
+        self.root = self.comment("root")
+        self.first = self.comment("first", self.root)
+        self.second = self.comment("second", self.root)
+        self.other = self.comment("other root")
+        self.url = reverse("seenit:post_detail",
+                           kwargs={'channel_id': channel.pk,
+                                   'pk': self.post.pk})
+        self.client.login(username="test", password="secret")
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(text=text, post=self.post,
+                                      parent=parent, user=self.user)
+
+    def edit_behind_cache(self, *comments):
+        """Change comment texts without invalidating anything."""
+
+        for comment in comments:
+            Comment.objects.filter(pk=comment.pk).update(
+                text=f"edited {comment.text}")
+
+    def get(self):
+        return self.client.get(self.url).content.decode()
+
+
+class CommentCacheTests(CommentCacheTestCase):
+    def test_thread_is_served_from_cache(self):
+        self.get()
+        self.edit_behind_cache(self.root, self.first)
+
+        page = self.get()
+
+        self.assertIn(">root<", page)
+        self.assertNotIn("edited", page)
+
+    def test_vote_invalidates_only_ancestors(self):
+        self.get()
+        self.edit_behind_cache(self.root, self.first, self.second,
+                               self.other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.get(pk=self.first.pk).upvote(self.user)
+        page = self.get()
+
+        self.assertIn("edited root", page)
+        self.assertIn("edited first", page)
+        self.assertNotIn("edited second", page)
+        self.assertNotIn("edited other root", page)
+
+    def test_repeat_vote_does_not_invalidate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.get(pk=self.first.pk).upvote(self.user)
+        self.get()
+        self.edit_behind_cache(self.first)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Comment.objects.get(pk=self.first.pk).upvote(self.user)
+
+        self.assertEqual(callbacks, [])
+        self.assertNotIn("edited first", self.get())
+
+    def test_reply_invalidates_parents(self):
+        self.get()
+        self.edit_behind_cache(self.root, self.other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("seenit:reply",
+                        kwargs={"pk": self.second.pk,
+                                "channel_id": self.post.channel_id,
+                                "post_id": self.post.pk}),
+                data={"text": "new reply"})
+        page = self.get()
+
+        self.assertIn("new reply", page)
+        self.assertIn("edited root", page)
+        self.assertNotIn("edited other root", page)
+
+    def test_new_comment_keeps_subtrees(self):
+        self.get()
+        self.edit_behind_cache(self.root)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, data={"text": "new root comment"})
+        page = self.get()
+
+        self.assertIn("new root comment", page)
+        self.assertNotIn("edited root", page)
+
+    def test_cache_shared_between_users(self):
+        self.get()
+        self.edit_behind_cache(self.root)
+        User.objects.create_user("test2", "test2@test.com", "secret")
+
+        self.client.login(username="test2", password="secret")
+
+        self.assertNotIn("edited root", self.get())
+
+    def test_votes_and_csrf_token_filled_in_per_user(self):
+        upvote = reverse("seenit:upvote",
+                         kwargs={'pk': self.first.pk, 'post_type': 'comment'})
+        downvote = reverse("seenit:downvote",
+                           kwargs={'pk': self.first.pk,
+                                   'post_type': 'comment'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.get(pk=self.first.pk).upvote(self.user)
+        User.objects.create_user("test2", "test2@test.com", "secret")
+        self.client.login(username="test2", password="secret")
+        self.get()
+
+        self.client.login(username="test", password="secret")
+        response = self.client.get(self.url)
+        page = response.content.decode()
+
+        # The voted up arrow takes the vote back with a downvote.
+        self.assertNotIn(f'action="{upvote}"', page)
+        self.assertEqual(page.count(f'action="{downvote}"'), 2)
+        self.assertNotIn(comment_cache.CSRF_PLACEHOLDER, page)
+        self.assertIn(f'value="{response.context["csrf_token"]}"', page)
+
+    def test_csrf_placeholder_in_comment_text_left_alone(self):
+        self.comment(
+            f"says {comment_cache.CSRF_PLACEHOLDER} seenit-csrf-token")
+
+        response = self.client.get(self.url)
+        page = response.content.decode()
+
+        self.assertIn("says &lt;!--csrf--&gt; seenit-csrf-token", page)
+        token = str(response.context["csrf_token"])
+        self.assertEqual(page.count(token),
+                         page.count('name="csrfmiddlewaretoken"'))
+
+    def test_load_more_page_not_cached_as_whole_thread(self):
+        url = reverse("seenit:comment_thread",
+                      kwargs={'pk': self.root.pk,
+                              'channel_id': self.post.channel_id,
+                              'post_id': self.post.pk})
+        after = get_comment_tree().position(self.first)
+
+        page = self.client.get(url, {'after': after}).content.decode()
+        self.assertNotIn(">first<", page)
+
+        self.assertIn(">first<", self.client.get(url).content.decode())
+
+    def test_invalidate_comments(self):
+        self.get()
+        self.edit_behind_cache(self.root, self.second, self.other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comment_cache.invalidate_comments(Comment, [self.first.pk])
+        page = self.get()
+
+        self.assertIn("edited root", page)
+        self.assertNotIn("edited second", page)
+        self.assertNotIn("edited other root", page)
+
+    @override_settings(SEENIT_COMMENT_CACHE_TIMEOUT=30)
+    def test_versions_expire(self):
+        cache = comment_cache.get_version_cache()
+        with mock.patch.object(cache, 'set_many',
+                               wraps=cache.set_many) as set_many:
+            self.get()
+            with self.captureOnCommitCallbacks(execute=True):
+                comment_cache.invalidate_comment(self.first)
+
+        self.assertEqual(set_many.call_count, 2)
+        for call in set_many.call_args_list:
+            self.assertEqual(call.kwargs['timeout'], 60)
+
+
+class FileCommentCacheTests(CommentCacheTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(
+            CACHES={
+                'default': LOCMEM,
+                'comment_versions': VERSIONS,
+                'comments': {
+                    'BACKEND': 'django.core.cache.backends.filebased.'
+                               'FileBasedCache',
+                    'LOCATION': directory.name,
+                },
+            },
+            SEENIT_COMMENT_CACHE='comments')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        super().setUp()
+
+    def test_uses_configured_cache(self):
+        self.get()
+        self.edit_behind_cache(self.root)
+
+        self.assertNotIn("edited root", self.get())
+        self.assertTrue(os.listdir(self.directory))
+        self.assertTrue(comment_cache.get_version_cache().get(
+            comment_cache._version_key('post', self.post.pk)))
@@ -0,0 +1,172 @@
+from django.test import TestCase, override_settings
+
+from seenit.comment_tree import (load_comment_tree, load_comment_page,
+                                 load_comment_subtree)
+from seenit.models import User, Post, Channel, Comment
+
+
+class CommentTreeTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test", email="test@test.com",
+                                        password="secret")
+        channel = Channel.objects.create(name="channel1")
+        self.post = Post.objects.create(title="post1", text="abcabc",
+                                        user=self.user, channel=channel)
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(text=text, post=self.post,
+                                      parent=parent, user=self.user)
+
+    def chain(self, text, length, parent=None):
+        """Create a chain of length replies under parent."""
+
+        comments = []
+        for i in range(length):
+            parent = self.comment(f"{text} {i}", parent)
+            comments.append(parent)
+        return comments
+
+
+class LoadCommentTreeTests(CommentTreeTestCase):
+    def test_tree_is_linked_in_memory(self):
+        root = self.comment("root")
+        reply = self.comment("reply", root)
+        nested = self.comment("nested", reply)
+
+        with self.assertNumQueries(1):
+            comments = load_comment_tree(self.post)
+            self.assertEqual(comments, [root, reply, nested])
+            self.assertEqual(list(comments[0].get_children()), [reply])
+            self.assertEqual(comments[2].parent, reply)
+            self.assertEqual(comments[2].user, self.user)
+
+
+@override_settings(SEENIT_ROOT_COMMENTS_PER_PAGE=2, SEENIT_COMMENT_DEPTH=3,
+                   SEENIT_COMMENT_REPLY_LIMIT=4)
+class LoadCommentPageTests(CommentTreeTestCase):
+    def test_root_comments_are_paged(self):
+        roots = [self.comment(f"root {i}") for i in range(5)]
+
+        page, comments = load_comment_page(self.post, 3)
+
+        self.assertEqual(page.paginator.num_pages, 3)
+        self.assertEqual(comments, [roots[4]])
+
+    def test_depth_cutoff(self):
+        chain = self.chain("reply", 5)
+
+        page, comments = load_comment_page(self.post)
+
+        self.assertEqual(comments, chain[:3])
+        self.assertTrue(comments[2].continue_thread)
+        self.assertFalse(comments[1].continue_thread)
+
+    def test_reply_limit(self):
+        busy = self.comment("busy root")
+        for i in range(6):
+            self.comment(f"reply {i}", busy)
+        quiet = self.comment("quiet root")
+        self.comment("reply", quiet)
+        quiet, busy = (Comment.objects.get(pk=quiet.pk),
+                       Comment.objects.get(pk=busy.pk))
+        replies = list(busy.get_children())
+
+        with self.assertNumQueries(3):
+            page, comments = load_comment_page(self.post)
+
+        self.assertEqual(comments, [busy, *replies[:4], quiet])
+        self.assertEqual(comments[0].more_after, replies[3].lft)
+        self.assertEqual(comments[-1].more_after, quiet.lft)
+        self.assertIsNone(comments[1].more_after)
+
+    def test_subtree(self):
+        chain = self.chain("reply", 6)
+
+        comments = load_comment_subtree(self.post, chain[2])
+
+        self.assertEqual(comments, chain[2:5])
+        self.assertTrue(comments[-1].continue_thread)
+
+    def test_subtree_after(self):
+        root = self.comment("root")
+        reply = self.comment("reply", root)
+        nested = [self.comment(f"nested {i}", reply) for i in range(6)]
+        root = Comment.objects.get(pk=root.pk)
+        nested = Comment.objects.filter(parent=reply)
+
+        comments = load_comment_subtree(self.post, root, nested[3].lft)
+
+        self.assertEqual(comments, [root, reply, *nested[4:]])
+        self.assertIsNone(root.more_after)
+
+
+class SortCommentsTests(CommentTreeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.voters = [User.objects.create(username=f"voter{i}",
+                                           email=f"voter{i}@test.com",
+                                           password="secret")
+                       for i in range(4)]
+        self.root = self.comment("root")
+        self.old = self.comment("old", self.root)
+        self.new = self.comment("new", self.root)
+
+    def test_top_follows_live_ratings(self):
+        # Replies are stored in the order they were posted; votes have
+        # made new the top reply without moving it in the tree.
+        Comment.objects.filter(pk=self.new.pk).update(rating=5)
+
+        comments = load_comment_tree(self.post, 'top')
+
+        self.assertEqual(comments, [self.root, self.new, self.old])
+        self.assertEqual(list(comments[0].get_children()),
+                         [self.new, self.old])
+        self.assertEqual(load_comment_tree(self.post),
+                         [self.root, self.old, self.new])
+
+    @override_settings(SEENIT_COMMENT_REPLY_LIMIT=2)
+    def test_reply_limit_applies_before_sort(self):
+        # The limit keeps replies in stored order, so a later, higher rated
+        # reply waits for "load more" rather than pushing out earlier ones.
+        top = self.comment("top", self.root)
+        Comment.objects.filter(pk=top.pk).update(rating=5)
+        Comment.objects.filter(pk=self.new.pk).update(rating=1)
+
+        page, comments = load_comment_page(self.post, sort='top')
+
+        self.assertEqual(comments, [self.root, self.new, self.old])
+        self.assertEqual(comments[0].more_after, self.new.lft)
+
+    def test_new(self):
+        Comment.objects.filter(pk=self.old.pk).update(rating=5)
+        nested = self.comment("nested", self.old)
+
+        comments = load_comment_tree(self.post, 'new')
+
+        self.assertEqual(comments, [self.root, self.new, self.old, nested])
+
+    def test_controversial(self):
+        self.old.up_votes.add(*self.voters[:2])
+        self.old.down_votes.add(*self.voters[2:])
+        self.new.up_votes.add(*self.voters)
+
+        comments = load_comment_tree(self.post, 'controversial')
+
+        self.assertEqual(comments, [self.root, self.old, self.new])
+        self.assertEqual(comments[1].controversy, 4.0)
+        self.assertEqual(comments[2].controversy, 0.0)
+
+    @override_settings(SEENIT_ROOT_COMMENTS_PER_PAGE=1)
+    def test_roots_paged_in_sort_order(self):
+        popular = self.comment("popular")
+        Comment.objects.filter(pk=popular.pk).update(rating=10)
+
+        with self.assertNumQueries(3):
+            page, comments = load_comment_page(self.post, 1, 'top')
+        self.assertEqual(comments, [popular])
+
+        page, comments = load_comment_page(self.post, 1, 'new')
+        self.assertEqual(comments, [popular])
+
+        page, comments = load_comment_page(self.post, 2, 'new')
+        self.assertEqual(comments, [self.root, self.new, self.old])
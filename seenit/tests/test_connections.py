@@ -0,0 +1,95 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from urllib.request import Request, urlopen
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import LiveServerTestCase
+from django.urls import reverse
+
+from seenit.models import Channel, User
+
+
+class ConnectionReuseTests(LiveServerTestCase):
+    """Serve concurrent requests with the threaded live server (a thread
+    per request) and check which database connections they used.
+    """
+
+    requests = 12
+    clients = 4
+
+    def setUp(self):
+        user = User.objects.create_user("test", "test@test.com", "secret")
+        channel = Channel.objects.create(name="channel1")
+        self.client.force_login(user)
+        self.cookie = f"sessionid={self.client.cookies['sessionid'].value}"
+        self.url = self.live_server_url + reverse(
+            "seenit:channel_detail", kwargs={'pk': channel.pk})
+
+        self.pids = []
+        connection_created.connect(self.record)
+        self.addCleanup(connection_created.disconnect, self.record)
+
+    def record(self, sender, connection, **kwargs):
+        if threading.current_thread() is not threading.main_thread():
+            self.pids.append(connection.connection.info.backend_pid)
+
+    def configure(self, **settings):
+        # Server threads open their connections from this same dict.
+        patch = mock.patch.dict(connection.settings_dict, settings)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def serve(self):
+        def get(_):
+            request = Request(self.url, headers={'Cookie': self.cookie})
+            with urlopen(request) as response:
+                return response.status
+
+        with ThreadPoolExecutor(self.clients) as executor:
+            statuses = list(executor.map(get, range(self.requests)))
+        self.assertEqual(statuses, [200] * self.requests)
+
+    def states(self, pids):
+        """Return {pid: state} for the server connections in pids that are
+        still open.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pid, state FROM pg_stat_activity "
+                           "WHERE pid = ANY(%s)", [list(pids)])
+            return dict(cursor.fetchall())
+
+    def wait_for(self, condition):
+        # Connections are released after the response has been sent.
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(condition())
+
+    def test_pooled_connections_reused_and_released(self):
+        self.configure(CONN_MAX_AGE=0, OPTIONS={
+            'pool': {'min_size': 1, 'max_size': 2, 'timeout': 10}})
+        self.addCleanup(connection.close_pools)
+
+        self.serve()
+
+        pool = connection.pool
+        self.assertEqual(len(self.pids), self.requests)
+        self.assertLessEqual(len(set(self.pids)), 2)
+        self.wait_for(lambda: pool.get_stats()['pool_available']
+                      == pool.get_stats()['pool_size'])
+        self.assertEqual(set(self.states(self.pids).values()), {'idle'})
+
+        connection.close_pools()
+        self.assertEqual(self.states(self.pids), {})
+
+    def test_unpooled_connections_closed_after_each_request(self):
+        self.configure(CONN_MAX_AGE=0, OPTIONS={})
+
+        self.serve()
+
+        self.assertEqual(len(set(self.pids)), self.requests)
+        self.wait_for(lambda: not self.states(self.pids))
@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from seenit.models import Channel, Comment, Post, User
+
+
+@override_settings(SEENIT_INSTRUMENTATION=True)
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("test", "test@test.com",
+                                             "secret")
+        self.channel = Channel.objects.create(name="channel1")
+        self.post = Post.objects.create(title="post1", text="text",
+                                        user=self.user, channel=self.channel)
+        self.client.force_login(self.user)
+        self.url = reverse("seenit:channel_detail",
+                           kwargs={'pk': self.channel.pk})
+
+    def timings(self, response):
+        return {entry.split(';')[0]: entry.split(';')[1:]
+                for entry in response['Server-Timing'].split(', ')}
+
+    def test_server_timing_header(self):
+        with self.assertNumQueries(7):
+            response = self.client.get(self.url)
+
+        timings = self.timings(response)
+        self.assertEqual(list(timings), ['db', 'template', 'view', 'total'])
+        self.assertEqual(timings['db'][1], 'desc="7 queries"')
+        total = sum(float(timings[name][0][4:])
+                    for name in ('db', 'template', 'view'))
+        self.assertAlmostEqual(total, float(timings['total'][0][4:]),
+                               delta=0.2)
+        self.assertGreater(float(timings['template'][0][4:]), 0)
+
+    def test_logged(self):
+        with self.assertLogs('seenit.instrumentation', 'INFO') as logs:
+            self.client.get(self.url)
+
+        record = logs.records[0]
+        self.assertEqual(record.levelname, 'INFO')
+        self.assertEqual(record.timing['route'], 'seenit:channel_detail')
+        self.assertEqual(record.timing['queries'], 7)
+        self.assertIn('route=seenit:channel_detail', record.getMessage())
+
+    @override_settings(SEENIT_QUERY_BUDGET=5)
+    def test_over_budget_warns(self):
+        with self.assertLogs('seenit.instrumentation', 'INFO') as logs:
+            self.client.get(self.url)
+
+        record = logs.records[0]
+        self.assertEqual(record.levelname, 'WARNING')
+        self.assertEqual(record.timing['over_budget'], ['queries'])
+        self.assertIn('over_budget=queries', record.getMessage())
+
+    @override_settings(SEENIT_INSTRUMENTATION=False)
+    def test_off(self):
+        response = self.client.get(self.url)
+
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(SEENIT_TEMPLATE_BREAKDOWN=True)
+    def test_template_breakdown(self):
+        for i in range(3):
+            Comment.objects.create(text=f"comment{i}", post=self.post,
+                                   user=self.user)
+        url = reverse("seenit:post_detail",
+                      kwargs={'channel_id': self.channel.pk,
+                              'pk': self.post.pk})
+
+        with self.assertLogs('seenit.instrumentation', 'DEBUG') as logs:
+            response = self.client.get(url)
+
+        templates = logs.records[0].timing['templates']
+        self.assertEqual(templates['seenit/post_detail.html']['renders'], 1)
+        self.assertEqual(templates['comment_template.html']['renders'], 1)
+        self.assertEqual(templates['comment_rating_base.html']['renders'], 3)
+        self.assertEqual(templates['tailwind/uni_form.html']['renders'], 2)
+        self.assertIn('template=comment_rating_base.html renders=3',
+                      '\n'.join(logs.output))
+        timings = self.timings(response)
+        self.assertIn('tpl1', timings)
+        self.assertIn('desc="seenit/post_detail.html x1"',
+                      response['Server-Timing'])
+        self.assertGreaterEqual(
+            float(timings['tpl1'][0][4:]),
+            max(template['ms'] for template in templates.values()) - 0.1)
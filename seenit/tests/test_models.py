@@ -1,13 +1,19 @@
 import sys
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 sys.path.append('../seenit')
 
-from seenit.models import User, Post, Channel, Comment
+from seenit import subscriptions
+from seenit.comment_backends import get_comment_tree
+from seenit.models import User, Post, Channel, Comment, TimelineEntry
 
 
 class ModelsTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         u1 = User(username="test", email="test@test.com", password="secret")
         u2 = User(username="test2", email="test2@test.com", password="secret")
         u1.save()
@@ -83,6 +89,135 @@ class ChannelModelTests(ModelsTestCase):
 
         self.assertTrue(channel.determine_if_user_subscribed(user))
 
+    def test_subscription_set_cached_until_changed(self):
+        c1 = Channel.objects.get(id=self.c1_id)
+        c2 = Channel.objects.get(id=self.c2_id)
+        user = User.objects.get(id=self.u1_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            subscriptions.subscribe(user, c1)
+
+        user = User.objects.get(id=self.u1_id)
+        with self.assertNumQueries(1):
+            self.assertTrue(c1.determine_if_user_subscribed(user))
+            self.assertFalse(c2.determine_if_user_subscribed(user))
+        # A new request's user object: served from the cache.
+        user = User.objects.get(id=self.u1_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(subscriptions.subscribed_channel_ids(user),
+                             {c1.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            subscriptions.unsubscribe(user, c1)
+            subscriptions.subscribe(user, c2)
+        self.assertEqual(subscriptions.subscribed_channel_ids(user),
+                         {c2.pk})
+
+    def test_subscribed_users_changes_are_counted(self):
+        c1 = Channel.objects.get(id=self.c1_id)
+        c2 = Channel.objects.get(id=self.c2_id)
+        u1 = User.objects.get(id=self.u1_id)
+        u2 = User.objects.get(id=self.u2_id)
+
+        c1.subscribed_users.add(u1, u2)
+        u1.subscribed_channels.add(c2)
+        c1.subscribed_users.remove(u2, u2)
+        self.assertEqual(
+            list(Channel.objects.order_by('pk').values_list(
+                'subscriber_count', flat=True)), [1, 1])
+        self.assertEqual(subscriptions.subscribed_channel_ids(u1),
+                         {c1.pk, c2.pk})
+        self.assertEqual(TimelineEntry.objects.filter(user=u1).count(), 2)
+        u1.subscribed_channels.clear()
+
+        self.assertEqual(
+            list(Channel.objects.order_by('pk').values_list(
+                'subscriber_count', flat=True)), [0, 0])
+        self.assertEqual(subscriptions.subscribed_channel_ids(u1), set())
+        self.assertFalse(TimelineEntry.objects.filter(user=u1).exists())
+
+    def test_post_and_comment_counts(self):
+        channel = Channel.objects.get(id=self.c1_id)
+        self.assertEqual(channel.post_count, 2)
+        self.assertEqual(channel.comment_count, 1)
+
+        post = Post.objects.get(id=self.p1_id)
+        root = Comment.objects.get(id=self.cm1_id)
+        reply = Comment(text="reply", post=post, parent=root,
+                        user_id=self.u2_id)
+        get_comment_tree().insert(reply)
+        Comment.objects.create(text="nested", post=post, parent=reply,
+                               user_id=self.u2_id)
+        channel.refresh_from_db()
+        self.assertEqual(channel.comment_count, 3)
+
+        get_comment_tree().delete(reply)
+        channel.refresh_from_db()
+        self.assertEqual(channel.comment_count, 1)
+        self.assertEqual(Channel.objects.get(id=self.c2_id).comment_count, 0)
+
+    def test_deletes_are_uncounted(self):
+        post = Post.objects.get(id=self.p1_id)
+        other = Post.objects.get(id=self.p2_id)
+        root = Comment.objects.get(id=self.cm1_id)
+        Comment.objects.create(text="reply", post=post, parent=root,
+                               user_id=self.u2_id)
+        Comment.objects.create(text="other", post=other, user_id=self.u2_id)
+
+        # As the admin deletes: a queryset, with the reply as a cascade.
+        Comment.objects.filter(pk=root.pk).delete()
+        channel = Channel.objects.get(id=self.c1_id)
+        self.assertEqual((channel.post_count, channel.comment_count), (2, 1))
+
+        other.delete()
+        channel.refresh_from_db()
+        self.assertEqual((channel.post_count, channel.comment_count), (1, 0))
+
+    def test_queryset_deletes_uncounted_once_per_channel(self):
+        post = Post.objects.get(id=self.p1_id)
+        c2 = Channel.objects.get(id=self.c2_id)
+        other = Post.objects.create(title="post3", text="abcabc",
+                                    user_id=self.u2_id, channel=c2)
+        for i in range(5):
+            Comment.objects.create(text=f"comment {i}", post=post,
+                                   user_id=self.u2_id)
+            Comment.objects.create(text=f"other {i}", post=other,
+                                   user_id=self.u2_id)
+
+        with CaptureQueriesContext(connection) as deleted:
+            Post.objects.filter(pk__in=[post.pk, other.pk]).delete()
+
+        self.assertEqual(
+            list(Channel.objects.order_by('pk').values_list(
+                'post_count', 'comment_count')), [(1, 0), (0, 0)])
+        updates = [query['sql'] for query in deleted.captured_queries
+                   if query['sql'].startswith('UPDATE "seenit_channel"')]
+        self.assertEqual(len(updates), 2)
+
+    def test_cascaded_deletes_uncounted(self):
+        post = Post.objects.get(id=self.p1_id)
+        Comment.objects.create(text="reply", post=post, user_id=self.u2_id)
+        Post.objects.create(title="post3", text="abcabc",
+                            user_id=self.u2_id, channel_id=self.c1_id)
+
+        User.objects.get(id=self.u2_id).delete()
+
+        channel = Channel.objects.get(id=self.c1_id)
+        self.assertEqual((channel.post_count, channel.comment_count), (2, 1))
+
+    def test_subscriber_count(self):
+        channel = Channel.objects.get(id=self.c1_id)
+        user = User.objects.get(id=self.u1_id)
+
+        self.assertTrue(subscriptions.subscribe(user, channel))
+        self.assertFalse(subscriptions.subscribe(user, channel))
+        self.assertEqual(channel.subscriber_count, 1)
+        self.assertTrue(channel.determine_if_user_subscribed(user))
+
+        self.assertTrue(subscriptions.unsubscribe(user, channel))
+        self.assertFalse(subscriptions.unsubscribe(user, channel))
+        channel.refresh_from_db()
+        self.assertEqual(channel.subscriber_count, 0)
+
 
 class PostModelTests(ModelsTestCase):
     def test_post_model(self):
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from seenit.models import User, Post, Channel
+from seenit.pagination import encode_cursor, keyset_page
+
+
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test", email="test@test.com",
+                                        password="secret")
+        self.channel = Channel.objects.create(name="channel1")
+        now = timezone.now()
+        # Ratings and dates repeat, so only the id breaks some ties.
+        self.posts = [Post.objects.create(title=f"post{i}", text="abcabc",
+                                          rating=i % 3, user=self.user,
+                                          channel=self.channel,
+                                          pub_date=now - timedelta(
+                                              hours=i % 2))
+                      for i in range(7)]
+        self.ordering = Post._meta.ordering
+
+    def test_pages_follow_ordering(self):
+        expected = list(Post.objects.all())
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_page(Post.objects.all(), self.ordering, cursor,
+                               per_page=3)
+            seen += page
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(seen, expected)
+
+    def test_every_page_is_one_query(self):
+        page = keyset_page(Post.objects.all(), self.ordering, per_page=2)
+        self.assertFalse(page.has_previous())
+
+        with self.assertNumQueries(1):
+            page = keyset_page(Post.objects.all(), self.ordering,
+                               page.next_cursor, per_page=2)
+        self.assertTrue(page.has_previous())
+        self.assertEqual(len(page), 2)
+
+    def test_invalid_cursor_is_first_page(self):
+        first = keyset_page(Post.objects.all(), self.ordering, per_page=2)
+
+        for cursor in ["!!", encode_cursor([1, 2]),
+                       encode_cursor(["a", "b", "c"])]:
+            page = keyset_page(Post.objects.all(), self.ordering, cursor,
+                               per_page=2)
+            self.assertEqual(page.object_list, first.object_list)
+            self.assertFalse(page.has_previous())
+
+    def test_mixed_directions_rejected(self):
+        with self.assertRaises(ValueError):
+            keyset_page(Post.objects.all(), ['-rating', 'id'])
@@ -0,0 +1,69 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from seenit.models import Channel, User
+from seenit.profiling import captured_profiles
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(SEENIT_PROFILER=True,
+                                     SEENIT_PROFILE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user("test", "test@test.com",
+                                             "secret", is_staff=True)
+        self.channel = Channel.objects.create(name="channel1")
+        self.url = reverse("seenit:channel_detail",
+                           kwargs={'pk': self.channel.pk})
+        self.client.force_login(self.user)
+
+    def show_profiles(self, *args, **kwargs):
+        out = StringIO()
+        call_command("show_profiles", *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_profiles_flagged_requests(self):
+        self.client.get(self.url)
+        self.assertEqual(captured_profiles(), [])
+
+        self.client.get(self.url, {'profile': 1})
+        response = self.client.get(self.url,
+                                   headers={'X-Seenit-Profile': '1'})
+
+        profiles = captured_profiles()
+        self.assertEqual([route for _, route, _ in profiles],
+                         ['seenit:channel_detail'] * 2)
+        self.assertEqual(response['X-Seenit-Profile'], profiles[0][0].name)
+        self.assertTrue(profiles[0][0].name.startswith(
+            'seenit.channel_detail-'))
+
+    def test_staff_only(self):
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.get(self.url, {'profile': 1})
+
+        self.assertFalse(response.has_header('X-Seenit-Profile'))
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_show_profiles(self):
+        self.assertIn("No profiles", self.show_profiles())
+        name = self.client.get(self.url, {'profile': 1})['X-Seenit-Profile']
+
+        self.assertIn(name, self.show_profiles())
+        self.assertIn(name, self.show_profiles(
+            route='seenit:channel_detail'))
+        self.assertIn("No profiles", self.show_profiles(route='seenit:home'))
+        self.assertIn("function calls", self.show_profiles(name, limit=5))
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from seenit.models import User, Post, Channel
+from seenit.ranking import HOT_DECAY, hot_expression, hot_score
+from seenit.vote_buffer import VoteBuffer
+
+
+class HotScoreTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test", email="test@test.com",
+                                        password="secret")
+        self.channel = Channel.objects.create(name="channel1")
+        self.now = timezone.now()
+
+    def post(self, rating=0, age=timedelta()):
+        return Post.objects.create(title="post", text="abcabc", rating=rating,
+                                   user=self.user, channel=self.channel,
+                                   pub_date=self.now - age)
+
+    def test_newer_posts_need_fewer_votes(self):
+        old = hot_score(100, self.now - timedelta(seconds=HOT_DECAY))
+        self.assertAlmostEqual(hot_score(10, self.now), old)
+        self.assertGreater(hot_score(0, self.now), hot_score(-10, self.now))
+        self.assertGreater(hot_score(-100, self.now),
+                           hot_score(-100, self.now - timedelta(days=1)))
+
+    def test_sql_matches_python(self):
+        for rating in (-50, -1, 0, 1, 7, 12345):
+            post = self.post(rating, timedelta(hours=rating % 24))
+            score = Post.objects.annotate(score=hot_expression()).get(
+                pk=post.pk).score
+            self.assertAlmostEqual(score, post.hot_score, places=6)
+
+    def test_votes_update_hot_score(self):
+        post = self.post()
+        voter = User.objects.create(username="voter", email="v@test.com",
+                                    password="secret")
+
+        post.upvote(voter)
+
+        stored = Post.objects.get(pk=post.pk).hot_score
+        self.assertAlmostEqual(stored, hot_score(1, post.pub_date), places=6)
+        self.assertAlmostEqual(post.hot_score, stored, places=6)
+
+    @override_settings(SEENIT_VOTE_FLUSH_INTERVAL=0)
+    def test_buffered_votes_update_hot_score(self):
+        post = self.post()
+        buffer = VoteBuffer()
+        for i in range(10):
+            voter = User.objects.create(username=f"voter{i}",
+                                        email=f"v{i}@test.com",
+                                        password="secret")
+            buffer.upvote(Post, post.pk, voter)
+        buffer.flush()
+
+        self.assertAlmostEqual(Post.objects.get(pk=post.pk).hot_score,
+                               hot_score(10, post.pub_date), places=6)
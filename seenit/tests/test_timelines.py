@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from seenit import subscriptions, timelines
+from seenit.models import Channel, Post, TimelineEntry, User
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f"user{i}",
+                                          email=f"user{i}@test.com",
+                                          password="secret")
+                      for i in range(3)]
+        self.channel = Channel.objects.create(name="channel1")
+        self.start = timezone.now() - timedelta(days=1)
+
+    def post(self, title, minutes, channel=None):
+        post = Post.objects.create(
+            title=title, text="text", user=self.users[0],
+            channel=channel or self.channel,
+            pub_date=self.start + timedelta(minutes=minutes))
+        timelines.fan_out(post)
+        return post
+
+    def titles(self, user, cursor=None, per_page=25):
+        page = timelines.timeline_page(user, cursor, per_page)
+        return [post.title for post in page], page
+
+    @override_settings(SEENIT_TIMELINE_BATCH_SIZE=2)
+    def test_fan_out_to_subscribers_in_batches(self):
+        for user in self.users:
+            subscriptions.subscribe(user, self.channel)
+
+        post = self.post("new", 1)
+
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post=post)
+                .values_list('user_id', flat=True)),
+            {user.pk for user in self.users})
+
+    @override_settings(SEENIT_TIMELINE_LENGTH=3)
+    def test_timelines_capped(self):
+        subscriptions.subscribe(self.users[0], self.channel)
+        for i in range(5):
+            self.post(f"post {i}", i)
+
+        self.assertEqual(self.titles(self.users[0])[0],
+                         ["post 4", "post 3", "post 2"])
+        self.assertEqual(TimelineEntry.objects.count(), 3)
+
+    def test_rebuilt_on_subscribe_and_unsubscribe(self):
+        other = Channel.objects.create(name="channel2")
+        self.post("before subscribing", 0)
+        self.post("other channel", 1, other)
+        user = self.users[0]
+
+        subscriptions.subscribe(user, self.channel)
+        subscriptions.subscribe(user, other)
+        self.assertEqual(self.titles(user)[0],
+                         ["other channel", "before subscribing"])
+
+        subscriptions.unsubscribe(user, other)
+        self.assertEqual(self.titles(user)[0], ["before subscribing"])
+
+    def test_pages(self):
+        subscriptions.subscribe(self.users[0], self.channel)
+        for i in range(5):
+            self.post(f"post {i}", i)
+
+        titles, page = self.titles(self.users[0], per_page=2)
+        self.assertEqual(titles, ["post 4", "post 3"])
+        titles, page = self.titles(self.users[0], page.next_cursor, 2)
+        self.assertEqual(titles, ["post 2", "post 1"])
+        titles, page = self.titles(self.users[0], page.next_cursor, 2)
+        self.assertEqual(titles, ["post 0"])
+        self.assertFalse(page.has_next())
+
+    @override_settings(SEENIT_TIMELINE_FANOUT_LIMIT=1)
+    def test_large_channels_read_at_request_time(self):
+        large = Channel.objects.create(name="large")
+        user = self.users[0]
+        subscriptions.subscribe(user, self.channel)
+        subscriptions.subscribe(user, large)
+        subscriptions.subscribe(self.users[1], large)
+        for i in range(4):
+            self.post(f"post {i}", i, large if i % 2 else None)
+
+        self.assertFalse(TimelineEntry.objects.filter(post__channel=large))
+        titles, page = self.titles(user, per_page=3)
+        self.assertEqual(titles, ["post 3", "post 2", "post 1"])
+        titles, page = self.titles(user, page.next_cursor, 3)
+        self.assertEqual(titles, ["post 0"])
+
+    def test_read_is_two_queries(self):
+        subscriptions.subscribe(self.users[0], self.channel)
+        for i in range(3):
+            self.post(f"post {i}", i)
+
+        with self.assertNumQueries(2):
+            page = timelines.timeline_page(self.users[0])
+            for post in page:
+                post.user.username, post.channel.name
@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from seenit import urls, view_benchmarks
+
+
+class ViewBenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_every_route_benchmarked(self):
+        self.assertEqual(
+            {pattern.name for pattern in urls.urlpatterns},
+            {route.name for route in view_benchmarks.ROUTES})
+
+    def test_no_query_regressions(self):
+        dataset = view_benchmarks.seed('small')
+        results = view_benchmarks.measure(dataset, repeat=1, memory=False)
+        baseline = view_benchmarks.load_baselines()['small']
+
+        self.assertEqual(set(results), set(baseline))
+        # Times and memory vary by machine; query counts may not, either
+        # way.
+        queries = {label: {'queries': result['queries']}
+                   for label, result in results.items()}
+        self.assertEqual(view_benchmarks.regressions(queries, baseline), [])
+        self.assertEqual(
+            view_benchmarks.stale_baselines(queries, baseline), [])
+
+    def test_regressions(self):
+        baseline = {'home': {'queries': 4, 'ms': 10.0, 'peak_kb': 100.0}}
+
+        self.assertEqual(view_benchmarks.regressions(
+            {'home': {'queries': 4, 'ms': 19.0, 'peak_kb': 150.0}},
+            baseline, threshold=0.5), [])
+        self.assertEqual(view_benchmarks.regressions(
+            {'home': {'queries': 5, 'ms': 21.0, 'peak_kb': 100.0}},
+            baseline, threshold=0.5),
+            ['home: 5 queries, baseline 4', 'home: ms 21.0, baseline 10.0'])
+
+    def test_stale_baselines(self):
+        baseline = {'home': {'queries': 4}, 'search': {'queries': 2}}
+
+        self.assertEqual(view_benchmarks.stale_baselines(
+            {'home': {'queries': 3}, 'search': {'queries': 3},
+             'new': {'queries': 1}}, baseline),
+            ['home: 3 queries, baseline 4'])
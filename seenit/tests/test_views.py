@@ -1,12 +1,21 @@
 from seenit.models import User, Channel, Post, Comment
 from seenit.forms import ChannelForm, PostForm, CommentForm
+from seenit.comment_backends import MAX_LEVEL
+from seenit.comment_tree import SORTS
 
-from django.test import TestCase
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 
 class ViewsTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         user = User.objects.create_user("test", "test@test.com", "secret")
         user.save()
 
@@ -106,6 +115,43 @@ class UserDetailViewTests(ViewsTestCase):
         self.assertQuerySetEqual(response.context['top_posts'], [post])
         self.assertEqual(response.context['object'], user)
 
+    def subscribe_to_channels(self, count, start=0):
+        user = User.objects.get(id=self.user_id)
+        for i in range(start, start + count):
+            channel = Channel.objects.create(name=f"subscribed {i}")
+            channel.subscribed_users.add(user)
+            for j in range(3):
+                author = User.objects.create_user(
+                    f"author {i} {j}", f"author{i}.{j}@test.com", "secret")
+                Post.objects.create(title=f"post {i} {j}", text="text",
+                                    rating=j, user=author, channel=channel)
+
+    def test_channel_highlights(self):
+        self.client.login(username="test", password="secret")
+        self.subscribe_to_channels(2)
+
+        response = self.client.get(
+            reverse("seenit:user_detail", kwargs={'pk': self.user_id}))
+
+        self.assertEqual(
+            [[post.title for post in posts]
+             for posts in response.context['channel_highlights']],
+            [["post 0 2", "post 0 1"], ["post 1 2", "post 1 1"]])
+
+    def test_highlights_query_count_independent_of_subscriptions(self):
+        self.client.login(username="test", password="secret")
+        url = reverse("seenit:user_detail", kwargs={'pk': self.user_id})
+        self.subscribe_to_channels(1)
+        with CaptureQueriesContext(connection) as one_channel:
+            self.client.get(url)
+
+        self.subscribe_to_channels(5, start=1)
+        with CaptureQueriesContext(connection) as many_channels:
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.context['channel_highlights']), 6)
+        self.assertEqual(len(many_channels), len(one_channel))
+
 
 class ChannelCreateViewTests(ViewsTestCase):
     def test_call_view_logged_out(self):
@@ -154,6 +200,62 @@ class ChannelListViewTests(ViewsTestCase):
         self.assertIsInstance(response.context['form'], ChannelForm)
         self.assertQuerySetEqual(response.context['channel_list'], channels)
 
+    @override_settings(SEENIT_CHANNELS_PER_PAGE=2)
+    def test_channels_paginated_by_name(self):
+        self.client.login(username="test", password="secret")
+        for name in ["delta", "alpha", "charlie"]:
+            Channel.objects.create(name=name)
+        url = reverse("seenit:channels")
+
+        response = self.client.get(url)
+        page = response.context['page']
+        self.assertEqual([channel.name for channel in page],
+                         ["alpha", "charlie"])
+
+        response = self.client.get(url, {'after': page.next_cursor})
+        page = response.context['page']
+        self.assertEqual([channel.name for channel in page],
+                         ["delta", "test channel"])
+        self.assertFalse(page.has_next())
+
+    def test_search(self):
+        self.client.login(username="test", password="secret")
+        for name in ["django", "python", "mango", "dance"]:
+            Channel.objects.create(name=name)
+        url = reverse("seenit:channels")
+
+        def names(q):
+            response = self.client.get(url, {'q': q})
+            return [channel.name for channel in response.context['page']]
+
+        self.assertEqual(names("ANGO"), ["django", "mango"])
+        # Short searches match prefixes only.
+        self.assertEqual(names("d"), ["dance", "django"])
+        self.assertEqual(names("an"), [])
+        self.assertEqual(names(""), ["dance", "django", "mango", "python",
+                                     "test channel"])
+
+    def test_counts_without_aggregate_queries(self):
+        self.client.login(username="test", password="secret")
+        url = reverse("seenit:channels")
+        # Loads the cached subscription set.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as one_channel:
+            self.client.get(url)
+
+        user = User.objects.get(pk=self.user_id)
+        for i in range(3):
+            channel = Channel.objects.create(name=f"channel {i}")
+            Post.objects.create(title="post", text="text", channel=channel,
+                                user=user)
+        with CaptureQueriesContext(connection) as more_channels:
+            response = self.client.get(url)
+
+        self.assertContains(response, "1 post,")
+        self.assertEqual(len(more_channels), len(one_channel))
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in more_channels.captured_queries))
+
 
 class ChannelDetailViewTests(ViewsTestCase):
     def test_call_view_logged_out(self):
@@ -182,6 +284,61 @@ class ChannelDetailViewTests(ViewsTestCase):
         self.assertIsInstance(response.context['form'], PostForm)
         self.assertEqual(response.context['user_subscribed'], False)
 
+    def test_subscription_state_after_subscribing(self):
+        self.client.login(username="test", password="secret")
+        url = reverse("seenit:channel_detail", kwargs={'pk': self.channel_id})
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("seenit:subscribe",
+                        kwargs={'user_id': self.user_id,
+                                'channel_id': self.channel_id}))
+        response = self.client.get(url)
+
+        self.assertEqual(response.context['user_subscribed'], True)
+
+    @override_settings(SEENIT_POSTS_PER_PAGE=2)
+    def test_posts_keyset_paginated(self):
+        self.client.login(username="test", password="secret")
+        for i in range(4):
+            User.objects.create_user(f"author{i}", f"author{i}@test.com",
+                                     "secret").posts.create(
+                title=f"paged post {i}", text="text",
+                channel_id=self.channel_id)
+        url = reverse("seenit:channel_detail", kwargs={'pk': self.channel_id})
+
+        with CaptureQueriesContext(connection) as first_page:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['posts']), 2)
+        self.assertNotContains(response, "Back to top")
+        response = self.client.get(
+            url, {'after': response.context['page'].next_cursor})
+
+        with CaptureQueriesContext(connection) as last_page:
+            response = self.client.get(
+                url, {'after': response.context['page'].next_cursor})
+        self.assertEqual(len(response.context['posts']), 1)
+        self.assertFalse(response.context['page'].has_next())
+        self.assertContains(response, "Back to top")
+        self.assertEqual(len(last_page), len(first_page))
+
+    def test_hot_sort(self):
+        self.client.login(username="test", password="secret")
+        user = User.objects.get(pk=self.user_id)
+        old = Post.objects.create(title="old popular", text="text",
+                                  rating=50, user=user,
+                                  channel_id=self.channel_id,
+                                  pub_date=timezone.now() - timedelta(days=3))
+        url = reverse("seenit:channel_detail", kwargs={'pk': self.channel_id})
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['posts'][0], old)
+
+        response = self.client.get(url, {'sort': 'hot'})
+        self.assertEqual(response.context['sort'], 'hot')
+        self.assertEqual(response.context['posts'][-1], old)
+
 
 class ChannelDetailFormViewTests(ViewsTestCase):
     def test_call_view_logged_out(self):
@@ -206,6 +363,24 @@ class ChannelDetailFormViewTests(ViewsTestCase):
         self.assertTemplateUsed(response, 'seenit/channel_detail.html')
         self.assertContains(response, "new post title")
 
+    def test_new_post_in_subscriber_timelines(self):
+        self.client.login(username="test", password="secret")
+        self.client.post(
+            reverse("seenit:subscribe",
+                    kwargs={'user_id': self.user_id,
+                            'channel_id': self.channel_id}))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("seenit:channel_detail",
+                        kwargs={"pk": self.channel_id}),
+                data={"title": "new post title", "text": "new post text"})
+
+        response = self.client.get(
+            reverse("seenit:user_detail", kwargs={'pk': self.user_id}))
+
+        self.assertEqual([post.title for post in response.context['timeline']],
+                         ["new post title", "post title"])
+
 
 class SubscribeViewTests(ViewsTestCase):
     def test_call_view_logged_out(self):
@@ -308,6 +483,142 @@ class PostDetailViewTests(ViewsTestCase):
         self.assertEqual(response.context['post_id'], self.post_id)
         self.assertIsInstance(response.context['form'], CommentForm)
         self.assertQuerySetEqual(response.context['comments'], comments)
+        self.assertEqual(response.context['sort'], 'top')
+
+    def test_sort_param(self):
+        self.client.login(username="test", password="secret")
+        url = reverse("seenit:post_detail",
+                      kwargs={'channel_id': self.channel_id,
+                              'pk': self.post_id})
+
+        response = self.client.get(url, {'sort': 'controversial'})
+        self.assertEqual(response.context['sort'], 'controversial')
+        self.assertContains(response, '<span class="font-bold">'
+                                      'controversial</span>', html=True)
+
+        response = self.client.get(url, {'sort': 'bogus'})
+        self.assertEqual(response.context['sort'], 'top')
+
+    def test_logged_in_vote_states(self):
+        user = User.objects.get(id=self.user_id)
+        Post.objects.get(id=self.post_id).upvote(user)
+        Comment.objects.get(id=self.comment_id).downvote(user)
+
+        self.client.login(username="test", password="secret")
+        response = self.client.get(
+            reverse("seenit:post_detail",
+                    kwargs={'channel_id': self.channel_id,
+                            'pk': self.post_id}))
+
+        self.assertEqual(response.context['post'].user_vote, 1)
+        self.assertEqual(response.context['comments'][0].user_vote, -1)
+
+    def test_reply_form_rendered_once(self):
+        post = Post.objects.get(pk=self.post_id)
+        user = User.objects.get(pk=self.user_id)
+        for i in range(5):
+            Comment.objects.create(text=f"comment {i}", post=post, user=user)
+
+        self.client.login(username="test", password="secret")
+        response = self.client.get(
+            reverse("seenit:post_detail",
+                    kwargs={'channel_id': self.channel_id,
+                            'pk': self.post_id}))
+
+        # Once for new comments, once for the reply form template.
+        self.assertEqual([template.name for template in response.templates]
+                         .count('tailwind/uni_form.html'), 2)
+        self.assertContains(response, 'id="reply-form-template"', count=1)
+        self.assertContains(response, 'class="reply-form"', count=1)
+        self.assertContains(response, 'data-comment-id=', count=6)
+        self.assertContains(response, reverse(
+            "seenit:reply", kwargs={'channel_id': self.channel_id,
+                                    'post_id': self.post_id, 'pk': 0}))
+
+    @override_settings(CACHES=dict.fromkeys(
+        ['default', 'comments', 'comment_versions'],
+        {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}))
+    def test_query_count_independent_of_thread_size(self):
+        self.client.login(username="test", password="secret")
+        url = reverse("seenit:post_detail",
+                      kwargs={'channel_id': self.channel_id,
+                              'pk': self.post_id})
+
+        with CaptureQueriesContext(connection) as small_thread:
+            self.client.get(url)
+
+        user = User.objects.create_user("test2", "test2@test.com", "secret")
+        post = Post.objects.get(pk=self.post_id)
+        parent = Comment.objects.get(pk=self.comment_id)
+        for i in range(30):
+            parent = Comment.objects.create(
+                text=f"reply {i}", post=post, parent=parent,
+                user=user if i % 2 else parent.user)
+            if i < 10:
+                Comment.objects.create(text=f"sibling {i}", post=post,
+                                       user=user)
+
+        with CaptureQueriesContext(connection) as large_thread:
+            response = self.client.get(url)
+
+        self.assertContains(response, "sibling 9")
+        self.assertContains(response, "Continue this thread")
+        self.assertEqual(len(large_thread), len(small_thread))
+
+
+class CommentThreadViewTests(ViewsTestCase):
+    def test_call_view_logged_out(self):
+        response = self.client.get(
+            reverse("seenit:comment_thread",
+                    kwargs={'channel_id': 1, 'post_id': 1, 'pk': 1}))
+        self.assertEqual(response.status_code, 302)
+
+    def test_call_view_logged_in_success(self):
+        post = Post.objects.get(pk=self.post_id)
+        parent = Comment.objects.get(pk=self.comment_id)
+        reply = Comment.objects.create(text="reply text", post=post,
+                                       parent=parent, user=parent.user)
+
+        self.client.login(username="test", password="secret")
+        response = self.client.get(
+            reverse("seenit:comment_thread",
+                    kwargs={'channel_id': self.channel_id,
+                            'post_id': self.post_id,
+                            'pk': self.comment_id}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'seenit/comment_thread.html')
+        self.assertContains(response, "post title")
+        self.assertEqual(response.context['comments'], [parent, reply])
+
+    def test_sorts(self):
+        post = Post.objects.get(pk=self.post_id)
+        parent = Comment.objects.get(pk=self.comment_id)
+        reply = Comment.objects.create(text="reply text", post=post,
+                                       parent=parent, user=parent.user)
+        url = reverse("seenit:comment_thread",
+                      kwargs={'channel_id': self.channel_id,
+                              'post_id': self.post_id,
+                              'pk': self.comment_id})
+
+        self.client.login(username="test", password="secret")
+        for sort in SORTS:
+            with self.subTest(sort=sort):
+                response = self.client.get(url, {'sort': sort})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['sort'], sort)
+                self.assertEqual(response.context['comments'],
+                                 [parent, reply])
+
+    def test_wrong_post(self):
+        self.client.login(username="test", password="secret")
+        response = self.client.get(
+            reverse("seenit:comment_thread",
+                    kwargs={'channel_id': self.channel_id,
+                            'post_id': self.post_id + 1,
+                            'pk': self.comment_id}))
+
+        self.assertEqual(response.status_code, 404)
 
 
 class PostDetailFormViewTests(ViewsTestCase):
@@ -364,3 +675,36 @@ class HandleReplyTests(ViewsTestCase):
 
         self.assertTemplateUsed(response, 'seenit/post_detail.html')
         self.assertContains(response, "new reply text")
+
+    @override_settings(SEENIT_COMMENT_TREE='path')
+    def test_reply_too_deep(self):
+        Comment.objects.filter(pk=self.comment_id).update(level=MAX_LEVEL)
+
+        self.client.login(username="test", password="secret")
+        response = self.client.post(
+            reverse("seenit:reply",
+                    kwargs={"pk": self.comment_id,
+                            'channel_id': self.channel_id,
+                            'post_id': self.post_id}),
+            data={"text": "deep reply"},
+            follow=True)
+
+        self.assertTemplateUsed(response, 'seenit/post_detail.html')
+        self.assertContains(response, "This thread is too deep to reply to.")
+        self.assertFalse(Comment.objects.filter(text="deep reply").exists())
+
+    def test_reply_to_comment_on_other_post(self):
+        self.client.login(username="test", password="secret")
+        other = Post.objects.create(title="other", text="other",
+                                    channel_id=self.channel_id,
+                                    user_id=self.user_id)
+        response = self.client.post(
+            reverse("seenit:reply",
+                    kwargs={"pk": self.comment_id,
+                            'channel_id': self.channel_id,
+                            'post_id': other.pk}),
+            data={"text": "misplaced reply"})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Comment.objects.filter(text="misplaced reply")
+                         .exists())
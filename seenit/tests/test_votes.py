@@ -0,0 +1,240 @@
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test import (TestCase, TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
+from django.urls import reverse
+
+from seenit import votes
+from seenit.models import User, Post, Channel, Comment
+from seenit.vote_buffer import VoteBuffer, vote_buffer
+
+
+class VotesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test", email="test@test.com",
+                                        password="secret")
+        channel = Channel.objects.create(name="channel1")
+        self.post = Post.objects.create(title="post1", text="abcabc",
+                                        user=self.user, channel=channel)
+        self.comment = Comment.objects.create(text="comment1",
+                                              post=self.post, user=self.user)
+
+
+class VoteServiceTests(VotesTestCase):
+    def test_repeat_upvote_is_idempotent(self):
+        self.assertEqual(votes.upvote(self.post, self.user), 1)
+        self.assertEqual(votes.upvote(self.post, self.user), 0)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 1)
+        self.assertEqual(self.post.up_votes.count(), 1)
+
+    def test_repeat_downvote_is_idempotent(self):
+        self.assertEqual(votes.downvote(self.comment, self.user), -1)
+        self.assertEqual(votes.downvote(self.comment, self.user), 0)
+
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.rating, -1)
+        self.assertEqual(self.comment.down_votes.count(), 1)
+
+    def test_at_most_one_vote_per_user(self):
+        votes.upvote(self.post, self.user)
+        votes.downvote(self.post, self.user)
+        votes.downvote(self.post, self.user)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, -1)
+        self.assertFalse(self.post.up_votes.exists())
+        self.assertEqual(self.post.down_votes.count(), 1)
+
+    def test_rating_update_is_relative(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        Post.objects.filter(pk=self.post.pk).update(rating=10)
+
+        votes.upvote(stale, self.user)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 11)
+
+
+class VoteStateTests(VotesTestCase):
+    def test_vote_states(self):
+        other = Comment.objects.create(text="comment2", post=self.post,
+                                       user=self.user)
+        unvoted = Comment.objects.create(text="comment3", post=self.post,
+                                         user=self.user)
+        votes.upvote(self.comment, self.user)
+        votes.downvote(other, self.user)
+
+        with self.assertNumQueries(2):
+            states = votes.vote_states(
+                Comment, [self.comment.pk, other.pk, unvoted.pk], self.user)
+
+        self.assertEqual(states, {self.comment.pk: 1, other.pk: -1})
+
+    def test_annotate_vote_states(self):
+        votes.downvote(self.post, self.user)
+
+        posts = votes.annotate_vote_states(Post.objects.all(), self.user)
+
+        self.assertEqual([post.user_vote for post in posts], [-1])
+
+    def test_anonymous_user_has_no_votes(self):
+        with self.assertNumQueries(0):
+            states = votes.vote_states(Post, [self.post.pk], AnonymousUser())
+
+        self.assertEqual(states, {})
+
+
+@override_settings(SEENIT_VOTE_FLUSH_INTERVAL=0)
+class VoteBufferTests(VotesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = VoteBuffer()
+        self.other = User.objects.create(username="test2",
+                                         email="test2@test.com",
+                                         password="secret")
+        # The views queue on the module's buffer: drain it before the
+        # test's transaction is rolled back.
+        self.addCleanup(vote_buffer.stop)
+
+    def test_votes_are_written_on_flush(self):
+        self.buffer.upvote(Post, self.post.pk, self.user)
+        self.buffer.upvote(Post, self.post.pk, self.other)
+        self.buffer.downvote(Comment, self.comment.pk, self.user)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 0)
+        self.assertEqual(len(self.buffer), 3)
+
+        self.assertEqual(self.buffer.flush(), 3)
+
+        self.post.refresh_from_db()
+        self.comment.refresh_from_db()
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.post.rating, 2)
+        self.assertEqual(self.post.up_votes.count(), 2)
+        self.assertEqual(self.comment.rating, -1)
+        self.assertIn(self.user, self.comment.down_votes.all())
+
+    def test_flush_matches_direct_votes(self):
+        self.post.down_votes.add(self.user)
+        Post.objects.filter(pk=self.post.pk).update(rating=-1)
+
+        for step in (1, 1, 1, -1, -1, 1):
+            self.buffer.add(Post, self.post.pk, self.user, step)
+        self.buffer.flush()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 0)
+        self.assertFalse(self.post.up_votes.exists())
+        self.assertFalse(self.post.down_votes.exists())
+
+    def test_flush_uses_constant_queries(self):
+        for _ in range(50):
+            self.buffer.upvote(Post, self.post.pk, self.user)
+            self.buffer.upvote(Post, self.post.pk, self.other)
+
+        # savepoint, lock users, load items, 2 vote table reads,
+        # vote row insert, rating update, release savepoint
+        with self.assertNumQueries(8):
+            self.buffer.flush()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 2)
+
+    def test_stop_flushes_pending_votes(self):
+        self.buffer.upvote(Comment, self.comment.pk, self.user)
+        self.buffer.stop()
+
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.rating, 1)
+
+    def test_sigterm_flushes_then_calls_previous_handler(self):
+        signals = []
+        previous = signal.signal(signal.SIGTERM,
+                                 lambda signum, frame: signals.append(signum))
+        self.addCleanup(signal.signal, signal.SIGTERM, previous)
+        self.buffer.flush_on_sigterm()
+        self.buffer.upvote(Comment, self.comment.pk, self.user)
+
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.rating, 1)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(signals, [signal.SIGTERM])
+
+    def test_votes_on_deleted_items_are_dropped(self):
+        self.buffer.upvote(Comment, self.comment.pk, self.user)
+        self.comment.delete()
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(len(self.buffer), 0)
+
+    @override_settings(SEENIT_VOTE_BUFFER=True)
+    def test_vote_view_buffers(self):
+        self.user.set_password("secret")
+        self.user.save()
+        self.client.login(username="test", password="secret")
+
+        self.client.post(
+            reverse("seenit:upvote",
+                    kwargs={"post_type": "post", "pk": self.post.pk}),
+            HTTP_REFERER="/")
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 0)
+
+        vote_buffer.flush()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating, 1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentVoteTests(TransactionTestCase):
+    THREADS = 8
+    VOTERS = 40
+
+    def setUp(self):
+        author = User.objects.create(username="author",
+                                     email="author@test.com",
+                                     password="secret")
+        channel = Channel.objects.create(name="hot channel")
+        self.post = Post.objects.create(title="hot post", text="abcabc",
+                                        user=author, channel=channel)
+        self.voters = [User.objects.create(username=f"voter{i}",
+                                           email=f"voter{i}@test.com",
+                                           password="secret")
+                       for i in range(self.VOTERS)]
+
+    def vote(self, args):
+        index, voter = args
+        try:
+            post = Post.objects.get(pk=self.post.pk)
+            # Every voter votes several times, with repeats and reversals,
+            # so the threads contend on both the post row and the vote rows.
+            for _ in range(3):
+                votes.upvote(post, voter)
+                if index % 2:
+                    votes.downvote(post, voter)
+            if index % 3 == 0:
+                votes.downvote(post, voter)
+        finally:
+            connection.close()
+
+    def test_hot_post_rating_matches_vote_rows(self):
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            list(pool.map(self.vote, enumerate(self.voters)))
+
+        post = Post.objects.get(pk=self.post.pk)
+        up_votes = post.up_votes.count()
+        down_votes = post.down_votes.count()
+
+        self.assertEqual(post.rating, up_votes - down_votes)
+        self.assertFalse(post.up_votes.filter(
+            pk__in=post.down_votes.values('pk')).exists())
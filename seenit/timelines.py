@@ -0,0 +1,142 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .bulk import copy_rows
+from .models import Channel, Post, TimelineEntry
+from .pagination import KeysetPage, encode_cursor, keyset_page
+
+# Timelines run newest first. Entries and posts are both ordered by
+# (pub_date, post id), so one cursor pages through either.
+ENTRY_ORDERING = ['-pub_date', '-post_id']
+POST_ORDERING = ['-pub_date', '-id']
+
+
+def fan_out(post):
+    """Add post to the timelines of its channel's subscribers, in batches
+    of SEENIT_TIMELINE_BATCH_SIZE, trimming each to SEENIT_TIMELINE_LENGTH.
+
+    Channels with more than SEENIT_TIMELINE_FANOUT_LIMIT subscribers are
+    skipped: their posts are read when the timeline is (see timeline_page).
+    Return the number of timelines written to.
+    """
+
+    if _is_large(post.channel):
+        return 0
+    batch_size = getattr(settings, 'SEENIT_TIMELINE_BATCH_SIZE', 1000)
+    subscribers = (Channel.subscribed_users.through.objects
+                   .filter(channel_id=post.channel_id)
+                   .order_by('user_id').values_list('user_id', flat=True))
+
+    count = 0
+    last = 0
+    while True:
+        user_ids = list(subscribers.filter(user_id__gt=last)[:batch_size])
+        if not user_ids:
+            return count
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                [TimelineEntry(user_id=user_id, post_id=post.pk,
+                               pub_date=post.pub_date)
+                 for user_id in user_ids], ignore_conflicts=True)
+            _trim(user_ids)
+        count += len(user_ids)
+        last = user_ids[-1]
+
+
+def fan_out_on_commit(post):
+    """Fan post out (see fan_out) once the transaction saving it commits,
+    so a post that is rolled back never reaches a timeline.
+    """
+
+    transaction.on_commit(partial(fan_out, post))
+
+
+def rebuild(user):
+    """Refill user's timeline with the newest SEENIT_TIMELINE_LENGTH posts
+    from the channels they subscribe to that are fanned out.
+    """
+
+    rebuild_many([user.pk])
+
+
+def rebuild_many(user_ids):
+    """Rebuild the timelines of user_ids, reading their posts with one
+    query.
+    """
+
+    length = getattr(settings, 'SEENIT_TIMELINE_LENGTH', 500)
+    limit = getattr(settings, 'SEENIT_TIMELINE_FANOUT_LIMIT', 10000)
+    rows = (Post.objects
+            .filter(channel__subscribed_users__in=user_ids,
+                    channel__subscriber_count__lte=limit)
+            .annotate(subscriber=F('channel__subscribed_users'))
+            .annotate(position=Window(
+                RowNumber(), partition_by=F('subscriber'),
+                order_by=[F(field[1:]).desc() for field in POST_ORDERING]))
+            .filter(position__lte=length)
+            .order_by()
+            .values_list('subscriber', 'pk', 'pub_date'))
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id__in=user_ids).delete()
+        copy_rows(TimelineEntry, ('user_id', 'post_id', 'pub_date'),
+                  list(rows))
+
+
+def timeline_page(user, cursor=None, per_page=25):
+    """Return the page of user's timeline, as a KeysetPage of posts, that
+    follows cursor (the first page if cursor is None or invalid).
+
+    Stored entries are one range scan of the timeline index. Posts from
+    subscribed channels too large to fan out are read from the channels
+    and merged in.
+    """
+
+    entries = keyset_page(
+        TimelineEntry.objects.filter(user=user)
+        .select_related('post__user', 'post__channel'),
+        ENTRY_ORDERING, cursor, per_page)
+    limit = getattr(settings, 'SEENIT_TIMELINE_FANOUT_LIMIT', 10000)
+    large = (Channel.objects
+             .filter(subscribed_users=user, subscriber_count__gt=limit)
+             .values('pk'))
+    posts = keyset_page(
+        Post.objects.filter(channel__in=large)
+        .select_related('user', 'channel'),
+        POST_ORDERING, entries.cursor, per_page)
+
+    by_pk = {post.pk: post for post in posts}
+    # A channel that has grown past the limit can have a post both ways.
+    for entry in entries:
+        by_pk.setdefault(entry.post_id, entry.post)
+    merged = sorted(by_pk.values(),
+                    key=lambda post: (post.pub_date, post.pk), reverse=True)
+
+    next_cursor = None
+    if len(merged) > per_page or entries.has_next() or posts.has_next():
+        del merged[per_page:]
+        last = merged[-1]
+        next_cursor = encode_cursor([last.pub_date, last.pk])
+    return KeysetPage(merged, entries.cursor, next_cursor)
+
+
+def _is_large(channel):
+    limit = getattr(settings, 'SEENIT_TIMELINE_FANOUT_LIMIT', 10000)
+    return channel.subscriber_count > limit
+
+
+def _trim(user_ids):
+    """Delete the entries past SEENIT_TIMELINE_LENGTH in the timelines of
+    user_ids.
+    """
+
+    length = getattr(settings, 'SEENIT_TIMELINE_LENGTH', 500)
+    overflow = (TimelineEntry.objects.filter(user_id__in=user_ids)
+                .annotate(position=Window(
+                    RowNumber(), partition_by=F('user'),
+                    order_by=[F('pub_date').desc(), F('post_id').desc()]))
+                .filter(position__gt=length).values_list('pk', flat=True))
+    TimelineEntry.objects.filter(pk__in=list(overflow)).delete()
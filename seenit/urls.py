@@ -22,6 +22,9 @@ urlpatterns = [
          login_required(views.PostView.as_view()), name="post_detail"),
     path("channels/<int:channel_id>/posts/<int:post_id>/comment/<int:pk>/",
          views.handle_reply, name="reply"),
+    path("channels/<int:channel_id>/posts/<int:post_id>/comments/<int:pk>/",
+         login_required(views.CommentThreadView.as_view()),
+         name="comment_thread"),
     path("<str:post_type>/<int:pk>/upvote/", views.upvote, name="upvote"),
     path("<str:post_type>/<int:pk>/downvote/", views.downvote,
          name="downvote"),
@@ -0,0 +1,236 @@
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from . import seeding
+from .models import Channel, Comment, Post, User
+
+# Datasets the routes are measured on, as seeding.seed arguments.
+SIZES = {
+    'small': dict(users=50, channels=10, posts=50, comments=2000),
+    'medium': dict(users=1000, channels=100, posts=2000, comments=100000),
+    'large': dict(users=10000, channels=1000, posts=20000,
+                  comments=1000000),
+}
+SEED = 0
+WORKLOAD = dict(zipf=1.0, votes=2)
+
+BASELINES = Path(__file__).resolve().parent / 'view_baselines.json'
+# Time and memory may grow by this share of their baseline, plus the
+# slack below, before a route counts as regressed. Query counts may not
+# grow at all.
+THRESHOLD = 0.5
+SLACK = {'ms': 5.0, 'peak_kb': 64.0}
+
+
+class Route:
+    """A request to benchmark: the view's URL name, the method, and
+    functions of the Dataset giving the URL kwargs and POST data.
+    Requests that write are rolled back.
+    """
+
+    def __init__(self, name, kwargs=None, method='get', data=None,
+                 label=None):
+        self.name = name
+        self.kwargs = kwargs or (lambda dataset: {})
+        self.method = method
+        self.data = data or (lambda dataset: {})
+        self.label = label or (name if method == 'get'
+                               else f'{name}:{method}')
+
+    def request(self, client, dataset):
+        url = reverse(f'seenit:{self.name}', kwargs=self.kwargs(dataset))
+        return getattr(client, self.method)(url, self.data(dataset),
+                                            HTTP_REFERER='/')
+
+
+def _post(dataset):
+    return {'channel_id': dataset.channel.pk, 'pk': dataset.post.pk}
+
+
+def _comment(dataset):
+    return {'channel_id': dataset.channel.pk, 'post_id': dataset.post.pk,
+            'pk': dataset.comment.pk}
+
+
+def _subscription(dataset):
+    return {'user_id': dataset.user.pk, 'channel_id': dataset.channel.pk}
+
+
+# One or more requests for every URL in seenit.urls, on the busiest user,
+# channel, post and thread of the dataset.
+ROUTES = [
+    Route('home'),
+    Route('register'),
+    Route('user_detail', lambda dataset: {'pk': dataset.user.pk}),
+    Route('create_channel', method='post',
+          data=lambda dataset: {'name': 'benchmark channel'}),
+    Route('channels'),
+    Route('channel_detail', lambda dataset: {'pk': dataset.channel.pk}),
+    Route('channel_detail', lambda dataset: {'pk': dataset.channel.pk},
+          method='post',
+          data=lambda dataset: {'title': 'benchmark', 'text': 'benchmark'}),
+    Route('post_detail', _post),
+    Route('post_detail', _post, method='post',
+          data=lambda dataset: {'text': 'benchmark'}),
+    Route('reply', _comment, method='post',
+          data=lambda dataset: {'text': 'benchmark'}),
+    Route('comment_thread', _comment),
+    Route('upvote', lambda dataset: {'post_type': 'post',
+                                     'pk': dataset.post.pk},
+          method='post'),
+    Route('downvote', lambda dataset: {'post_type': 'comment',
+                                       'pk': dataset.comment.pk},
+          method='post'),
+    Route('subscribe', _subscription, method='post'),
+    Route('unsubscribe', _subscription, method='post'),
+]
+
+
+class Dataset:
+    """The objects routes are requested on, picked from a seeded dataset:
+    the most active user, the most popular channel, its most commented
+    post and that post's biggest thread.
+    """
+
+    def __init__(self, first_user, first_channel):
+        self.user = User.objects.filter(pk__gte=first_user).order_by(
+            'pk').first()
+        self.channel = Channel.objects.filter(pk__gte=first_channel).order_by(
+            '-post_count', 'pk').first()
+        self.post = (Post.objects.filter(channel=self.channel)
+                     .annotate(comment_total=Count('comments'))
+                     .order_by('-comment_total', 'pk').first())
+        self.comment = (Comment.objects.filter(post=self.post, level=0)
+                        .order_by(F('rght') - F('lft'), 'pk').last())
+
+
+def seed(size):
+    """Seed the dataset size (see SIZES) and return its Dataset."""
+
+    first_user = (User.objects.aggregate(high=Max('pk'))['high'] or 0) + 1
+    first_channel = (Channel.objects.aggregate(high=Max('pk'))['high']
+                     or 0) + 1
+    seeding.seed(**SIZES[size], seed=SEED, **WORKLOAD)
+    if connection.vendor == 'postgresql':
+        # The seed is rolled back, so autovacuum never sees it: without
+        # fresh statistics, plans (and times) depend on whatever the
+        # database held before.
+        tables = [model._meta.db_table for model in
+                  apps.get_app_config('seenit').get_models(
+                      include_auto_created=True)]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE ' + ', '.join(
+                connection.ops.quote_name(table) for table in tables))
+    return Dataset(first_user, first_channel)
+
+
+def measure(dataset, routes=ROUTES, repeat=5, memory=True):
+    """Request each route repeat times, after one warm-up request, as the
+    dataset's user.
+    Return {route label: {'queries', 'ms', 'peak_kb'}}: the most queries
+    any request ran, the median wall time and the peak memory allocated
+    during one request (if memory is true; tracing slows requests, so it
+    is measured apart from the time).
+    """
+
+    client = Client()
+    client.force_login(dataset.user)
+    results = {}
+    # The test client's host, which the test runner allows.
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS,
+                                          'testserver']):
+        for route in routes:
+            results[route.label] = _measure(route, client, dataset, repeat,
+                                            memory)
+    return results
+
+
+def _measure(route, client, dataset, repeat, memory):
+    # Warms the caches, so every timed request finds the same state.
+    _request(route, client, dataset)
+    queries, times = 0, []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            _request(route, client, dataset)
+            times.append((time.perf_counter() - start) * 1000)
+        queries = max(queries, len(captured))
+    result = {'queries': queries, 'ms': round(statistics.median(times),
+                                              2)}
+    if memory:
+        tracemalloc.start()
+        try:
+            _request(route, client, dataset)
+            result['peak_kb'] = round(
+                tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def _request(route, client, dataset):
+    with transaction.atomic():
+        response = route.request(client, dataset)
+        if response.status_code >= 400:
+            raise AssertionError(f'{route.label}: {response.status_code}')
+        if route.method != 'get':
+            transaction.set_rollback(True)
+    return response
+
+
+def regressions(results, baseline, threshold=THRESHOLD):
+    """Return a line for each measurement in results past its baseline:
+    any extra query, or time or memory past threshold.
+    """
+
+    lines = []
+    for label, result in sorted(results.items()):
+        expected = baseline.get(label)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            lines.append(f"{label}: {result['queries']} queries, baseline "
+                         f"{expected['queries']}")
+        for key, slack in SLACK.items():
+            if key not in result or key not in expected:
+                continue
+            limit = expected[key] * (1 + threshold) + slack
+            if result[key] > limit:
+                lines.append(f'{label}: {key} {result[key]}, baseline '
+                             f'{expected[key]}')
+    return lines
+
+
+def stale_baselines(results, baseline):
+    """Return a line for each measurement in results with fewer queries
+    than its baseline, which then no longer catches them coming back.
+    """
+
+    return [f"{label}: {result['queries']} queries, baseline "
+            f"{baseline[label]['queries']}"
+            for label, result in sorted(results.items())
+            if label in baseline
+            and result['queries'] < baseline[label]['queries']]
+
+
+def load_baselines(path=BASELINES):
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines, path=BASELINES):
+    Path(path).write_text(json.dumps(baselines, indent=2, sort_keys=True)
+                          + '\n')
@@ -1,3 +1,6 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.http import HttpResponseForbidden, HttpResponseNotFound
 from django.shortcuts import (render, redirect, HttpResponseRedirect,
                               get_object_or_404)
@@ -9,8 +12,16 @@ from django.views import View
 from django.views.generic.detail import SingleObjectMixin
 from django.views.generic import ListView, DetailView, FormView
 
+from . import comment_cache, subscriptions, timelines
+from .comment_backends import get_comment_tree
+from .comment_tree import (SORTS, annotate_sort, get_sort,
+                           load_comment_page, load_comment_subtree)
 from .forms import RegisterForm, PostForm, CommentForm, ChannelForm
 from .models import User, Channel, Post, Comment
+from .pagination import keyset_page
+from .ranking import FEED_SORTS, get_feed_sort, top_per_channel
+from .vote_buffer import vote_buffer
+from .votes import annotate_vote_states
 
 ###############################################################################
 # Homepage
@@ -54,13 +65,32 @@ class UserDetailView(DetailView):
     """Show user details page"""
 
     model = User
+    highlights_per_channel = 2
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        subscribed_channels = self.object.subscribed_channels.all()
-        context['channel_highlights'] = [channel.posts.all()[:2]
-                                         for channel in subscribed_channels]
-        context['top_posts'] = self.object.get_top_posts()
+        sort = get_feed_sort(self.request.GET.get('sort'))
+        channel_highlights = top_per_channel(
+            Post.objects.filter(channel__subscribed_users=self.object)
+            .select_related('user', 'channel'),
+            FEED_SORTS[sort], self.highlights_per_channel)
+        top_posts = list(self.object.get_top_posts())
+        timeline = None
+        if self.object == self.request.user:
+            timeline = timelines.timeline_page(
+                self.object, self.request.GET.get('after'),
+                getattr(settings, 'SEENIT_POSTS_PER_PAGE', 25))
+        annotate_vote_states(
+            [post for posts in channel_highlights for post in posts]
+            + top_posts + list(timeline or []), self.request.user)
+        context['channel_highlights'] = channel_highlights
+        context['top_posts'] = top_posts
+        context['timeline'] = timeline
+        if timeline is not None:
+            context['subscribed_channels'] = list(
+                self.object.subscribed_channels.all())
+        context['sort'] = sort
+        context['sorts'] = FEED_SORTS
         return context
 
 ###############################################################################
@@ -81,18 +111,37 @@ def create_channel(request):
 
 
 class ChannelListView(ListView):
-    """Display a list of all channels"""
+    """Display channels by name, a page at a time, optionally filtered by
+    a search on their names
+    """
 
     template_name = 'seenit/channel_list.html'
     context_object_name = 'channel_list'
+    # Shorter searches match name prefixes only: too short for the trigram
+    # index, a substring search would scan every channel.
+    substring_min_length = 3
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        page = keyset_page(
+            self.object_list, ['name'], self.request.GET.get('after'),
+            getattr(settings, 'SEENIT_CHANNELS_PER_PAGE', 50))
+        context['page'] = page
+        context['channel_list'] = page.object_list
+        context['q'] = self.request.GET.get('q', '').strip()
         context['form'] = ChannelForm()
+        context['subscribed_channel_ids'] = (
+            subscriptions.subscribed_channel_ids(self.request.user))
         return context
 
     def get_queryset(self):
-        return Channel.objects.all()
+        channels = Channel.objects.all()
+        q = self.request.GET.get('q', '').strip()
+        if len(q) >= self.substring_min_length:
+            channels = channels.filter(name__icontains=q)
+        elif q:
+            channels = channels.filter(name__istartswith=q)
+        return channels
 
 
 class ChannelDetailView(DetailView):
@@ -104,6 +153,15 @@ class ChannelDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         context['channel_id'] = self.kwargs['pk']
         context['form'] = PostForm()
+        sort = get_feed_sort(self.request.GET.get('sort'))
+        page = keyset_page(
+            self.object.posts.select_related('user'), FEED_SORTS[sort],
+            self.request.GET.get('after'),
+            getattr(settings, 'SEENIT_POSTS_PER_PAGE', 25))
+        context['page'] = page
+        context['sort'] = sort
+        context['sorts'] = FEED_SORTS
+        context['posts'] = annotate_vote_states(page, self.request.user)
         user_subscribed = self.object.determine_if_user_subscribed(
             self.request.user)
 
@@ -133,7 +191,9 @@ class ChannelDetailFormView(SingleObjectMixin, FormView):
         user = User.objects.get(pk=self.request.user.pk)
         post = Post(title=title, text=text,
                     user=user, channel=self.object)
-        post.save()
+        with transaction.atomic():
+            post.save()
+            timelines.fan_out_on_commit(post)
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -162,7 +222,7 @@ def subscribe(request, **kwargs):
         user_id = kwargs['user_id']
         user = get_object_or_404(User, pk=user_id)
         channel = get_object_or_404(Channel, pk=channel_id)
-        user.subscribed_channels.add(channel)
+        subscriptions.subscribe(user, channel)
         return HttpResponseRedirect(reverse("seenit:channel_detail",
                                             kwargs={"pk": channel_id}))
     return HttpResponseForbidden()
@@ -178,7 +238,7 @@ def unsubscribe(request, **kwargs):
         user_id = kwargs['user_id']
         user = get_object_or_404(User, pk=user_id)
         channel = get_object_or_404(Channel, pk=channel_id)
-        user.subscribed_channels.remove(channel)
+        subscriptions.unsubscribe(user, channel)
         return HttpResponseRedirect(reverse("seenit:channel_detail",
                                             kwargs={"pk": channel_id}))
     return HttpResponseForbidden()
@@ -191,6 +251,7 @@ class PostDetailView(DetailView):
     """Display a post and associated comment threads"""
 
     model = Post
+    queryset = Post.objects.select_related('user', 'channel')
 
     def get(self, request, *args, **kwargs):
         channel = Channel.objects.get(pk=self.kwargs['channel_id'])
@@ -200,12 +261,18 @@ class PostDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        comments = Comment.objects.filter(post=self.object)
-        for comment in comments:
-            print(comment.parent)
-        context['comments'] = Comment.objects.filter(post=self.object)
+        sort = get_sort(self.request.GET.get('sort'))
+        page, comments = load_comment_page(self.object,
+                                           self.request.GET.get('page'), sort)
+        annotate_vote_states([self.object], self.request.user)
+        context['comments'] = annotate_vote_states(comments,
+                                                   self.request.user)
+        context['page_obj'] = page
+        context['sort'] = sort
+        context['sorts'] = SORTS
         context['post_id'] = self.kwargs['pk']
         context['form'] = CommentForm()
+        context['reply_form'] = CommentForm(auto_id=False)
         return context
 
 
@@ -230,7 +297,8 @@ class PostDetailFormView(SingleObjectMixin, FormView):
         user = User.objects.get(pk=self.request.user.pk)
         comment = Comment(text=text,
                           user=user, post=self.object)
-        comment.save()
+        get_comment_tree().insert(comment)
+        comment_cache.invalidate_thread(self.object.pk)
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -253,18 +321,60 @@ class PostView(View):
         return view(request, *args, **kwargs)
 
 
+class CommentThreadView(DetailView):
+    """Display a comment and the replies under it.
+    Serves the "continue this thread" and "load more replies" links
+    """
+
+    model = Comment
+    context_object_name = 'comment'
+    template_name = 'seenit/comment_thread.html'
+
+    def get_queryset(self):
+        comments = Comment.objects.filter(
+            post_id=self.kwargs['post_id'],
+            post__channel_id=self.kwargs['channel_id']
+        ).select_related('user')
+        return annotate_sort(comments, get_sort(self.request.GET.get('sort')))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        post = Post.objects.select_related('user', 'channel').get(
+            pk=self.object.post_id)
+        try:
+            after = get_comment_tree().parse_position(
+                self.request.GET['after'])
+        except (KeyError, ValueError):
+            after = None
+        sort = get_sort(self.request.GET.get('sort'))
+        comments = load_comment_subtree(post, self.object, after, sort)
+        annotate_vote_states([post], self.request.user)
+        context['post'] = post
+        context['sort'] = sort
+        context['comments'] = annotate_vote_states(comments,
+                                                   self.request.user)
+        context['reply_form'] = CommentForm(auto_id=False)
+        return context
+
+
 @login_required
 def handle_reply(request, *args, **kwargs):
     """Handle reply to a comment.
-    Create reply and add to db
+    Create reply and add to db; the parent and post are fetched together,
+    under the comment tree's lock. A reply the comment tree rejects is
+    reported on the post page
     """
 
-    text = request.POST.get('text')
-    user = User.objects.get(pk=request.user.pk)
-    post = Post.objects.get(pk=kwargs['post_id'])
-    parent = Comment.objects.get(pk=kwargs['pk'])
-    reply = Comment(text=text, user=user, post=post, parent=parent)
-    reply.save()
+    reply = Comment(text=request.POST.get('text'), user=request.user,
+                    post_id=kwargs['post_id'], parent_id=kwargs['pk'])
+    try:
+        get_comment_tree().insert(reply)
+    except Comment.DoesNotExist:
+        return HttpResponseNotFound()
+    except ValidationError as error:
+        messages.error(request, error.message)
+    else:
+        comment_cache.invalidate_comment(reply)
 
     return HttpResponseRedirect(
         reverse("seenit:post_detail",
@@ -285,12 +395,17 @@ def upvote(request, **kwargs):
         type = kwargs['post_type']
 
         if type == "post":
-            post = Post.objects.get(pk=id)
-            post.upvote(request.user)
-
+            model = Post
         elif type == "comment":
-            comment = Comment.objects.get(pk=id)
-            comment.upvote(request.user)
+            model = Comment
+        else:
+            return HttpResponseNotFound()
+
+        if vote_buffer.enabled:
+            vote_buffer.upvote(model, id, request.user)
+        else:
+            item = get_object_or_404(model, pk=id)
+            item.upvote(request.user)
 
         return HttpResponseRedirect(request.META['HTTP_REFERER'])
     return HttpResponseForbidden()
@@ -307,12 +422,17 @@ def downvote(request, **kwargs):
         type = kwargs['post_type']
 
         if type == "post":
-            post = Post.objects.get(pk=id)
-            post.downvote(request.user)
-
+            model = Post
         elif type == "comment":
-            comment = Comment.objects.get(pk=id)
-            comment.downvote(request.user)
+            model = Comment
+        else:
+            return HttpResponseNotFound()
+
+        if vote_buffer.enabled:
+            vote_buffer.downvote(model, id, request.user)
+        else:
+            item = get_object_or_404(model, pk=id)
+            item.downvote(request.user)
 
         return HttpResponseRedirect(request.META['HTTP_REFERER'])
     return HttpResponseForbidden()
@@ -0,0 +1,217 @@
+import atexit
+import logging
+import os
+import signal
+import threading
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from . import comment_cache
+from .models import Comment
+from .votes import rating_updates
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    """Collect votes in memory and write them to the db in batches.
+
+    Votes are applied with the same rules as seenit.votes: a vote against
+    an existing opposite vote cancels it, and a repeat vote is a no-op.
+    Every flush collapses the pending votes per (item, user), then writes
+    the vote rows with bulk deletes/inserts and every rating change for a
+    model with one UPDATE.
+    """
+
+    def __init__(self):
+        self._pending = []
+        # Reentrant, so the SIGTERM handler can flush while the thread it
+        # interrupted holds the lock.
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._worker = None
+
+    @property
+    def enabled(self):
+        """True if votes should be buffered instead of written directly."""
+
+        return getattr(settings, 'SEENIT_VOTE_BUFFER', False)
+
+    def add(self, model, pk, user, step):
+        """Queue a vote of step (1 or -1) by user on the model row pk."""
+
+        with self._lock:
+            self._pending.append((model, pk, user.pk, step))
+        self.start()
+
+    def upvote(self, model, pk, user):
+        """Queue an upvote by user on the model row pk."""
+
+        self.add(model, pk, user, 1)
+
+    def downvote(self, model, pk, user):
+        """Queue a downvote by user on the model row pk."""
+
+        self.add(model, pk, user, -1)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        """Start the background flush worker if it is not running."""
+
+        interval = getattr(settings, 'SEENIT_VOTE_FLUSH_INTERVAL', 2.0)
+        if not interval or self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._stopped.clear()
+            self._worker = threading.Thread(
+                target=self._run, args=(interval,),
+                name='seenit-vote-flush', daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        """Stop the worker and write out everything still pending."""
+
+        worker, self._worker = self._worker, None
+        if worker is not None:
+            self._stopped.set()
+            worker.join()
+        self.flush()
+
+    def flush_on_sigterm(self):
+        """Write out everything pending when the process gets SIGTERM, then
+        hand the signal to whatever handled it before (by default, ending
+        the process). Does nothing outside the main thread, which alone can
+        handle signals.
+        """
+
+        if threading.current_thread() is not threading.main_thread():
+            return
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def handle(signum, frame):
+            try:
+                self.stop()
+            except Exception:
+                logger.exception("Vote flush on SIGTERM failed")
+            if callable(previous):
+                previous(signum, frame)
+            elif previous != signal.SIG_IGN:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+
+        signal.signal(signal.SIGTERM, handle)
+
+    def _run(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Vote flush failed; retrying next interval")
+            finally:
+                connections.close_all()
+
+    def flush(self):
+        """Write all pending votes to the db.
+        Return the number of votes flushed.
+        If the write fails, the votes are put back in front of the queue.
+        """
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+
+        by_model = defaultdict(list)
+        for model, pk, user_id, step in pending:
+            by_model[model].append((pk, user_id, step))
+
+        try:
+            with transaction.atomic():
+                for model, votes in by_model.items():
+                    changed = _apply_votes(model, votes)
+                    if model is Comment and changed:
+                        comment_cache.invalidate_comments(model, changed)
+        except Exception:
+            with self._lock:
+                self._pending[:0] = pending
+            raise
+        return len(pending)
+
+
+def _apply_votes(model, votes):
+    """Apply a list of (pk, user_id, step) votes to model in bulk.
+    Return the pks whose rating changed.
+    """
+
+    batch_size = getattr(settings, 'SEENIT_VOTE_FLUSH_BATCH_SIZE', 1000)
+    up = model.up_votes
+    down = model.down_votes
+    item_field = up.field.m2m_field_name()
+    user_field = up.field.m2m_reverse_field_name()
+
+    # Lock the voters' rows in pk order. Direct votes lock the voter's row
+    # too, so a flush and a direct vote by the same user are serialized.
+    user_ids = set(get_user_model().objects.select_for_update()
+                   .filter(pk__in={user_id for _, user_id, _ in votes})
+                   .order_by('pk').values_list('pk', flat=True))
+    item_ids = set(model._default_manager
+                   .filter(pk__in={pk for pk, _, _ in votes})
+                   .order_by().values_list('pk', flat=True))
+
+    current = {}
+    for through, state in ((up.through, 1), (down.through, -1)):
+        rows = through.objects.filter(**{
+            f'{item_field}_id__in': item_ids,
+            f'{user_field}_id__in': user_ids,
+        }).values_list(f'{item_field}_id', f'{user_field}_id')
+        for key in rows:
+            current[key] = state
+
+    final = dict(current)
+    deltas = defaultdict(int)
+    for pk, user_id, step in votes:
+        key = (pk, user_id)
+        if pk not in item_ids or user_id not in user_ids:
+            continue
+        state = final.get(key, 0)
+        if state == step:
+            continue
+        final[key] = 0 if state == -step else step
+        deltas[pk] += step
+
+    changed = [key for key, state in final.items()
+               if state != current.get(key, 0)]
+    for through, state in ((up.through, 1), (down.through, -1)):
+        removed = [key for key in changed if current.get(key) == state]
+        for start in range(0, len(removed), batch_size):
+            through.objects.filter(reduce(or_, (
+                Q(**{f'{item_field}_id': pk, f'{user_field}_id': user_id})
+                for pk, user_id in removed[start:start + batch_size]
+            ))).delete()
+        through.objects.bulk_create(
+            [through(**{f'{item_field}_id': pk, f'{user_field}_id': user_id})
+             for pk, user_id in changed if final[(pk, user_id)] == state],
+            batch_size=batch_size)
+
+    deltas = [(pk, delta) for pk, delta in deltas.items() if delta]
+    for start in range(0, len(deltas), batch_size):
+        batch = deltas[start:start + batch_size]
+        model._default_manager.filter(pk__in=[pk for pk, _ in batch]).update(
+            **rating_updates(model, F('rating') + Case(
+                *[When(pk=pk, then=Value(delta)) for pk, delta in batch],
+                default=Value(0), output_field=IntegerField())))
+    return [pk for pk, _ in deltas]
+
+
+vote_buffer = VoteBuffer()
+atexit.register(vote_buffer.stop)
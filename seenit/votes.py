@@ -0,0 +1,161 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (Case, Count, F, FloatField, OuterRef, Subquery,
+                              Value, When)
+from django.db.models.functions import Cast, Coalesce, Greatest, Least, Power
+
+from .ranking import hot_expression, hot_score
+
+
+def upvote(item, user):
+    """Handle upvote for a post or comment.
+    If user has already downvoted, remove user from down_votes.
+    Otherwise, add user to up_votes (a repeat upvote is a no-op).
+    Return the change applied to the rating.
+    """
+
+    return _cast_vote(item, user, item.up_votes, item.down_votes, 1)
+
+
+def downvote(item, user):
+    """Handle downvote for a post or comment.
+    If user has already upvoted, remove user from up_votes.
+    Otherwise, add user to down_votes (a repeat downvote is a no-op).
+    Return the change applied to the rating.
+    """
+
+    return _cast_vote(item, user, item.down_votes, item.up_votes, -1)
+
+
+def vote_states(model, ids, user):
+    """Return {id: 1 or -1} for the posts or comments in ids that user has
+    upvoted or downvoted. Uses one query per vote table.
+    """
+
+    states = {}
+    if not ids or not user.is_authenticated:
+        return states
+
+    for votes, state in ((model.up_votes, 1), (model.down_votes, -1)):
+        item_field = votes.field.m2m_field_name()
+        user_field = votes.field.m2m_reverse_field_name()
+        voted = votes.through.objects.filter(**{
+            f'{item_field}_id__in': ids,
+            f'{user_field}_id': user.pk,
+        }).values_list(f'{item_field}_id', flat=True)
+        states.update(dict.fromkeys(voted, state))
+    return states
+
+
+def vote_count(votes):
+    """Return an expression counting the rows of an up_votes/down_votes
+    table for the outer post or comment.
+    """
+
+    return row_count(votes.through.objects, votes.field.m2m_field_name())
+
+
+def row_count(manager, field):
+    """Return an expression counting the rows of manager whose field is
+    the outer row.
+    """
+
+    return Coalesce(Subquery(
+        manager
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('*'))
+        .values('count')
+    ), 0)
+
+
+def annotate_controversy(queryset):
+    """Annotate a queryset of posts or comments with controversy: the
+    total number of votes raised to the power of the smaller side over the
+    larger one, so many evenly split votes score highest. Items without
+    both up and down votes score 0.
+    """
+
+    model = queryset.model
+    ups, downs = F('up_count'), F('down_count')
+    return queryset.annotate(
+        up_count=vote_count(model.up_votes),
+        down_count=vote_count(model.down_votes),
+    ).annotate(controversy=Case(
+        When(up_count__gt=0, down_count__gt=0, then=Power(
+            ups + downs,
+            Cast(Least(ups, downs), FloatField()) / Greatest(ups, downs))),
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
+
+
+def annotate_vote_states(items, user):
+    """Set user_vote (1, -1 or 0) on each post or comment in items.
+    items must all be of the same model.
+    Return items as a list.
+    """
+
+    items = list(items)
+    if items:
+        states = vote_states(type(items[0]), [item.pk for item in items],
+                             user)
+        for item in items:
+            item.user_vote = states.get(item.pk, 0)
+    return items
+
+
+def _cast_vote(item, user, votes, opposite_votes, step):
+    """Apply a vote inside one transaction.
+
+    The voter's row is locked so that concurrent votes by the same user on
+    the same item are serialized; votes by different users never block on
+    each other. The rating is changed with a single UPDATE using an F()
+    expression, so concurrent votes cannot overwrite each other.
+    """
+
+    with transaction.atomic():
+        list(get_user_model().objects.select_for_update()
+             .filter(pk=user.pk).values_list('pk', flat=True))
+
+        if _vote_rows(opposite_votes, item, user).delete()[0]:
+            delta = step
+        elif _vote_rows(votes, item, user).exists():
+            delta = 0
+        else:
+            votes.through.objects.create(**{
+                f'{votes.source_field_name}_id': item.pk,
+                f'{votes.target_field_name}_id': user.pk,
+            })
+            delta = step
+
+        if delta:
+            type(item)._default_manager.filter(pk=item.pk).update(
+                **rating_updates(type(item), F('rating') + delta))
+
+    item.rating += delta
+    if delta and hasattr(item, 'hot_score'):
+        item.hot_score = hot_score(item.rating, item.pub_date)
+    return delta
+
+
+def rating_updates(model, rating):
+    """Return the values for an UPDATE setting the rating of model's rows
+    to the expression rating. Posts also get their hot score recomputed
+    from the new rating (see seenit.ranking).
+    """
+
+    updates = {'rating': rating}
+    if hasattr(model, 'hot_score'):
+        updates['hot_score'] = hot_expression(rating)
+    return updates
+
+
+def _vote_rows(votes, item, user):
+    """Return the through-table rows for user's vote on item."""
+
+    return votes.through.objects.filter(**{
+        f'{votes.source_field_name}_id': item.pk,
+        f'{votes.target_field_name}_id': user.pk,
+    })
@@ -50,11 +50,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'seenit.instrumentation.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'seenit.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -82,19 +84,58 @@ WSGI_APPLICATION = 'seenit_project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before
+# reuse if DB_CONN_HEALTH_CHECKS is on. With DB_POOL_MAX_SIZE above 0 they
+# come from a pool of DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE connections
+# shared by all threads instead, waiting up to DB_POOL_TIMEOUT seconds for
+# a free one (see seenit/backends/postgresql)
+
+DB_POOL_MAX_SIZE = env.int('DB_POOL_MAX_SIZE', default=0)
+
+DB_POOL = {
+    'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+    'max_size': DB_POOL_MAX_SIZE,
+    'timeout': env.float('DB_POOL_TIMEOUT', default=30.0),
+} if DB_POOL_MAX_SIZE else None
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'seenit.backends.postgresql',
         'NAME': env('DB_NAME'),
         'USER': env('DB_USER'),
         'PASSWORD': env('DB_PASSWORD'),
         'HOST': env('DB_HOST'),
         'PORT': env('DB_PORT'),
+        'CONN_MAX_AGE': 0 if DB_POOL else env.int('DB_CONN_MAX_AGE',
+                                                  default=60),
+        'CONN_HEALTH_CHECKS': env.bool('DB_CONN_HEALTH_CHECKS',
+                                       default=True),
+        'OPTIONS': {'pool': DB_POOL} if DB_POOL else {},
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Set CACHE_URL (e.g. redis://127.0.0.1:6379/1) to share the cache between
+# processes. Comment fragments have their own alias (SEENIT_COMMENT_CACHE),
+# which can stay in each process, or be shared with COMMENT_CACHE_URL; the
+# versions they are keyed on (SEENIT_COMMENT_VERSION_CACHE) follow
+# CACHE_URL, so every process sees an invalidation, and are kept apart so
+# fragments can't evict them. Local memory caches hold 300 entries unless
+# given max_entries, fewer than the fragments of one page of comments
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+    'comments': env.cache(
+        'COMMENT_CACHE_URL',
+        default='locmemcache://seenit-comments?max_entries=10000'),
+    'comment_versions': env.cache(
+        'CACHE_URL',
+        default='locmemcache://seenit-comment-versions?max_entries=100000'),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -142,6 +183,106 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "tailwind"
 
 CRISPY_TEMPLATE_PACK = "tailwind"
 
+# Votes
+# When SEENIT_VOTE_BUFFER is on, votes are queued in memory and written in
+# batches every SEENIT_VOTE_FLUSH_INTERVAL seconds (see seenit/vote_buffer.py).
+# Pending votes are written when the process exits or gets SIGTERM; a
+# process killed any other way (SIGKILL, a crash) loses the votes of up to
+# the last SEENIT_VOTE_FLUSH_INTERVAL seconds
+
+SEENIT_VOTE_BUFFER = env.bool('SEENIT_VOTE_BUFFER', default=False)
+
+SEENIT_VOTE_FLUSH_INTERVAL = env.float('SEENIT_VOTE_FLUSH_INTERVAL',
+                                       default=2.0)
+
+SEENIT_VOTE_FLUSH_BATCH_SIZE = env.int('SEENIT_VOTE_FLUSH_BATCH_SIZE',
+                                       default=1000)
+
+# Feeds
+# Channel pages list SEENIT_POSTS_PER_PAGE posts per page, and the channel
+# directory SEENIT_CHANNELS_PER_PAGE channels
+
+SEENIT_POSTS_PER_PAGE = env.int('SEENIT_POSTS_PER_PAGE', default=25)
+
+SEENIT_CHANNELS_PER_PAGE = env.int('SEENIT_CHANNELS_PER_PAGE', default=50)
+
+# Home timelines hold each user's newest SEENIT_TIMELINE_LENGTH posts; new
+# posts are written to subscribers' timelines SEENIT_TIMELINE_BATCH_SIZE at
+# a time, except in channels with more than SEENIT_TIMELINE_FANOUT_LIMIT
+# subscribers, which are read when the timeline is (see seenit/timelines.py)
+
+SEENIT_TIMELINE_LENGTH = env.int('SEENIT_TIMELINE_LENGTH', default=500)
+
+SEENIT_TIMELINE_BATCH_SIZE = env.int('SEENIT_TIMELINE_BATCH_SIZE',
+                                     default=1000)
+
+SEENIT_TIMELINE_FANOUT_LIMIT = env.int('SEENIT_TIMELINE_FANOUT_LIMIT',
+                                       default=10000)
+
+# Subscriptions
+# Each user's subscribed channel ids are cached for
+# SEENIT_SUBSCRIPTION_CACHE_TIMEOUT seconds, and replaced whenever their
+# subscriptions change (see seenit/subscriptions.py). With a per-process
+# cache, like the locmem default, other processes see a change only once
+# their copy expires; set CACHE_URL to see it at once
+
+SEENIT_SUBSCRIPTION_CACHE_TIMEOUT = env.int(
+    'SEENIT_SUBSCRIPTION_CACHE_TIMEOUT', default=60)
+
+# Comment threads
+# Post pages show SEENIT_ROOT_COMMENTS_PER_PAGE root comments per page,
+# SEENIT_COMMENT_DEPTH levels deep, and at most SEENIT_COMMENT_REPLY_LIMIT
+# replies; the rest is linked to "continue this thread"/"load more replies"
+
+SEENIT_ROOT_COMMENTS_PER_PAGE = env.int('SEENIT_ROOT_COMMENTS_PER_PAGE',
+                                        default=20)
+
+SEENIT_COMMENT_DEPTH = env.int('SEENIT_COMMENT_DEPTH', default=6)
+
+SEENIT_COMMENT_REPLY_LIMIT = env.int('SEENIT_COMMENT_REPLY_LIMIT',
+                                     default=500)
+
+SEENIT_COMMENT_CACHE = 'comments'
+
+SEENIT_COMMENT_VERSION_CACHE = 'comment_versions'
+
+# How comment trees are stored: "mptt" (nested sets) or "path" (materialized
+# paths). Run "manage.py rebuild_comment_tree <name>" before switching.
+SEENIT_COMMENT_TREE = env('SEENIT_COMMENT_TREE', default='mptt')
+
+# Comment fragments expire after SEENIT_COMMENT_CACHE_TIMEOUT seconds, the
+# versions they are keyed on after twice that
+SEENIT_COMMENT_CACHE_TIMEOUT = env.int('SEENIT_COMMENT_CACHE_TIMEOUT',
+                                       default=600)
+
+# Instrumentation
+# When SEENIT_INSTRUMENTATION is on, each request's query count and db,
+# template and view time are sent in a Server-Timing header and logged to
+# seenit.instrumentation, as warnings past SEENIT_QUERY_BUDGET queries or
+# SEENIT_LATENCY_BUDGET_MS milliseconds (0 for no budget; see
+# seenit/instrumentation.py)
+
+SEENIT_INSTRUMENTATION = env.bool('SEENIT_INSTRUMENTATION', default=False)
+
+SEENIT_QUERY_BUDGET = env.int('SEENIT_QUERY_BUDGET', default=0)
+
+SEENIT_LATENCY_BUDGET_MS = env.float('SEENIT_LATENCY_BUDGET_MS', default=0)
+
+# Also time each template and include (render count and cumulative time)
+
+SEENIT_TEMPLATE_BREAKDOWN = env.bool('SEENIT_TEMPLATE_BREAKDOWN',
+                                     default=False)
+
+# Profiling
+# When SEENIT_PROFILER is on, staff can profile a request by sending an
+# X-Seenit-Profile header or a "profile" query parameter; profiles are
+# written to SEENIT_PROFILE_DIR ("manage.py show_profiles" lists them)
+
+SEENIT_PROFILER = env.bool('SEENIT_PROFILER', default=False)
+
+SEENIT_PROFILE_DIR = env('SEENIT_PROFILE_DIR',
+                         default=str(BASE_DIR / 'profiles'))
+
 # Redirect to home page after login
 LOGIN_REDIRECT_URL = 'seenit:home'
 